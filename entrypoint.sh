@@ -1,5 +1,6 @@
 #!/bin/sh
 
 python manage.py migrate
-python manage.py loaddata data/polls-v4.json data/votes-v4.json data/users.json
-python manage.py runserver 0.0.0.0:8000
\ No newline at end of file
+python manage.py load_polls data/polls-v4.json data/votes-v4.json data/users.json
+# gunicorn replaces this shell, so it receives the container's SIGTERM
+exec python manage.py serve --bind 0.0.0.0:8000
\ No newline at end of file
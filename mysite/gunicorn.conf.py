@@ -0,0 +1,79 @@
+"""
+Gunicorn configuration for running mysite in production.
+
+Started by `python manage.py serve`, which picks the WSGI application or,
+with --asgi, the ASGI application on uvicorn workers. Every value can be
+overridden from the environment or .env. Module-level names are read as
+gunicorn settings, hence decouple.config rather than config.
+
+The application is loaded once in the master before forking (preload),
+so workers share its memory pages. SIGHUP reloads the workers and
+SIGTERM stops them gracefully: a worker finishes its in-flight requests
+(up to GUNICORN_GRACEFUL_TIMEOUT seconds) and writes any buffered votes
+before it exits.
+"""
+import os
+
+import decouple
+
+
+def available_cpus():
+    """Return the number of CPUs this process may run on."""
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+asgi = decouple.config('GUNICORN_ASGI', default=False, cast=bool)
+
+bind = decouple.config('GUNICORN_BIND', default='0.0.0.0:8000')
+# Sync workers block on the database, so run more of them than there are
+# CPUs; an ASGI worker overlaps its requests itself.
+workers = decouple.config('WEB_CONCURRENCY', cast=int,
+                          default=available_cpus() * (1 if asgi else 2) + 1)
+worker_class = 'uvicorn_worker.UvicornWorker' if asgi else 'sync'
+preload_app = True
+
+timeout = decouple.config('GUNICORN_TIMEOUT', default=30, cast=int)
+graceful_timeout = decouple.config('GUNICORN_GRACEFUL_TIMEOUT', default=30,
+                                   cast=int)
+keepalive = decouple.config('GUNICORN_KEEPALIVE', default=5, cast=int)
+# Recycle workers now and then so slow leaks cannot build up; the jitter
+# keeps them from all restarting at once.
+max_requests = decouple.config('GUNICORN_MAX_REQUESTS', default=10000,
+                               cast=int)
+max_requests_jitter = max_requests // 10
+
+accesslog = decouple.config('GUNICORN_ACCESS_LOG', default=None)
+errorlog = '-'
+loglevel = decouple.config('GUNICORN_LOG_LEVEL', default='info')
+# Keep worker heartbeat files off the container's overlay filesystem.
+worker_tmp_dir = '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+
+def on_starting(server):
+    """Remove the metrics files of the workers of an earlier run."""
+    from django.conf import settings
+    from polls.metrics import clear_directory
+
+    if settings.POLLS_METRICS_DIR:
+        clear_directory(settings.POLLS_METRICS_DIR)
+
+
+def pre_fork(server, worker):
+    """Close the master's connections and pools so no worker shares one."""
+    from django.db import connections
+    for connection in connections.all(initialized_only=True):
+        connection.close()
+        if hasattr(connection, 'close_pool'):
+            connection.close_pool()
+
+
+def worker_exit(server, worker):
+    """Write the votes still in the worker's vote buffer before it exits."""
+    from django.conf import settings
+    from polls.buffer import started_vote_buffer
+
+    vote_buffer = started_vote_buffer()
+    if vote_buffer is not None:
+        vote_buffer.stop(flush=settings.POLLS_VOTE_BUFFER_FLUSH_ON_SHUTDOWN)
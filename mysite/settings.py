@@ -10,8 +10,10 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import copy
 from pathlib import Path
 from decouple import config, Csv
+from django.core.exceptions import ImproperlyConfigured
 
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -41,11 +43,15 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'polls.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'polls.middleware.QueryInstrumentationMiddleware',
+    'polls.middleware.ReplicaRoutingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
+    'polls.middleware.RateLimitMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'polls.middleware.CachedUserMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -77,21 +83,203 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'mysite.wsgi.application'
 
+# Use the async poll views (polls/async_views.py); for ASGI deployments.
+POLLS_ASYNC_VIEWS = config('POLLS_ASYNC_VIEWS', default=False, cast=bool)
+
 
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
-DATABASES = {
+DATABASE_ENGINE = config('DATABASE_ENGINE', default='sqlite3')
+
+if DATABASE_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': config('DATABASE_NAME', default='pollsdb'),
+            'USER': config('DATABASE_USER', default='pollsapp'),
+            'PASSWORD': config('DATABASE_PASSWORD', default='password'),
+            'HOST': config('DATABASE_HOST', default='localhost'),
+            'PORT': config('DATABASE_PORT', default='5432'),
+            'CONN_MAX_AGE': config('DATABASE_CONN_MAX_AGE', default=0,
+                                   cast=int),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {},
+        }
+    }
+    # Each worker process keeps a psycopg pool of DATABASE_POOL_MIN_SIZE
+    # to DATABASE_POOL_MAX_SIZE connections, checked before being handed
+    # out. Pooled connections are not persistent, so CONN_MAX_AGE is 0.
+    if config('DATABASE_POOL', default=True, cast=bool):
+        from psycopg_pool import ConnectionPool
+
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': config('DATABASE_POOL_MIN_SIZE', default=2, cast=int),
+            'max_size': config('DATABASE_POOL_MAX_SIZE', default=10, cast=int),
+            'timeout': config('DATABASE_POOL_TIMEOUT', default=10.0,
+                              cast=float),
+            'max_idle': config('DATABASE_POOL_MAX_IDLE', default=600.0,
+                               cast=float),
+            'check': ConnectionPool.check_connection,
+        }
+elif DATABASE_ENGINE == 'sqlite3':
+    # WAL lets readers run alongside the one writer, NORMAL sync only
+    # fsyncs at checkpoints, and IMMEDIATE transactions take the write
+    # lock up front, so a voter waits up to SQLITE_BUSY_TIMEOUT seconds
+    # for it instead of failing when upgrading a read lock.
+    SQLITE_MMAP_SIZE = config('SQLITE_MMAP_SIZE', default=128 * 1024 * 1024,
+                              cast=int)
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': config('SQLITE_PATH', default=BASE_DIR / 'db.sqlite3'),
+            'CONN_MAX_AGE': config('DATABASE_CONN_MAX_AGE', default=60,
+                                   cast=int),
+            'OPTIONS': {
+                'timeout': config('SQLITE_BUSY_TIMEOUT', default=20.0,
+                                  cast=float),
+                'transaction_mode': 'IMMEDIATE',
+                'init_command': (
+                    'PRAGMA journal_mode=WAL;'
+                    'PRAGMA synchronous=NORMAL;'
+                    f'PRAGMA mmap_size={SQLITE_MMAP_SIZE};'
+                ),
+            },
+        }
+    }
+else:
+    raise ImproperlyConfigured(f"DATABASE_ENGINE must be 'sqlite3' or "
+                               f"'postgresql', not {DATABASE_ENGINE!r}.")
+
+# Read replicas: SQLite file paths, or PostgreSQL hosts sharing the
+# primary's other settings. The read-only views in POLLS_REPLICA_VIEWS
+# read from them (polls.routers); after a vote or other write a browser
+# reads from the primary for POLLS_PRIMARY_STICKY_SECONDS.
+DATABASE_REPLICAS = config('DATABASE_REPLICAS', default='', cast=Csv())
+POLLS_READ_REPLICAS = []
+for number, location in enumerate(DATABASE_REPLICAS, 1):
+    replica = copy.deepcopy(DATABASES['default'])
+    replica['NAME' if DATABASE_ENGINE == 'sqlite3' else 'HOST'] = location
+    replica['TEST'] = {'MIRROR': 'default'}
+    DATABASES[f'replica{number}'] = replica
+    POLLS_READ_REPLICAS.append(f'replica{number}')
+
+DATABASE_ROUTERS = ['polls.routers.PrimaryReplicaRouter']
+POLLS_REPLICA_VIEWS = [
+    'polls:index',
+    'polls:results',
+    'polls:results_stream',
+    'polls:results_api',
+    'polls:export_votes',
+]
+POLLS_PRIMARY_STICKY_SECONDS = config('POLLS_PRIMARY_STICKY_SECONDS',
+                                      default=10, cast=int)
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-        "USER": config("DATABASE_USER", default="pollsapp"),
-        "PASSWORD": config("DATABASE_PASSWORD", default="password"),
-        "HOST": config("DATABASE_HOST", default="localhost"),
-        "PORT": config("DATABASE_PORT", default="5432")
+        'BACKEND': config('CACHE_BACKEND',
+                          default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='ku-polls'),
     }
 }
 
+# Poll results snapshots: entries kept in the in-process LRU, seconds an
+# LRU entry lives, and seconds a snapshot is kept in the cache above.
+POLLS_RESULTS_CACHE_SIZE = config('POLLS_RESULTS_CACHE_SIZE', default=256, cast=int)
+POLLS_RESULTS_CACHE_TTL = config('POLLS_RESULTS_CACHE_TTL', default=5, cast=float)
+POLLS_RESULTS_CACHE_TIMEOUT = config('POLLS_RESULTS_CACHE_TIMEOUT', default=300, cast=int)
+
+# Live results stream: minimum seconds between two updates of a stream,
+# and seconds between checks for votes cast in other worker processes.
+POLLS_RESULTS_STREAM_INTERVAL = config('POLLS_RESULTS_STREAM_INTERVAL', default=1.0, cast=float)
+POLLS_RESULTS_STREAM_POLL = config('POLLS_RESULTS_STREAM_POLL', default=15.0, cast=float)
+
+# Most questions the JSON results API returns in one request.
+POLLS_API_MAX_BATCH = config('POLLS_API_MAX_BATCH', default=100, cast=int)
+
+# Votes fetched from the database at a time by the vote export.
+POLLS_EXPORT_CHUNK_SIZE = config('POLLS_EXPORT_CHUNK_SIZE', default=2000,
+                                 cast=int)
+
+# Per-request SQL instrumentation (polls.middleware). Requests with more
+# queries, more executions of one statement, or more database time than
+# these are logged as warnings with their slowest statements.
+POLLS_SQL_INSTRUMENTATION = config('POLLS_SQL_INSTRUMENTATION', default=True,
+                                   cast=bool)
+POLLS_SQL_SERVER_TIMING = config('POLLS_SQL_SERVER_TIMING', default=True,
+                                 cast=bool)
+POLLS_SQL_MAX_QUERIES = config('POLLS_SQL_MAX_QUERIES', default=20, cast=int)
+POLLS_SQL_MAX_REPEATED = config('POLLS_SQL_MAX_REPEATED', default=5,
+                                cast=int)
+POLLS_SQL_MAX_DB_MS = config('POLLS_SQL_MAX_DB_MS', default=200.0,
+                             cast=float)
+POLLS_SQL_LOG_SLOWEST = config('POLLS_SQL_LOG_SLOWEST', default=3, cast=int)
+
+# Directory where each worker process keeps its /metrics counters, so the
+# endpoint reports the sum over all workers. Empty keeps them in memory.
+POLLS_METRICS_DIR = config('POLLS_METRICS_DIR', default='')
+
+# Whole index and results pages are cached for visitors without a session
+# (polls.pagecache) for at most this many seconds.
+POLLS_PAGE_CACHE = config('POLLS_PAGE_CACHE', default=True, cast=bool)
+POLLS_PAGE_CACHE_TIMEOUT = config('POLLS_PAGE_CACHE_TIMEOUT', default=300,
+                                  cast=int)
+
+# How vote() writes votes: 'sync' writes each vote in its own request,
+# 'buffered' queues it for a background thread that writes in batches.
+POLLS_VOTE_WRITE_MODE = config('POLLS_VOTE_WRITE_MODE', default='sync')
+# Buffered mode: queue capacity, flush period and early-flush batch size,
+# the longest a vote may wait before new votes are refused, what to do
+# when refusing ('sync' writes the vote in the request, 'reject' asks the
+# voter to retry), whether to write queued votes on shutdown, and the
+# failed writes after which a vote is dropped.
+POLLS_VOTE_BUFFER_SIZE = config('POLLS_VOTE_BUFFER_SIZE', default=10000, cast=int)
+POLLS_VOTE_BUFFER_FLUSH_MS = config('POLLS_VOTE_BUFFER_FLUSH_MS', default=200, cast=int)
+POLLS_VOTE_BUFFER_BATCH = config('POLLS_VOTE_BUFFER_BATCH', default=500, cast=int)
+POLLS_VOTE_BUFFER_MAX_LAG_MS = config('POLLS_VOTE_BUFFER_MAX_LAG_MS', default=2000, cast=int)
+POLLS_VOTE_BUFFER_WHEN_FULL = config('POLLS_VOTE_BUFFER_WHEN_FULL', default='sync')
+POLLS_VOTE_BUFFER_FLUSH_ON_SHUTDOWN = config('POLLS_VOTE_BUFFER_FLUSH_ON_SHUTDOWN',
+                                             default=True, cast=bool)
+POLLS_VOTE_BUFFER_MAX_ATTEMPTS = config('POLLS_VOTE_BUFFER_MAX_ATTEMPTS', default=5, cast=int)
+
+# Spread each choice's tally over this many counter rows (0 keeps one
+# counter, Choice.votes), so concurrent votes for a popular choice do not
+# all wait on the same row lock. Fold the shards back into Choice.votes
+# now and then with the compact_vote_counters command.
+POLLS_VOTE_COUNTER_SHARDS = config('POLLS_VOTE_COUNTER_SHARDS', default=0,
+                                   cast=int)
+
+# Token-bucket rate limits of POSTs to these views, per client IP and per
+# user (polls.ratelimit): 'rate' refills a token, up to 'burst' tokens.
+# Buckets are kept per process ('local') or in the cache ('cache'), which
+# the workers share when it is a cache server.
+POLLS_RATE_LIMIT_BACKEND = config('POLLS_RATE_LIMIT_BACKEND', default='local')
+# Reverse proxies in front of the app that append to X-Forwarded-For; the
+# IP limited is the one the outermost of them saw (0 uses REMOTE_ADDR).
+POLLS_TRUSTED_PROXY_COUNT = config('POLLS_TRUSTED_PROXY_COUNT', default=0,
+                                   cast=int)
+POLLS_RATE_LIMITS = {
+    'polls:vote': {
+        'rate': config('POLLS_VOTE_RATE_LIMIT', default='30/m'),
+        'burst': config('POLLS_VOTE_RATE_BURST', default=10, cast=int),
+    },
+    'login': {
+        'rate': config('POLLS_LOGIN_RATE_LIMIT', default='10/m'),
+        'burst': config('POLLS_LOGIN_RATE_BURST', default=5, cast=int),
+    },
+} if config('POLLS_RATE_LIMIT', default=True, cast=bool) else {}
+
+# Keep the logged-in user in the cache above for this many seconds
+# (polls.usercache), so requests with a session skip the user query.
+POLLS_USER_CACHE = config('POLLS_USER_CACHE', default=False, cast=bool)
+POLLS_USER_CACHE_TIMEOUT = config('POLLS_USER_CACHE_TIMEOUT', default=300,
+                                  cast=int)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -128,12 +316,44 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/5.1/howto/static-files/
 
 STATIC_URL = 'static/'
+STATIC_ROOT = config('STATIC_ROOT', default=BASE_DIR / 'staticfiles')
+
+# collectstatic writes content-hashed copies of the assets plus gzip and
+# brotli variants of those of at least POLLS_STATIC_COMPRESS_MIN_SIZE
+# bytes (polls.assets). POLLS_SERVE_STATIC serves STATIC_ROOT from the
+# app itself, with far-future caching of the hashed names.
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': config('STATICFILES_STORAGE',
+                          default='polls.assets.CompressedManifestStaticFilesStorage'),
+    },
+}
+POLLS_STATIC_COMPRESS_MIN_SIZE = config('POLLS_STATIC_COMPRESS_MIN_SIZE',
+                                        default=256, cast=int)
+POLLS_SERVE_STATIC = config('POLLS_SERVE_STATIC', default=True, cast=bool)
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Log records are written by background threads (polls.audit.QueuedHandler)
+# so logging never blocks a request. Audit events (votes, logins) are also
+# written as JSON lines to POLLS_AUDIT_LOG, rotated every
+# POLLS_AUDIT_LOG_MAX_BYTES, if it is set.
+POLLS_AUDIT_LOG = config('POLLS_AUDIT_LOG', default='')
+# Level of the 'polls' logger. Outside DEBUG the per-request SQL lines
+# and other debug records are not even created.
+POLLS_LOG_LEVEL = config('POLLS_LOG_LEVEL',
+                         default='DEBUG' if DEBUG else 'INFO')
+POLLS_AUDIT_LOG_MAX_BYTES = config('POLLS_AUDIT_LOG_MAX_BYTES',
+                                   default=10 * 1024 * 1024, cast=int)
+POLLS_AUDIT_LOG_BACKUPS = config('POLLS_AUDIT_LOG_BACKUPS', default=5,
+                                 cast=int)
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
@@ -146,19 +366,41 @@ LOGGING = {
             'format': '{levelname} {message}',
             'style': '{',
         },
+        'json': {
+            '()': 'polls.audit.JsonFormatter',
+        },
     },
     'handlers': {
         'console': {
             'level': 'DEBUG',
-            'class': 'logging.StreamHandler',
+            'class': 'polls.audit.QueuedHandler',
+            'handler': 'logging.StreamHandler',
             'formatter': 'simple',
         },
     },
     'loggers': {
         'polls': {
             'handlers': ['console'],
-            'level': 'DEBUG',
+            'level': POLLS_LOG_LEVEL,
+            'propagate': True,
+        },
+        'polls.audit': {
+            'handlers': [],
+            'level': 'INFO',
             'propagate': True,
         },
     },
 }
+
+if POLLS_AUDIT_LOG:
+    LOGGING['handlers']['audit_file'] = {
+        'class': 'polls.audit.QueuedHandler',
+        'handler': 'logging.handlers.RotatingFileHandler',
+        'filename': POLLS_AUDIT_LOG,
+        'maxBytes': POLLS_AUDIT_LOG_MAX_BYTES,
+        'backupCount': POLLS_AUDIT_LOG_BACKUPS,
+        'encoding': 'utf-8',
+        'delay': True,
+        'formatter': 'json',
+    }
+    LOGGING['loggers']['polls.audit']['handlers'].append('audit_file')
@@ -14,16 +14,30 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+import re
+
+from django.conf import settings
 from django.contrib import admin
-from django.urls import include, path
+from django.urls import include, path, re_path
 from django.views.generic import RedirectView
 
 from mysite import views
+from polls import assets, views as polls_views
+
+# Serve the polls from the async views when running under ASGI.
+polls_urls = 'polls.async_urls' if settings.POLLS_ASYNC_VIEWS else 'polls.urls'
 
 urlpatterns = [
-    path('polls/', include('polls.urls')),
+    path('polls/', include(polls_urls)),
     path('admin/', admin.site.urls),
     path('accounts/', include('django.contrib.auth.urls')),
     path('signup/', views.signup, name='signup'),
+    path('metrics', polls_views.prometheus_metrics, name='metrics'),
     path('', RedirectView.as_view(pattern_name='polls:index', permanent=True))
 ]
+
+# Serve the collected, precompressed assets without a separate web server.
+if settings.POLLS_SERVE_STATIC:
+    static_prefix = re.escape(settings.STATIC_URL.strip('/'))
+    urlpatterns.append(re_path(rf'^{static_prefix}/(?P<path>.+)$',
+                               assets.serve, name='static'))
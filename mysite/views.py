@@ -1,6 +1,7 @@
 """This is views class"""
 from django.shortcuts import render, redirect
-from django.contrib.auth import login, authenticate
+from django.conf import settings
+from django.contrib.auth import login
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib import messages
 
@@ -9,13 +10,9 @@ def signup(request):
     if request.method == 'POST':
         form = UserCreationForm(request.POST)
         if form.is_valid():
-            form.save()
-            # get named fields from the form data
-            username = form.cleaned_data.get('username')
-            # password input field is named 'password1'
-            raw_passwd = form.cleaned_data.get('password1')
-            user = authenticate(username=username, password=raw_passwd)
-            login(request, user)
+            user = form.save()
+            # the password was just set, so log in without checking it again
+            login(request, user, backend=settings.AUTHENTICATION_BACKENDS[0])
             messages.success(request, 'Your account has been created successfully!')
             return redirect('polls:index')
         else:
@@ -9,3 +9,8 @@ class PollsConfig(AppConfig):
     """
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'polls'
+
+    def ready(self):
+        """Connect the signal receivers that keep caches up to date."""
+        from . import (cache, feed, metrics, pagecache,  # noqa: F401
+                       ratelimit, usercache)
@@ -0,0 +1,216 @@
+"""
+Static asset pipeline for the Polls application.
+
+CompressedManifestStaticFilesStorage gives every collected file a
+content-hashed name (see ManifestStaticFilesStorage) and writes gzip and,
+when the brotli package is installed, brotli variants next to it at
+collectstatic time, so nothing is compressed per request.
+
+serve() answers requests under STATIC_URL from STATIC_ROOT. It sends the
+brotli, or else the gzip, variant when the client accepts it, and marks
+hashed files as immutable for a year: their content can never change
+under that name.
+Small deployments can therefore serve their own assets without a CDN or
+a separate web server.
+"""
+import gzip
+import logging
+import mimetypes
+import os
+import posixpath
+import re
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import (ManifestStaticFilesStorage,
+                                                StaticFilesStorage,
+                                                staticfiles_storage)
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.base import ContentFile
+from django.http import FileResponse, Http404, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date
+from django.views.decorators.http import require_safe
+from django.views.static import was_modified_since
+
+logger = logging.getLogger('polls')
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli is optional
+    brotli = None
+
+# Content-Encoding of each precompressed variant and its file suffix, in
+# order of preference.
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+# Seconds hashed files may be cached; unhashed names must be revalidated.
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+# Name produced by ManifestStaticFilesStorage: name.<12 hex digits>.ext
+HASHED_NAME = re.compile(r'^(?P<base>.+)\.[0-9a-f]{12}(?P<ext>\.[^./]+)?$')
+
+
+def compress(content):
+    """
+    Return the precompressed variants of a file's content.
+
+    Returns:
+        dict: Suffix to compressed bytes, only for the variants that are
+            smaller than the original.
+    """
+    variants = {'.gz': gzip.compress(content, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants['.br'] = brotli.compress(content, quality=11)
+    return {suffix: data for suffix, data in variants.items()
+            if len(data) < len(content)}
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    Manifest storage that also writes .gz and .br files at collectstatic.
+
+    Until collectstatic has written a manifest (development, tests), file
+    URLs fall back to the unhashed names served by the staticfiles
+    finders instead of raising. A stylesheet referring to a missing file
+    keeps that reference as it is, with a warning, rather than failing
+    the whole collectstatic.
+    """
+
+    compressible_types = ('text/', 'application/javascript',
+                          'application/json', 'application/xml',
+                          'image/svg+xml')
+
+    def __init__(self, *args, **kwargs):
+        """Create the storage with no missing references seen yet."""
+        super().__init__(*args, **kwargs)
+        self.missing_references = set()
+
+    def url(self, name, force=False):
+        """Return the hashed URL of a file, or the plain one if uncollected."""
+        if not self.hashed_files:
+            return StaticFilesStorage.url(self, name)
+        return super().url(name, force)
+
+    def url_converter(self, name, hashed_files, template=None):
+        """Return a converter that leaves references to missing files."""
+        converter = super().url_converter(name, hashed_files, template)
+
+        def convert(matchobj):
+            try:
+                return converter(matchobj)
+            except ValueError as e:
+                # Each file is converted once per pass; warn only once.
+                if (name, str(e)) not in self.missing_references:
+                    self.missing_references.add((name, str(e)))
+                    logger.warning("Left a reference unhashed in %s: %s",
+                                   name, e)
+                return matchobj[0]
+
+        return convert
+
+    def post_process(self, paths, dry_run=False, **options):
+        """Hash the files, then write compressed variants of the results."""
+        # Files are yielded once per hashing pass; compress the final names.
+        collected = {}
+        for name, hashed_name, processed in super().post_process(
+                paths, dry_run, **options):
+            if not isinstance(processed, Exception):
+                collected[name] = hashed_name
+            yield name, hashed_name, processed
+        if dry_run:
+            return
+        for name, hashed_name in collected.items():
+            for path in {name, hashed_name} - {None}:
+                if self.is_compressible(path):
+                    self.write_variants(path)
+
+    def is_compressible(self, name):
+        """Return whether a file is text that is worth compressing."""
+        content_type, _ = mimetypes.guess_type(name)
+        min_size = settings.POLLS_STATIC_COMPRESS_MIN_SIZE
+        return (content_type is not None
+                and content_type.startswith(self.compressible_types)
+                and self.size(name) >= min_size)
+
+    def write_variants(self, name):
+        """Write the compressed variants of a stored file next to it."""
+        with self.open(name) as f:
+            content = f.read()
+        for suffix, data in compress(content).items():
+            if self.exists(name + suffix):
+                self.delete(name + suffix)
+            self._save(name + suffix, ContentFile(data))
+
+
+def accepted_encodings(header):
+    """Return the content codings an Accept-Encoding header allows."""
+    accepted = set()
+    for part in header.split(','):
+        coding, _, params = part.strip().partition(';')
+        quality = params.strip()
+        if quality.startswith('q='):
+            try:
+                if float(quality[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(coding.strip().lower())
+    if '*' in accepted:
+        accepted.update(encoding for encoding, _ in ENCODINGS)
+    return accepted
+
+
+def is_immutable(path):
+    """Return whether path is the hashed name the manifest points to."""
+    match = HASHED_NAME.match(path)
+    if match is None:
+        return False
+    original = match['base'] + (match['ext'] or '')
+    return getattr(staticfiles_storage, 'hashed_files', {}).get(
+        original) == path
+
+
+@require_safe
+def serve(request, path):
+    """
+    Serve a collected static file, precompressed if the client allows.
+
+    Raises:
+        Http404: If the file is not in STATIC_ROOT.
+    """
+    path = posixpath.normpath(path).lstrip('/')
+    try:
+        fullpath = safe_join(settings.STATIC_ROOT, path)
+    except (SuspiciousFileOperation, ValueError):
+        raise Http404("Invalid static file path.")
+    if not os.path.isfile(fullpath):
+        raise Http404(f"'{path}' does not exist.")
+
+    stat = os.stat(fullpath)
+    if not was_modified_since(request.META.get('HTTP_IF_MODIFIED_SINCE'),
+                              stat.st_mtime):
+        response = HttpResponseNotModified()
+    else:
+        content_type, _ = mimetypes.guess_type(path)
+        accepted = accepted_encodings(
+            request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        encoding, filename = None, fullpath
+        for coding, suffix in ENCODINGS:
+            if coding in accepted and os.path.isfile(fullpath + suffix):
+                encoding, filename = coding, fullpath + suffix
+                break
+        response = FileResponse(
+            open(filename, 'rb'), filename=posixpath.basename(path),
+            content_type=content_type or 'application/octet-stream')
+        if encoding:
+            response['Content-Encoding'] = encoding
+        response['Last-Modified'] = http_date(stat.st_mtime)
+
+    patch_vary_headers(response, ['Accept-Encoding'])
+    if is_immutable(path):
+        response['Cache-Control'] = (f'public, max-age={IMMUTABLE_MAX_AGE}, '
+                                     f'immutable')
+    else:
+        response['Cache-Control'] = 'public, max-age=0, must-revalidate'
+    return response
@@ -0,0 +1,27 @@
+"""
+Async URL configuration for the Polls application.
+
+Same URL patterns and names as polls/urls.py, served by the async views.
+mysite/urls.py includes this module instead when POLLS_ASYNC_VIEWS is set.
+"""
+from django.urls import path
+
+from . import async_views, views
+from .pagecache import cache_anonymous_page, results_page_version
+
+app_name = 'polls'
+urlpatterns = [
+    path('', cache_anonymous_page(async_views.IndexView.as_view(),
+                                  params=['before']),
+         name='index'),
+    path('<int:pk>/', async_views.DetailView.as_view(), name='detail'),
+    path('<int:pk>/results/',
+         cache_anonymous_page(async_views.ResultsView.as_view(),
+                              version_of=results_page_version),
+         name='results'),
+    path('<int:pk>/results/stream/', async_views.results_stream,
+         name='results_stream'),
+    path('api/results/', views.results_api, name='results_api'),
+    path('export/votes/', async_views.export_votes, name='export_votes'),
+    path('<int:question_id>/vote/', async_views.vote, name='vote'),
+]
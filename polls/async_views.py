@@ -0,0 +1,153 @@
+"""
+Async versions of the poll views for running under ASGI.
+
+They have the same URLs, names, templates and behaviour as the views in
+polls.views, and are used instead of them when POLLS_ASYNC_VIEWS is set
+(see polls/async_urls.py). Database reads go through Django's async ORM,
+so a request waiting on a slow client does not hold a worker thread.
+Templates are rendered with sync_to_async because the context processors
+read the session and the user lazily, and writes run in a worker thread
+because transactions are synchronous only.
+"""
+import logging
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib import messages
+from django.contrib.admin.views.decorators import staff_member_required
+from django.contrib.auth.decorators import login_required
+from django.core.handlers.asgi import ASGIRequest
+from django.db import router
+from django.http import (HttpResponse, HttpResponseBadRequest,
+                         StreamingHttpResponse)
+from django.shortcuts import aget_object_or_404, redirect, render
+from django.views import View
+
+from .audit import audit, get_client_ip
+from .cache import results_cache
+from .exports import (aexport_lines, export_options, streaming_response,
+                      vote_rows)
+from .feed import results_feed
+from .metrics import metrics
+from .models import Choice, Question, Vote
+from .views import (detail_context, published_questions, question_cursor,
+                    record_vote)
+
+arender = sync_to_async(render)
+
+
+class IndexView(View):
+    """Async version of polls.views.IndexView."""
+
+    template_name = 'polls/index.html'
+    page_size = 20
+
+    async def get(self, request):
+        """Render one keyset page of published questions."""
+        cursor = request.GET.get('before')
+        questions = published_questions(cursor)[:self.page_size + 1]
+        page = [question async for question in questions]
+        next_cursor = (question_cursor(page[self.page_size - 1])
+                       if len(page) > self.page_size else None)
+        return await arender(request, self.template_name, {
+            'latest_question_list': page[:self.page_size],
+            'next_cursor': next_cursor,
+            'is_first_page': cursor is None,
+        })
+
+
+class DetailView(View):
+    """Async version of polls.views.DetailView."""
+
+    template_name = 'polls/detail.html'
+
+    async def get(self, request, pk):
+        """Render the voting form, or redirect if voting is not allowed."""
+        this_user = await request.auser()
+        try:
+            question = await (Question.objects.with_choice_of(this_user)
+                              .aget(pk=pk))
+        except Question.DoesNotExist:
+            messages.error(request, f"Poll question {pk} does not exist.")
+            return redirect("polls:index")
+
+        if not question.can_vote():
+            messages.error(request, f"Poll question {pk} "
+                                    f"does not allow voting.")
+            return redirect("polls:index")
+
+        # The choices stay a lazy queryset: the template evaluates them,
+        # in its worker thread, only when the fragment is not cached.
+        return await arender(request, self.template_name,
+                             detail_context(question))
+
+
+class ResultsView(View):
+    """Async version of polls.views.ResultsView."""
+
+    template_name = 'polls/results.html'
+
+    async def get(self, request, pk):
+        """Render the cached results of a question."""
+        question = await aget_object_or_404(Question, pk=pk)
+        results, source = await results_cache.aget(question.pk)
+        response = await arender(request, self.template_name, {
+            'question': question,
+            'results': results,
+            'live_results': True,
+        })
+        response['X-Results-Cache'] = source
+        return response
+
+
+async def results_stream(request, pk):
+    """
+    Stream the results of a question as Server-Sent Events.
+
+    This view is async in both URL configurations, but needs the site to
+    run under ASGI: a WSGI server would try to buffer the endless stream.
+    """
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse("Live results need the ASGI server.",
+                            status=501)
+    question = await aget_object_or_404(Question, pk=pk)
+    response = StreamingHttpResponse(results_feed.stream(question.pk),
+                                     content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@login_required
+async def vote(request, question_id):
+    """Async version of polls.views.vote."""
+    this_user = await request.auser()
+    try:
+        selected_choice = await (Choice.objects.select_related('question')
+                                 .aget(pk=request.POST['choice'],
+                                       question_id=question_id))
+    except (KeyError, ValueError, Choice.DoesNotExist):
+        question = await aget_object_or_404(Question, pk=question_id)
+        ip_address = get_client_ip(request)
+        audit('vote_rejected', "%s failed to vote in %s from %s",
+              this_user, question, ip_address, level=logging.WARNING,
+              reason='no_choice', user_id=this_user.pk,
+              question_id=question.pk, ip=ip_address)
+        metrics.inc('polls_votes_total', outcome='rejected')
+        return await arender(request, 'polls/detail.html', detail_context(
+            question, error_message="You didn't select a choice."))
+
+    return await sync_to_async(record_vote)(request, this_user,
+                                            selected_choice)
+
+
+@staff_member_required
+async def export_votes(request):
+    """Async version of polls.views.export_votes."""
+    try:
+        fmt, filters = export_options(request.GET)
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+    rows = (vote_rows(**filters).using(router.db_for_read(Vote))
+            .aiterator(chunk_size=settings.POLLS_EXPORT_CHUNK_SIZE))
+    return streaming_response(aexport_lines(rows, fmt), fmt)
@@ -0,0 +1,122 @@
+"""
+Audit logging for the Polls application.
+
+Votes and authentication events are logged with audit() on the
+'polls.audit' logger. Each record carries its event name and fields
+(user, question, choice, IP address), so the JSON formatter can write it
+as one structured line, while the console shows the plain message.
+
+Handlers in LOGGING that use QueuedHandler only put records on a queue;
+a background thread formats and writes them, so a slow disk or terminal
+never holds up a request. Messages are %-formatted, and only when a
+handler writes them, so a disabled level costs one level check. A forked
+worker (see mysite/gunicorn.conf.py) starts its own listener thread,
+since threads do not survive fork().
+"""
+import datetime
+import json
+import logging
+import os
+import queue
+from logging.handlers import QueueHandler, QueueListener
+
+from django.utils.module_loading import import_string
+
+audit_logger = logging.getLogger('polls.audit')
+
+
+def audit(event, msg, *args, level=logging.INFO, **fields):
+    """
+    Log an audit event.
+
+    Args:
+        event (str): The event name, e.g. 'vote' or 'login_failed'.
+        msg (str): A %-style message, formatted with args when written.
+        level (int): The logging level.
+        **fields: Values for the JSON record, e.g. user_id or ip.
+    """
+    if audit_logger.isEnabledFor(level):
+        audit_logger.log(level, msg, *args,
+                         extra={'event': event, 'audit': fields})
+
+
+def get_client_ip(request):
+    """
+    Retrieve the client's IP address from the request.
+
+    Returns:
+        str: The first X-Forwarded-For address, or the remote address.
+    """
+    x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
+    if x_forwarded_for:
+        ip = x_forwarded_for.split(',')[0]
+    else:
+        ip = request.META.get('REMOTE_ADDR')
+    return ip
+
+
+class JsonFormatter(logging.Formatter):
+    """Format a record as one JSON object with its audit fields."""
+
+    def format(self, record):
+        """Return the record as a JSON line."""
+        data = {
+            'time': datetime.datetime.fromtimestamp(
+                record.created, datetime.timezone.utc).isoformat(),
+            'level': record.levelname,
+            'event': getattr(record, 'event', record.name),
+            'message': record.getMessage(),
+        }
+        data.update(getattr(record, 'audit', {}))
+        if record.exc_info:
+            data['exception'] = self.formatException(record.exc_info)
+        return json.dumps(data, default=str)
+
+
+class QueuedHandler(QueueHandler):
+    """
+    Queue records for a handler that writes them in a background thread.
+
+    Configured in LOGGING with the dotted path of the wrapped handler
+    class and its arguments, e.g. 'handler':
+    'logging.handlers.RotatingFileHandler' with 'filename' and 'maxBytes'.
+    The formatter set on this handler is used by the wrapped one.
+    """
+
+    def __init__(self, handler, **kwargs):
+        """Create the wrapped handler and start its listener thread."""
+        super().__init__(queue.SimpleQueue())
+        self.target = import_string(handler)(**kwargs)
+        self.listener = QueueListener(self.queue, self.target)
+        self.listener.start()
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._restart_in_child)
+
+    def _restart_in_child(self):
+        """Give a forked child its own queue and listener thread."""
+        if self.listener is None:
+            return
+        # Records queued before the fork are the parent's to write.
+        self.queue = queue.SimpleQueue()
+        self.listener = QueueListener(self.queue, self.target)
+        self.listener.start()
+
+    def setFormatter(self, fmt):
+        """Format records with fmt in the wrapped handler."""
+        self.target.setFormatter(fmt)
+
+    def prepare(self, record):
+        """Queue the record as is, to be formatted by the listener."""
+        return record
+
+    def close(self):
+        """
+        Write the queued records and close the wrapped handler.
+
+        logging.shutdown() calls this at interpreter exit.
+        """
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+            self.target.close()
+        super().close()
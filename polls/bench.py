@@ -0,0 +1,120 @@
+"""Helpers shared by the benchmark management commands."""
+import datetime
+import random
+from contextlib import contextmanager
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import (setup_test_environment,
+                               teardown_test_environment)
+from django.utils import timezone
+
+from .models import Choice, Question, Vote
+
+BENCH_PASSWORD = 'benchpassword123'
+
+
+@contextmanager
+def throwaway_database(verbosity=0):
+    """
+    Run the block against a new, migrated test database.
+
+    The database is destroyed afterwards, so a benchmark never touches
+    the real data.
+    """
+    old_name = connection.settings_dict['NAME']
+    setup_test_environment()
+    connection.creation.create_test_db(verbosity=verbosity, autoclobber=True)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity)
+        teardown_test_environment()
+
+
+def seed(users, questions, choices, votes, batch_size=1000):
+    """
+    Create a synthetic dataset with bulk inserts.
+
+    Every user gets the same password (BENCH_PASSWORD), hashed once. Each
+    vote goes to a random choice of a random question, at most one per
+    user and question, and the tallies are set to match.
+
+    Args:
+        users (int): The number of users.
+        questions (int): The number of published, open questions.
+        choices (int): The number of choices per question.
+        votes (int): The number of votes to cast, capped at
+            users * questions.
+
+    Returns:
+        dict: Lists of the created 'users', 'questions' and 'choices' ids.
+    """
+    password = make_password(BENCH_PASSWORD)
+    User.objects.bulk_create(
+        [User(username=f'bench{n}', password=password)
+         for n in range(users)], batch_size=batch_size)
+    user_ids = list(User.objects.filter(username__startswith='bench')
+                    .values_list('pk', flat=True))
+
+    now = timezone.now()
+    Question.objects.bulk_create(
+        [Question(question_text=f'Benchmark question {n}',
+                  pub_date=now - datetime.timedelta(minutes=n))
+         for n in range(questions)], batch_size=batch_size)
+    question_ids = list(Question.objects.values_list('pk', flat=True))
+
+    Choice.objects.bulk_create(
+        [Choice(question_id=question_id, choice_text=f'Choice {n}')
+         for question_id in question_ids for n in range(choices)],
+        batch_size=batch_size)
+    choices_of = {}
+    for choice_id, question_id in Choice.objects.values_list('pk',
+                                                             'question_id'):
+        choices_of.setdefault(question_id, []).append(choice_id)
+
+    pairs = set()
+    votes = min(votes, len(user_ids) * len(question_ids))
+    while len(pairs) < votes:
+        pairs.add((random.choice(user_ids), random.choice(question_ids)))
+    tallies = {}
+    new_votes = []
+    for user_id, question_id in pairs:
+        choice_id = random.choice(choices_of[question_id])
+        tallies[choice_id] = tallies.get(choice_id, 0) + 1
+        new_votes.append(Vote(user_id=user_id, question_id=question_id,
+                              choice_id=choice_id))
+    Vote.objects.bulk_create(new_votes, batch_size=batch_size)
+    Choice.objects.bulk_update(
+        [Choice(pk=pk, votes=count) for pk, count in tallies.items()],
+        ['votes'], batch_size=batch_size)
+
+    return {'users': user_ids, 'questions': question_ids,
+            'choices': [pk for ids in choices_of.values() for pk in ids]}
+
+
+def percentile(samples, pct):
+    """Return the pct-th percentile of a sorted list of samples."""
+    if not samples:
+        return 0.0
+    index = min(len(samples) - 1, round(pct / 100 * (len(samples) - 1)))
+    return samples[index]
+
+
+def summarize(latencies, elapsed):
+    """
+    Summarize request latencies measured over elapsed seconds.
+
+    Returns:
+        dict: The request count, requests per second and the p50, p95
+            and p99 latencies in milliseconds.
+    """
+    samples = sorted(latencies)
+    return {
+        'requests': len(samples),
+        'throughput': round(len(samples) / elapsed, 1) if elapsed else 0.0,
+        'p50_ms': round(percentile(samples, 50) * 1000, 2),
+        'p95_ms': round(percentile(samples, 95) * 1000, 2),
+        'p99_ms': round(percentile(samples, 99) * 1000, 2),
+    }
@@ -0,0 +1,333 @@
+"""
+Write-behind buffering of votes for the Polls application.
+
+With POLLS_VOTE_WRITE_MODE = 'buffered', vote() validates a vote and puts
+it in a bounded in-process queue instead of writing it. A background
+thread writes the queued votes with one bulk upsert every
+POLLS_VOTE_BUFFER_FLUSH_MS milliseconds, or sooner once
+POLLS_VOTE_BUFFER_BATCH votes are waiting.
+
+Votes still in the queue are lost if the process is killed, so the
+buffer is flushed at interpreter exit when
+POLLS_VOTE_BUFFER_FLUSH_ON_SHUTDOWN is set, and no vote is queued while
+the oldest queued vote is more than POLLS_VOTE_BUFFER_MAX_LAG_MS old.
+
+A vote that cannot be queued is written by the caller instead, so the
+same voter's earlier vote on the question is withdrawn from the buffer
+first; it would otherwise overwrite the newer vote when flushed. A flush
+locks the questions of its votes and drops those for questions that
+closed meanwhile, and moves the tallies on the counter shards when
+POLLS_VOTE_COUNTER_SHARDS is set, as Vote.objects.cast() does.
+
+When a batch cannot be written, its votes are written one at a time, so
+one bad vote (say, for a choice deleted since) does not hold back the
+others. A vote that still fails is retried on the next flushes, keeping
+its place in the lag check, and dropped with an error in the log after
+POLLS_VOTE_BUFFER_MAX_ATTEMPTS attempts.
+"""
+import atexit
+import logging
+import queue
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Case, F, When
+
+from .models import (Choice, ChoiceCounterShard, Question, Vote,
+                     VotingClosed)
+from .signals import vote_cast
+
+logger = logging.getLogger('polls')
+
+
+class VoteBufferFull(Exception):
+    """Raised when a vote cannot be queued and the policy is to reject."""
+
+
+class VoteBuffer:
+    """
+    A bounded queue of votes flushed to the database in batches.
+
+    Attributes:
+        flush_interval (float): Seconds between flushes.
+        flush_batch (int): Queued votes that trigger an early flush.
+        max_lag (float): Seconds the oldest queued vote may wait before
+            new votes are refused.
+        when_full (str): 'sync' to let the caller write the vote itself,
+            or 'reject' to raise VoteBufferFull.
+        max_attempts (int): Failed writes after which a vote is dropped.
+    """
+
+    def __init__(self, max_size, flush_interval, flush_batch, max_lag,
+                 when_full='sync', max_attempts=5):
+        """Create an empty buffer; call start() to run the flusher."""
+        self.flush_interval = flush_interval
+        self.flush_batch = flush_batch
+        self.max_lag = max_lag
+        self.when_full = when_full
+        self.max_attempts = max_attempts
+        self._queue = queue.Queue(max_size)
+        # Votes whose write failed, as (queued at, attempts, user,
+        # question id, choice id), like the entries of the queue.
+        self._retries = []
+        self._retries_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+
+    def submit(self, user, choice):
+        """
+        Queue a vote of a user for a choice.
+
+        Returns:
+            bool: True if the vote was queued, False if the buffer is
+                full and the caller should write the vote synchronously.
+                The user's earlier vote on the question is then withdrawn
+                from the buffer.
+
+        Raises:
+            VotingClosed: If the choice's question is not open for voting.
+            VoteBufferFull: If the buffer is full and the policy is 'reject'.
+        """
+        if not choice.question.can_vote():
+            raise VotingClosed(f"Question {choice.question_id} "
+                               f"is not open for voting.")
+        now = time.monotonic()
+        oldest = self._oldest_enqueued()
+        try:
+            if oldest is not None and now - oldest > self.max_lag:
+                raise queue.Full
+            self._queue.put_nowait((now, 0, user, choice.question_id,
+                                    choice.pk))
+        except queue.Full:
+            if self.when_full == 'reject':
+                raise VoteBufferFull("The vote buffer is full.")
+            self.withdraw(user, choice.question_id)
+            return False
+        if self._queue.qsize() >= self.flush_batch:
+            self._wakeup.set()
+        return True
+
+    def withdraw(self, user, question_id):
+        """
+        Drop the waiting votes of a user on a question.
+
+        A flush that is already writing them is waited for, so no vote of
+        theirs from the buffer can land after this returns.
+        """
+        def keep(entry):
+            return (entry[2].pk, entry[3]) != (user.pk, question_id)
+
+        with self._flush_lock:
+            with self._retries_lock:
+                self._retries = [entry for entry in self._retries
+                                 if keep(entry)]
+            with self._queue.mutex:
+                kept = [entry for entry in self._queue.queue if keep(entry)]
+                self._queue.queue.clear()
+                self._queue.queue.extend(kept)
+
+    def _oldest_enqueued(self):
+        """Return when the oldest waiting vote was queued, or None."""
+        with self._retries_lock:
+            times = [entry[0] for entry in self._retries]
+        with self._queue.mutex:
+            if self._queue.queue:
+                times.append(self._queue.queue[0][0])
+        return min(times, default=None)
+
+    def __len__(self):
+        """Return the number of votes waiting to be written."""
+        with self._retries_lock:
+            return self._queue.qsize() + len(self._retries)
+
+    def _take_all(self):
+        """Remove and return the votes to retry, then the queued votes."""
+        with self._retries_lock:
+            entries, self._retries = self._retries, []
+        while True:
+            try:
+                entries.append(self._queue.get_nowait())
+            except queue.Empty:
+                return entries
+
+    def flush(self):
+        """
+        Write every queued vote and return how many rows were written.
+
+        Only the latest vote of a user on a question in the batch is
+        kept. The votes they replace are read with the rows locked, so
+        the tallies can be moved in the same transaction as the upsert.
+        """
+        with self._flush_lock:
+            entries = {}
+            for entry in self._take_all():
+                _, _, user, question_id, _ = entry
+                entries[(user.pk, question_id)] = entry
+            if not entries:
+                return 0
+            try:
+                return self._write({key: (user, choice_id) for key, (
+                    _, _, user, _, choice_id) in entries.items()})
+            except Exception:
+                logger.exception(f"Writing {len(entries)} buffered votes "
+                                 f"failed, writing them one at a time")
+            written = 0
+            for key, entry in entries.items():
+                _, _, user, _, choice_id = entry
+                try:
+                    written += self._write({key: (user, choice_id)})
+                except Exception:
+                    self._retry_later(entry)
+            return written
+
+    def _retry_later(self, entry):
+        """Keep a vote whose write failed for the next flush, or drop it."""
+        queued_at, attempts, user, question_id, choice_id = entry
+        attempts += 1
+        if attempts >= self.max_attempts:
+            logger.exception(f"Dropped buffered vote of {user} for Choice "
+                             f"{choice_id} after {attempts} attempts")
+            return
+        logger.warning(f"Writing buffered vote of {user} for Choice "
+                       f"{choice_id} failed, will retry", exc_info=True)
+        with self._retries_lock:
+            self._retries.append((queued_at, attempts, user, question_id,
+                                  choice_id))
+
+    def _write(self, batch):
+        """
+        Upsert a batch of votes and move their tallies.
+
+        The votes for questions no longer open for voting are dropped.
+        Returns the number of votes written.
+        """
+        with transaction.atomic():
+            batch = self._open_votes(batch)
+            if not batch:
+                return 0
+            previous = self._previous_choices(batch)
+            Vote.objects.bulk_create(
+                [Vote(user=user, question_id=question_id,
+                      choice_id=choice_id)
+                 for (_, question_id), (user, choice_id) in batch.items()],
+                update_conflicts=True,
+                unique_fields=['user', 'question'],
+                update_fields=['choice'])
+            deltas = Counter()
+            for key, (_, choice_id) in batch.items():
+                deltas[choice_id] += 1
+                if key in previous:
+                    deltas[previous[key]] -= 1
+            deltas = {pk: delta for pk, delta in deltas.items() if delta}
+            if settings.POLLS_VOTE_COUNTER_SHARDS > 0:
+                ChoiceCounterShard.objects.add(
+                    deltas, settings.POLLS_VOTE_COUNTER_SHARDS)
+            elif deltas:
+                Choice.objects.filter(pk__in=deltas).update(votes=Case(
+                    *[When(pk=pk, then=F('votes') + delta)
+                      for pk, delta in deltas.items()],
+                    default=F('votes')))
+            transaction.on_commit(
+                lambda: self._send_signals(batch, previous))
+        return len(batch)
+
+    @staticmethod
+    def _open_votes(batch):
+        """
+        Return the votes of a batch whose question is still open.
+
+        The open questions are locked until the batch is written, so they
+        cannot close in between.
+        """
+        open_ids = set(Question.objects.open_for_voting().select_for_update()
+                       .filter(pk__in={question_id
+                                       for _, question_id in batch})
+                       .values_list('pk', flat=True))
+        votes = {}
+        for (user_id, question_id), (user, choice_id) in batch.items():
+            if question_id in open_ids:
+                votes[(user_id, question_id)] = (user, choice_id)
+            else:
+                logger.warning(f"Dropped buffered vote of {user} for Choice "
+                               f"{choice_id}, Question {question_id} is "
+                               f"not open for voting")
+        return votes
+
+    @staticmethod
+    def _previous_choices(batch):
+        """Return the stored choice of each (user id, question id) pair."""
+        user_ids = {user_id for user_id, _ in batch}
+        question_ids = {question_id for _, question_id in batch}
+        rows = (Vote.objects.select_for_update()
+                .filter(user_id__in=user_ids, question_id__in=question_ids)
+                .values_list('user_id', 'question_id', 'choice_id'))
+        return {(user_id, question_id): choice_id
+                for user_id, question_id, choice_id in rows
+                if (user_id, question_id) in batch}
+
+    @staticmethod
+    def _send_signals(batch, previous):
+        """Send vote_cast for every vote written by a flush."""
+        for key, (user, choice_id) in batch.items():
+            vote_cast.send(sender=Vote, question_id=key[1],
+                           choice_id=choice_id,
+                           previous_choice_id=previous.get(key), user=user)
+
+    def start(self):
+        """Start the background flusher thread."""
+        self._thread = threading.Thread(target=self._run,
+                                        name='polls-vote-buffer', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        """Flush the queue every flush_interval seconds until stopped."""
+        while not self._stopping.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Flushing the vote buffer failed")
+            finally:
+                close_old_connections()
+
+    def stop(self, flush=True):
+        """Stop the flusher thread and optionally write what is left."""
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+        if flush:
+            self.flush()
+
+
+_vote_buffer = None
+_vote_buffer_lock = threading.Lock()
+
+
+def get_vote_buffer():
+    """Return the process-wide vote buffer, starting it on first use."""
+    global _vote_buffer
+    with _vote_buffer_lock:
+        if _vote_buffer is None:
+            _vote_buffer = VoteBuffer(
+                max_size=settings.POLLS_VOTE_BUFFER_SIZE,
+                flush_interval=settings.POLLS_VOTE_BUFFER_FLUSH_MS / 1000,
+                flush_batch=settings.POLLS_VOTE_BUFFER_BATCH,
+                max_lag=settings.POLLS_VOTE_BUFFER_MAX_LAG_MS / 1000,
+                when_full=settings.POLLS_VOTE_BUFFER_WHEN_FULL,
+                max_attempts=settings.POLLS_VOTE_BUFFER_MAX_ATTEMPTS)
+            _vote_buffer.start()
+            atexit.register(_vote_buffer.stop,
+                            flush=settings.POLLS_VOTE_BUFFER_FLUSH_ON_SHUTDOWN)
+        return _vote_buffer
+
+
+def started_vote_buffer():
+    """Return the process-wide vote buffer, or None if it is not started."""
+    return _vote_buffer
@@ -0,0 +1,244 @@
+"""
+Caching of poll results for the Polls application.
+
+Results of a question only change when someone votes, so a snapshot of
+its tallies is kept in Django's cache under a per-question version number.
+Voting bumps the version, which makes every older snapshot unreachable
+without having to find and delete it. A small in-process LRU sits in
+front of the shared cache so repeated hits skip even the cache backend.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import router, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Choice, Vote
+from .signals import tallies_recounted, vote_cast
+
+
+class LRUCache:
+    """
+    A thread-safe in-process LRU cache whose entries expire.
+
+    Attributes:
+        maxsize (int): The largest number of entries kept.
+        ttl (float): Seconds an entry stays valid after it is set.
+    """
+
+    def __init__(self, maxsize, ttl):
+        """Create an empty cache."""
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """Return the live value for key, or default."""
+        with self._lock:
+            try:
+                expires, value = self._entries[key]
+            except KeyError:
+                return default
+            if expires < time.monotonic():
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        """Store value under key, evicting the least recently used entry."""
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Remove every entry."""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        """Return the number of entries, including expired ones."""
+        return len(self._entries)
+
+
+class ResultsCache:
+    """
+    Versioned cache of the per-choice tallies of each question.
+
+    Attributes:
+        local (LRUCache): The in-process cache in front of Django's cache.
+        timeout (int): Seconds a snapshot is kept in Django's cache.
+    """
+
+    version_key = 'polls:results:version:{}'
+    snapshot_key = 'polls:results:{}:{}'
+
+    def __init__(self, maxsize, ttl, timeout):
+        """Create a results cache with empty hit and miss counters."""
+        self.local = LRUCache(maxsize, ttl)
+        self.timeout = timeout
+        self._counts = {'local_hits': 0, 'shared_hits': 0, 'misses': 0}
+        self._counts_lock = threading.Lock()
+
+    @staticmethod
+    def _initial_version():
+        """
+        Return a version number for a question with none in the cache.
+
+        It is time based, so a version key evicted from the cache never
+        restarts below a version whose snapshot may still be stored.
+        """
+        return time.time_ns() // 1000
+
+    def version(self, question_id):
+        """Return the current results version of a question."""
+        key = self.version_key.format(question_id)
+        version = cache.get(key)
+        if version is None:
+            cache.add(key, self._initial_version(), None)
+            version = cache.get(key)
+        return version
+
+    def invalidate(self, question_id):
+        """Bump the results version of a question."""
+        key = self.version_key.format(question_id)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, self._initial_version(), None)
+
+    async def aversion(self, question_id):
+        """Async version of version() for the async views."""
+        key = self.version_key.format(question_id)
+        version = await cache.aget(key)
+        if version is None:
+            await cache.aadd(key, self._initial_version(), None)
+            version = await cache.aget(key)
+        return version
+
+    def get(self, question_id):
+        """
+        Return the results of a question.
+
+        Returns:
+            tuple: A (results, source) pair. results is a list of dicts
+                with the id, choice_text and votes of each choice, and
+                source is 'local', 'shared' or 'miss'.
+        """
+        key, found = self._local_lookup(question_id,
+                                        self.version(question_id))
+        if found is not None:
+            return found
+        results = cache.get(key)
+        if results is not None:
+            return self._found(key, results, 'shared')
+        results = self._snapshot(self._tallies(question_id))
+        cache.set(key, results, self.timeout)
+        return self._found(key, results, 'miss')
+
+    async def aget(self, question_id):
+        """Async version of get() for the async views."""
+        key, found = self._local_lookup(question_id,
+                                        await self.aversion(question_id))
+        if found is not None:
+            return found
+        results = await cache.aget(key)
+        if results is not None:
+            return self._found(key, results, 'shared')
+        results = self._snapshot(
+            [row async for row in self._tallies(question_id)])
+        await cache.aset(key, results, self.timeout)
+        return self._found(key, results, 'miss')
+
+    def _local_lookup(self, question_id, version):
+        """
+        Return the snapshot key of a results version and its local hit.
+
+        The hit is a (results, 'local') pair, or None if the snapshot is
+        not in the in-process cache.
+        """
+        key = self.snapshot_key.format(question_id, version)
+        results = self.local.get(key)
+        if results is None:
+            return key, None
+        return key, self._found(key, results, 'local')
+
+    def _found(self, key, results, source):
+        """Count where a snapshot came from and keep it in process."""
+        self._count({'local': 'local_hits', 'shared': 'shared_hits',
+                     'miss': 'misses'}[source])
+        if source != 'local':
+            self.local.set(key, results)
+        return results, source
+
+    @staticmethod
+    def _tallies(question_id):
+        """
+        Return the queryset that reads the tallies of a question.
+
+        They are read from the primary: a snapshot from a lagging replica
+        would be cached under the version that its missing vote created.
+        """
+        return (Choice.objects.using(router.db_for_write(Choice))
+                .filter(question_id=question_id).with_tally()
+                .order_by('pk').values_list('id', 'choice_text', 'tally'))
+
+    @staticmethod
+    def _snapshot(rows):
+        """Return the results dicts of (id, choice_text, votes) rows."""
+        return [{'id': pk, 'choice_text': text, 'votes': votes}
+                for pk, text, votes in rows]
+
+    def _count(self, name):
+        """Add one to a hit or miss counter."""
+        with self._counts_lock:
+            self._counts[name] += 1
+
+    def stats(self):
+        """Return a copy of the hit and miss counters."""
+        with self._counts_lock:
+            return dict(self._counts)
+
+    def clear(self):
+        """Drop the in-process entries and reset the counters."""
+        self.local.clear()
+        with self._counts_lock:
+            for name in self._counts:
+                self._counts[name] = 0
+
+
+results_cache = ResultsCache(maxsize=settings.POLLS_RESULTS_CACHE_SIZE,
+                             ttl=settings.POLLS_RESULTS_CACHE_TTL,
+                             timeout=settings.POLLS_RESULTS_CACHE_TIMEOUT)
+
+
+@receiver(vote_cast)
+def invalidate_results_on_vote(sender, question_id, **kwargs):
+    """Make the next results request see the new vote."""
+    results_cache.invalidate(question_id)
+
+
+@receiver(tallies_recounted)
+def invalidate_results_on_recount(sender, question_ids, **kwargs):
+    """Make the next results request see the recounted tallies."""
+    for question_id in question_ids:
+        results_cache.invalidate(question_id)
+
+
+@receiver(post_save, sender=Choice)
+@receiver(post_delete, sender=Choice)
+@receiver(post_save, sender=Vote)
+@receiver(post_delete, sender=Vote)
+def invalidate_results_on_change(sender, instance, using, **kwargs):
+    """Invalidate results when choices or votes change outside vote()."""
+    transaction.on_commit(
+        lambda: results_cache.invalidate(instance.question_id), using=using)
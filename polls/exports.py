@@ -0,0 +1,144 @@
+"""
+Streaming exports of the votes of the Polls application.
+
+Used by the export_votes command and the staff-only download view. The
+votes are read joined to their question, choice and user with
+QuerySet.iterator(), which uses a server-side cursor where the database
+supports one, and written out one row at a time, so memory use does not
+grow with the number of votes.
+
+Votes have no timestamp of their own, so the date range filters on the
+publication date of the question.
+"""
+import csv
+import datetime
+import json
+
+from django.db.models import F
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .models import Vote
+
+FIELDS = ('vote_id', 'question_id', 'question_text', 'choice_id',
+          'choice_text', 'user_id', 'username')
+FORMATS = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+
+
+def parse_bound(value):
+    """
+    Parse a date or datetime given as an export bound.
+
+    A date means midnight at its start in the current time zone.
+
+    Raises:
+        ValueError: If the value is not an ISO 8601 date or datetime.
+    """
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f"'{value}' is not a date.")
+        moment = datetime.datetime.combine(day, datetime.time())
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def export_options(params):
+    """
+    Read the export format and filters from request parameters.
+
+    Returns:
+        tuple: The format and a dict of vote_rows() keyword arguments.
+
+    Raises:
+        ValueError: If a parameter is not valid.
+    """
+    fmt = params.get('format', 'csv')
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format '{fmt}'.")
+    filters = {}
+    if params.get('question'):
+        filters['question_id'] = int(params['question'])
+    for bound in ('since', 'until'):
+        if params.get(bound):
+            filters[bound] = parse_bound(params[bound])
+    return fmt, filters
+
+
+def streaming_response(lines, fmt):
+    """Return a download of the exported lines."""
+    response = StreamingHttpResponse(lines, content_type=FORMATS[fmt])
+    response['Content-Disposition'] = (f'attachment; '
+                                       f'filename="votes.{fmt}"')
+    return response
+
+
+def vote_rows(question_id=None, since=None, until=None):
+    """
+    Return the votes to export as dicts of FIELDS, in vote id order.
+
+    Iterate the result with iterator() or aiterator() so the rows are
+    fetched in chunks.
+
+    Args:
+        question_id (int): Only export the votes of this question.
+        since (datetime): Only questions published at or after this.
+        until (datetime): Only questions published before this.
+    """
+    votes = Vote.objects.order_by('pk')
+    if question_id is not None:
+        votes = votes.filter(question_id=question_id)
+    if since is not None:
+        votes = votes.filter(question__pub_date__gte=since)
+    if until is not None:
+        votes = votes.filter(question__pub_date__lt=until)
+    # values() rather than values_list(): only its rows can be fetched
+    # lazily by aiterator().
+    return votes.values(
+        'question_id', 'choice_id', 'user_id', vote_id=F('pk'),
+        question_text=F('question__question_text'),
+        choice_text=F('choice__choice_text'), username=F('user__username'))
+
+
+class Echo:
+    """A file-like object whose write() returns what it was given."""
+
+    def write(self, value):
+        """Return the value instead of storing it."""
+        return value
+
+
+def formatter(fmt):
+    """
+    Return the header line and the row formatter of an export format.
+
+    Raises:
+        ValueError: If the format is not one of FORMATS.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format '{fmt}'.")
+    if fmt == 'csv':
+        writer = csv.DictWriter(Echo(), FIELDS)
+        return writer.writeheader(), writer.writerow
+    return '', lambda row: json.dumps({f: row[f] for f in FIELDS}) + '\n'
+
+
+def export_lines(rows, fmt):
+    """Yield the rows of an iterable formatted as 'csv' or 'jsonl'."""
+    header, format_row = formatter(fmt)
+    if header:
+        yield header
+    for row in rows:
+        yield format_row(row)
+
+
+async def aexport_lines(rows, fmt):
+    """Yield the rows of an async iterable formatted as 'csv' or 'jsonl'."""
+    header, format_row = formatter(fmt)
+    if header:
+        yield header
+    async for row in rows:
+        yield format_row(row)
@@ -0,0 +1,176 @@
+"""
+Live results feed for the Polls application.
+
+The results stream (polls/<pk>/results/stream/) sends Server-Sent Events
+with the per-choice tallies of a question. All streams of a question in
+one process share a single channel: when a vote is cast, the channel
+reads the results once, through the results cache, and hands only the
+tallies that changed to every subscriber. Bursts of votes are coalesced
+into at most one update per POLLS_RESULTS_STREAM_INTERVAL seconds.
+
+Votes cast in other worker processes do not reach this process's
+channels directly, so each channel also rechecks the results every
+POLLS_RESULTS_STREAM_POLL seconds; that check is a cache hit unless the
+results version has changed.
+"""
+import asyncio
+import json
+import threading
+
+from django.conf import settings
+from django.dispatch import receiver
+
+from .cache import results_cache
+from .signals import tallies_recounted, vote_cast
+
+
+class Subscriber:
+    """One stream's pending changes, merged until the stream sends them."""
+
+    def __init__(self):
+        """Create a subscriber with nothing pending."""
+        self.pending = {}
+        self.ready = asyncio.Event()
+
+    def push(self, changes):
+        """Merge changed tallies into the pending ones."""
+        self.pending.update(changes)
+        self.ready.set()
+
+    def pop(self):
+        """Return and forget the pending changes."""
+        changes, self.pending = self.pending, {}
+        self.ready.clear()
+        return changes
+
+
+class Channel:
+    """The shared change feed of one question in one event loop."""
+
+    def __init__(self, feed, question_id, loop):
+        """Create a channel with no subscribers."""
+        self.feed = feed
+        self.question_id = question_id
+        self.loop = loop
+        self.subscribers = set()
+        self.tallies = None
+        self.changed = asyncio.Event()
+        self.task = None
+
+    async def load(self):
+        """Read the results and return the tallies that changed."""
+        results, _ = await results_cache.aget(self.question_id)
+        tallies = {row['id']: row['votes'] for row in results}
+        previous = self.tallies or {}
+        self.tallies = tallies
+        return {choice_id: votes for choice_id, votes in tallies.items()
+                if previous.get(choice_id) != votes}
+
+    async def run(self):
+        """Publish changed tallies to the subscribers until none are left."""
+        while self.subscribers:
+            try:
+                await asyncio.wait_for(self.changed.wait(), self.feed.poll)
+            except asyncio.TimeoutError:
+                pass
+            # Let the burst settle, and the vote's cache invalidation run.
+            await asyncio.sleep(self.feed.interval)
+            self.changed.clear()
+            changes = await self.load()
+            if changes:
+                for subscriber in self.subscribers:
+                    subscriber.push(changes)
+
+
+class ResultsFeed:
+    """
+    Process-wide registry of the channels of the questions being watched.
+
+    Attributes:
+        interval (float): Minimum seconds between two updates of a stream.
+        poll (float): Seconds between checks for votes cast elsewhere;
+            streams also send a keep-alive comment this often.
+    """
+
+    def __init__(self, interval, poll):
+        """Create a feed with no channels."""
+        self.interval = interval
+        self.poll = poll
+        self._channels = {}
+        self._lock = threading.Lock()
+
+    def notify(self, question_id):
+        """Wake the channel of a question; safe to call from any thread."""
+        with self._lock:
+            channel = self._channels.get(question_id)
+        if channel is not None and not channel.loop.is_closed():
+            channel.loop.call_soon_threadsafe(channel.changed.set)
+
+    async def _join(self, question_id, subscriber):
+        """Add a subscriber to the channel of a question in this loop."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            channel = self._channels.get(question_id)
+            if channel is None or channel.loop is not loop:
+                channel = Channel(self, question_id, loop)
+                self._channels[question_id] = channel
+        if channel.tallies is None:
+            await channel.load()
+        channel.subscribers.add(subscriber)
+        if channel.task is None or channel.task.done():
+            channel.task = loop.create_task(channel.run())
+        return channel
+
+    def _leave(self, channel, subscriber):
+        """Remove a subscriber and drop the channel once it is unused."""
+        channel.subscribers.discard(subscriber)
+        if not channel.subscribers:
+            channel.task.cancel()
+            with self._lock:
+                if self._channels.get(channel.question_id) is channel:
+                    del self._channels[channel.question_id]
+
+    async def stream(self, question_id):
+        """
+        Yield Server-Sent Events for a question.
+
+        The first event carries every tally, the following ones only the
+        tallies that changed. Both map choice ids to vote counts.
+        """
+        subscriber = Subscriber()
+        channel = await self._join(question_id, subscriber)
+        try:
+            yield self.event(question_id, channel.tallies)
+            while True:
+                try:
+                    await asyncio.wait_for(subscriber.ready.wait(), self.poll)
+                except asyncio.TimeoutError:
+                    yield ': keep-alive\n\n'
+                    continue
+                yield self.event(question_id, subscriber.pop())
+        finally:
+            self._leave(channel, subscriber)
+
+    @staticmethod
+    def event(question_id, tallies):
+        """Format tallies as a 'results' Server-Sent Event."""
+        data = json.dumps({'question': question_id, 'choices': tallies},
+                          separators=(',', ':'))
+        return f'event: results\ndata: {data}\n\n'
+
+
+results_feed = ResultsFeed(interval=settings.POLLS_RESULTS_STREAM_INTERVAL,
+                           poll=settings.POLLS_RESULTS_STREAM_POLL)
+
+
+@receiver(vote_cast)
+def notify_results_feed(sender, question_id, **kwargs):
+    """Tell the streams of a question that its results changed."""
+    results_feed.notify(question_id)
+
+
+@receiver(tallies_recounted)
+def notify_results_feed_of_recount(sender, question_ids, **kwargs):
+    """Tell the streams of recounted questions that their results changed."""
+    for question_id in question_ids:
+        results_feed.notify(question_id)
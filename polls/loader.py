@@ -0,0 +1,196 @@
+"""
+Streaming fixture loader for the Polls application.
+
+The load_polls command reads Django JSON fixtures and JSON Lines files
+one object at a time, instead of parsing whole files like loaddata, and
+writes them with bulk upserts. No model is saved one row at a time, so
+no signals are sent: the stored tallies are recounted and the cached
+results invalidated once everything is written.
+"""
+import hashlib
+import json
+from collections import Counter
+
+from django.core.management.color import no_style
+from django.core.serializers import base, python
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from .cache import results_cache
+from .models import Choice, Question, Vote
+
+# Characters between the objects of a JSON array or a JSON Lines file.
+SEPARATORS = ' \t\r\n[],'
+
+
+def iter_objects(stream, chunk_size=64 * 1024):
+    """
+    Yield the objects of a JSON array or JSON Lines text stream.
+
+    Only one chunk, plus the object being read, is held in memory.
+
+    Raises:
+        json.JSONDecodeError: If the stream is not valid JSON.
+    """
+    decoder = json.JSONDecoder()
+    buffer, eof = '', False
+    while True:
+        buffer = buffer.lstrip(SEPARATORS)
+        if buffer:
+            try:
+                obj, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                # The object may continue in the next chunk.
+                if eof:
+                    raise
+            else:
+                yield obj
+                buffer = buffer[end:]
+                continue
+        elif eof:
+            return
+        chunk = stream.read(chunk_size)
+        eof = not chunk
+        buffer += chunk
+
+
+def checksum(paths):
+    """Return the SHA-256 hex digest of the content of the files."""
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, 'rb') as f:
+            digest.update(hashlib.file_digest(f, 'sha256').digest())
+    return digest.hexdigest()
+
+
+class FixtureLoader:
+    """
+    Bulk-load fixture objects in batches.
+
+    Objects are queued per model and upserted by primary key once
+    batch_size of them are waiting, updating only the fields the fixture
+    gives. Foreign keys are written as the ids in the fixture, so they
+    need no lookups; votes without a question get the question of their
+    choice. Call load() inside a transaction and finish() at the end.
+
+    Attributes:
+        counts (Counter): Objects loaded per model label.
+    """
+
+    def __init__(self, batch_size=500, using=DEFAULT_DB_ALIAS):
+        """Create a loader with nothing queued."""
+        self.batch_size = batch_size
+        self.using = using
+        self.counts = Counter()
+        self._pending = {}
+        self._question_of_choice = {}
+        self._question_ids = set()
+        self._models = set()
+
+    def load(self, stream):
+        """Queue every object of a fixture stream, writing full batches."""
+        for data in iter_objects(stream):
+            deserialized = next(iter(python.Deserializer(
+                [data], using=self.using)))
+            self.add(deserialized, data.get('fields', {}))
+
+    def add(self, deserialized, fields):
+        """Queue one deserialized object given with the fixture fields."""
+        obj = deserialized.object
+        model = type(obj)
+        opts = model._meta
+        update_fields = tuple(name for name in fields
+                              if not opts.get_field(name).many_to_many)
+        key = (model, update_fields)
+        self._pending.setdefault(key, []).append(obj)
+        self._models.add(model)
+        self.counts[opts.label] += 1
+
+        if model is Question:
+            self._question_ids.add(obj.pk)
+        elif model is Choice:
+            self._question_of_choice[obj.pk] = obj.question_id
+            self._question_ids.add(obj.question_id)
+
+        for name, pks in (deserialized.m2m_data or {}).items():
+            self._add_m2m(opts.get_field(name), obj.pk, pks)
+
+        if len(self._pending[key]) >= self.batch_size:
+            self._flush(key)
+
+    def _add_m2m(self, field, pk, related_pks):
+        """Queue the many-to-many rows of an object."""
+        through = field.remote_field.through
+        source = f'{field.m2m_field_name()}_id'
+        target = f'{field.m2m_reverse_field_name()}_id'
+        key = (through, None)
+        self._pending.setdefault(key, []).extend(
+            through(**{source: pk, target: related_pk})
+            for related_pk in related_pks)
+        self._models.add(through)
+
+    def _flush(self, key):
+        """Upsert the queued objects of one model."""
+        model, update_fields = key
+        objs = self._pending.pop(key, [])
+        if not objs:
+            return
+        if model is Vote:
+            self._fill_questions(objs)
+        manager = model._base_manager.db_manager(self.using)
+        if update_fields:
+            manager.bulk_create(objs, update_conflicts=True,
+                                unique_fields=['pk'],
+                                update_fields=update_fields)
+        else:
+            manager.bulk_create(objs, ignore_conflicts=True)
+
+    def _fill_questions(self, votes):
+        """Set the question of votes that have none from their choice."""
+        missing = {vote.choice_id for vote in votes
+                   if vote.question_id is None
+                   and vote.choice_id not in self._question_of_choice}
+        if missing:
+            self._question_of_choice.update(
+                Choice.objects.using(self.using).filter(pk__in=missing)
+                .values_list('pk', 'question_id'))
+        for vote in votes:
+            if vote.question_id is None:
+                try:
+                    vote.question_id = self._question_of_choice[
+                        vote.choice_id]
+                except KeyError:
+                    raise base.DeserializationError(
+                        f"Vote {vote.pk} is for Choice {vote.choice_id}, "
+                        f"which does not exist.")
+            self._question_ids.add(vote.question_id)
+
+    def finish(self):
+        """
+        Write what is left and bring derived data up to date.
+
+        This checks the foreign keys of the loaded tables, resets their
+        primary key sequences, recounts stale tallies and invalidates
+        the cached results of the loaded questions.
+        """
+        for key in list(self._pending):
+            self._flush(key)
+        if not self._models:
+            return
+        connection = connections[self.using]
+        connection.check_constraints(
+            table_names=[model._meta.db_table for model in self._models])
+        sequence_sql = connection.ops.sequence_reset_sql(no_style(),
+                                                         self._models)
+        with connection.cursor() as cursor:
+            for sql in sequence_sql:
+                cursor.execute(sql)
+        stale = Choice.objects.using(self.using).stale_tallies()
+        Choice.objects.using(self.using).filter(
+            pk__in=list(stale.values_list('pk', flat=True))).recount()
+        question_ids = set(self._question_ids)
+
+        def invalidate_results():
+            for question_id in question_ids:
+                results_cache.invalidate(question_id)
+
+        transaction.on_commit(invalidate_results, using=self.using)
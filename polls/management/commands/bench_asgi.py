@@ -0,0 +1,130 @@
+"""Management command comparing the sync (WSGI) and async (ASGI) views."""
+import asyncio
+import importlib
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient, Client, override_settings
+from django.urls import clear_url_caches, reverse
+
+from polls.bench import seed, summarize, throwaway_database
+
+
+def use_polls_urls(async_views):
+    """Rebuild the project URLconf with the sync or the async poll views."""
+    with override_settings(POLLS_ASYNC_VIEWS=async_views):
+        import mysite.urls
+        importlib.reload(mysite.urls)
+    clear_url_caches()
+
+
+class Command(BaseCommand):
+    """
+    Drive the poll pages through the WSGI and the ASGI handlers.
+
+    The WSGI run uses one thread per concurrent client with the sync
+    views; the ASGI run uses one asyncio task per concurrent client with
+    the async views. Both run in-process against a throwaway database.
+    """
+
+    help = ("Compare the throughput of the sync views under WSGI with the "
+            "async views under ASGI at high concurrency.")
+
+    def add_arguments(self, parser):
+        """Add the command line options."""
+        parser.add_argument('--requests', type=int, default=2000,
+                            help="Requests per run (default 2000).")
+        parser.add_argument('--concurrency', type=int, default=100,
+                            help="Concurrent clients (default 100).")
+        parser.add_argument('--questions', type=int, default=200,
+                            help="Questions to seed (default 200).")
+        parser.add_argument('--users', type=int, default=100,
+                            help="Users to seed (default 100).")
+
+    def handle(self, *args, **options):
+        """Seed a throwaway database and run both benchmarks."""
+        with throwaway_database():
+            data = seed(users=options['users'],
+                        questions=options['questions'], choices=4,
+                        votes=options['users'] * 10)
+            urls = self.workload(data['questions'], options['requests'])
+            sessions = self.log_in(data['users'], options['concurrency'])
+            report = {
+                'wsgi': self.run_wsgi(urls, sessions),
+                'asgi': self.run_asgi(urls, sessions),
+            }
+        use_polls_urls(async_views=False)
+        self.stdout.write(json.dumps(report, indent=2))
+
+    @staticmethod
+    def workload(question_ids, requests):
+        """Return a random mix of index, detail and results page URLs."""
+        use_polls_urls(async_views=False)
+        urls = []
+        for _ in range(requests):
+            question_id = random.choice(question_ids)
+            urls.append(random.choice([
+                reverse('polls:index'),
+                reverse('polls:detail', args=[question_id]),
+                reverse('polls:results', args=[question_id]),
+            ]))
+        return urls
+
+    @staticmethod
+    def log_in(user_ids, concurrency):
+        """Return the session cookies of one logged-in user per client."""
+        users = list(User.objects.filter(pk__in=user_ids))
+        sessions = []
+        for number in range(concurrency):
+            client = Client()
+            client.force_login(users[number % len(users)])
+            sessions.append(client.cookies)
+        return sessions
+
+    @staticmethod
+    def run_wsgi(urls, sessions):
+        """Fetch the URLs with the sync views from a pool of threads."""
+        use_polls_urls(async_views=False)
+        local = threading.local()
+        free_sessions = iter(sessions)
+
+        def fetch(index):
+            if not hasattr(local, 'client'):
+                local.client = Client()
+                local.client.cookies = next(free_sessions)
+            started = time.perf_counter()
+            local.client.get(urls[index])
+            return time.perf_counter() - started
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(len(sessions)) as pool:
+            latencies = list(pool.map(fetch, range(len(urls))))
+        return summarize(latencies, time.perf_counter() - started)
+
+    @staticmethod
+    def run_asgi(urls, sessions):
+        """Fetch the URLs with the async views from concurrent tasks."""
+        use_polls_urls(async_views=True)
+        latencies = []
+        pending = iter(range(len(urls)))
+
+        async def client_task(cookies):
+            client = AsyncClient()
+            client.cookies = cookies
+            for index in pending:
+                started = time.perf_counter()
+                await client.get(urls[index])
+                latencies.append(time.perf_counter() - started)
+
+        async def run():
+            await asyncio.gather(*[client_task(cookies)
+                                   for cookies in sessions])
+
+        started = time.perf_counter()
+        asyncio.run(run())
+        return summarize(latencies, time.perf_counter() - started)
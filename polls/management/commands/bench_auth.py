@@ -0,0 +1,86 @@
+"""Management command benchmarking signup and authenticated requests."""
+import json
+import random
+import time
+from contextlib import nullcontext
+from unittest import mock
+
+from django.contrib.auth import authenticate, login
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from polls.bench import BENCH_PASSWORD, seed, summarize, throwaway_database
+
+from .bench_polls import Command as ViewBenchmark
+
+
+def login_after_authenticate(request, user, backend=None):
+    """Log in the way signup did before, checking the password again."""
+    login(request, authenticate(request, username=user.username,
+                                password=BENCH_PASSWORD))
+
+
+class Command(BaseCommand):
+    """
+    Time signups, and requests of logged-in users, before and after.
+
+    'before' signs up with the extra authenticate() call signup used to
+    make and loads the user from the database on every request; 'after'
+    logs the new user in directly and takes the user from the cache
+    (POLLS_USER_CACHE).
+    """
+
+    help = ("Compare signup and authenticated request latency with and "
+            "without the direct signup login and the user cache.")
+
+    def add_arguments(self, parser):
+        """Add the command line options."""
+        parser.add_argument('--signups', type=int, default=50,
+                            help="Signups per run (default 50).")
+        parser.add_argument('--requests', type=int, default=500,
+                            help="Authenticated requests per run "
+                                 "(default 500).")
+        parser.add_argument('--clients', type=int, default=20,
+                            help="Logged-in users making the requests "
+                                 "(default 20).")
+
+    def handle(self, *args, **options):
+        """Seed a throwaway database and run both modes."""
+        with throwaway_database():
+            data = seed(users=options['clients'], questions=20, choices=4,
+                        votes=0)
+            clients = ViewBenchmark.log_in(data['users'], options['clients'])
+            report = {}
+            for mode, user_cache, signup_login in (
+                    ('before', False, mock.patch('mysite.views.login',
+                                                 login_after_authenticate)),
+                    ('after', True, nullcontext())):
+                cache.clear()
+                with override_settings(POLLS_USER_CACHE=user_cache):
+                    with signup_login:
+                        signup = self.signup(mode, options['signups'])
+                    detail = ViewBenchmark.run(
+                        clients, options['requests'], lambda: (
+                            'get', reverse('polls:detail', args=[
+                                random.choice(data['questions'])]), None))
+                report[mode] = {'signup': signup, 'detail': detail}
+        self.stdout.write(json.dumps(report, indent=2))
+
+    @staticmethod
+    def signup(prefix, count):
+        """Sign up count new users, each from a new client."""
+        latencies, statuses = [], {}
+        started = time.perf_counter()
+        for number in range(count):
+            form = {'username': f'{prefix}{number}',
+                    'password1': BENCH_PASSWORD, 'password2': BENCH_PASSWORD}
+            request_started = time.perf_counter()
+            response = Client().post(reverse('signup'), form)
+            latencies.append(time.perf_counter() - request_started)
+            status = str(response.status_code)
+            statuses[status] = statuses.get(status, 0) + 1
+        summary = summarize(latencies, time.perf_counter() - started)
+        summary['status'] = statuses
+        return summary
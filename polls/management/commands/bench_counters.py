@@ -0,0 +1,107 @@
+"""Management command benchmarking many threads voting for one choice."""
+import json
+import os
+import tempfile
+import threading
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection, connections
+from django.test import override_settings
+
+from polls.bench import seed, summarize, throwaway_database
+from polls.models import Choice, Question, Vote
+
+
+class Command(BaseCommand):
+    """
+    Let many threads vote for the same two choices at once.
+
+    Each thread casts the first votes of its own users for one choice and
+    then changes them to the other, so both adding to and taking from a
+    tally are contended. The run is repeated with one counter per choice
+    and with sharded counters, each on a fresh question, and the final
+    tallies are checked against the Vote table.
+    """
+
+    help = ("Compare single and sharded vote counters with many threads "
+            "voting for the same choice.")
+
+    def add_arguments(self, parser):
+        """Add the command line options."""
+        parser.add_argument('--threads', type=int, default=32,
+                            help="Concurrent voters (default 32).")
+        parser.add_argument('--votes', type=int, default=20,
+                            help="Users voting in each thread "
+                                 "(default 20).")
+        parser.add_argument('--shards', type=int, default=16,
+                            help="Counter shards per choice in the sharded "
+                                 "run (default 16).")
+
+    def handle(self, *args, **options):
+        """Seed a throwaway database and run both counter modes."""
+        directory = tempfile.TemporaryDirectory()
+        if (connection.vendor == 'sqlite'
+                and not connection.settings_dict['TEST']['NAME']):
+            # An in-memory database cannot be shared by writing threads.
+            connection.settings_dict['TEST']['NAME'] = os.path.join(
+                directory.name, 'bench_counters.sqlite3')
+        threads, votes = options['threads'], options['votes']
+        with directory, throwaway_database():
+            data = seed(users=threads * votes, questions=2, choices=2,
+                        votes=0)
+            users = list(User.objects.filter(pk__in=data['users']))
+            report = {'database': connection.vendor}
+            for mode, shards, question_id in (
+                    ('single', 0, data['questions'][0]),
+                    ('sharded', options['shards'], data['questions'][1])):
+                with override_settings(POLLS_VOTE_COUNTER_SHARDS=shards):
+                    report[mode] = self.run(users, threads, question_id)
+                report[mode]['shards'] = shards
+        self.stdout.write(json.dumps(report, indent=2))
+
+    @staticmethod
+    def run(users, threads, question_id):
+        """
+        Vote from every thread at once and summarize the votes.
+
+        Returns:
+            dict: summarize() of the vote latencies, the number of failed
+                votes, and whether the tallies match the Vote table.
+        """
+        first, second = Choice.objects.filter(
+            question_id=question_id).order_by('pk')
+        first.question = second.question = Question.objects.get(
+            pk=question_id)
+        latencies, errors = [], []
+        start = threading.Barrier(threads)
+
+        def voter(own_users):
+            try:
+                start.wait()
+                for choice in (first, second):
+                    for user in own_users:
+                        started = time.perf_counter()
+                        try:
+                            Vote.objects.cast(user, choice)
+                        except OperationalError as e:
+                            errors.append(str(e))
+                            continue
+                        latencies.append(time.perf_counter() - started)
+            finally:
+                connections.close_all()
+
+        workers = [threading.Thread(target=voter,
+                                    args=(users[number::threads],))
+                   for number in range(threads)]
+        started = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        summary = summarize(latencies, time.perf_counter() - started)
+        summary['errors'] = len(errors)
+        summary['tallies_correct'] = not Choice.objects.filter(
+            question_id=question_id).stale_tallies().exists()
+        return summary
@@ -0,0 +1,137 @@
+"""Management command benchmarking the poll views on a synthetic dataset."""
+import json
+import random
+import time
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from polls.bench import seed, summarize, throwaway_database
+from polls.cache import results_cache
+from polls.models import Choice
+
+
+class Command(BaseCommand):
+    """
+    Seed a throwaway database and drive each poll view through the client.
+
+    Requests are made one at a time through the Django test client, so
+    the latencies are those of the view, middleware and database, without
+    a web server in front. The report is JSON, meant to be diffed between
+    releases.
+    """
+
+    help = ("Benchmark the index, detail, results and vote views on a "
+            "synthetic dataset and report latency, throughput and SQL "
+            "queries per view as JSON.")
+
+    def add_arguments(self, parser):
+        """Add the command line options."""
+        parser.add_argument('--users', type=int, default=100,
+                            help="Users to seed (default 100).")
+        parser.add_argument('--questions', type=int, default=200,
+                            help="Questions to seed (default 200).")
+        parser.add_argument('--choices', type=int, default=4,
+                            help="Choices per question (default 4).")
+        parser.add_argument('--votes', type=int, default=5000,
+                            help="Votes to seed (default 5000).")
+        parser.add_argument('--requests', type=int, default=500,
+                            help="Requests per view (default 500).")
+        parser.add_argument('--clients', type=int, default=20,
+                            help="Logged-in users making the requests "
+                                 "(default 20).")
+        parser.add_argument('--seed', type=int,
+                            help="Random seed, for a repeatable workload.")
+        parser.add_argument('--output', '-o',
+                            help="File to write the report to (default "
+                                 "standard output).")
+
+    def handle(self, *args, **options):
+        """Seed the data, run every view and write the report."""
+        random.seed(options['seed'])
+        dataset = {name: options[name]
+                   for name in ('users', 'questions', 'choices', 'votes')}
+        # Every client votes from the same address, far past the limits.
+        with throwaway_database(), override_settings(POLLS_RATE_LIMITS={}):
+            started = time.perf_counter()
+            data = seed(**dataset)
+            seconds = round(time.perf_counter() - started, 2)
+            cache.clear()
+            results_cache.clear()
+            clients = self.log_in(data['users'], options['clients'])
+            choices = list(Choice.objects.values_list('pk', 'question_id'))
+            requests = options['requests']
+            views = {
+                'index': self.run(clients, requests, lambda: (
+                    'get', reverse('polls:index'), None)),
+                'detail': self.run(clients, requests, lambda: (
+                    'get', reverse('polls:detail',
+                                   args=[random.choice(data['questions'])]),
+                    None)),
+                'results': self.run(clients, requests, lambda: (
+                    'get', reverse('polls:results',
+                                   args=[random.choice(data['questions'])]),
+                    None)),
+                'vote': self.run(clients, requests, lambda: (
+                    'post', *self.vote_request(random.choice(choices)))),
+            }
+        report = {'dataset': dict(dataset, seed_seconds=seconds),
+                  'views': views}
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+        else:
+            self.stdout.write(output)
+
+    @staticmethod
+    def log_in(user_ids, count):
+        """Return clients logged in as the first count users."""
+        clients = []
+        for user in User.objects.filter(pk__in=user_ids[:count]):
+            client = Client()
+            client.force_login(user)
+            clients.append(client)
+        return clients
+
+    @staticmethod
+    def vote_request(choice):
+        """Return the URL and form data of a vote for a choice."""
+        choice_id, question_id = choice
+        return reverse('polls:vote', args=[question_id]), {'choice': choice_id}
+
+    @staticmethod
+    def run(clients, requests, next_request):
+        """
+        Make requests from random clients and summarize them.
+
+        Args:
+            next_request: Returns the method, URL and data of a request.
+
+        Returns:
+            dict: summarize() of the latencies, the SQL queries per
+                request (mean and max), and the response status counts.
+        """
+        latencies, queries, statuses = [], [], {}
+        started = time.perf_counter()
+        for _ in range(requests):
+            method, url, data = next_request()
+            client = random.choice(clients)
+            with CaptureQueriesContext(connection) as captured:
+                request_started = time.perf_counter()
+                response = getattr(client, method)(url, data)
+                latencies.append(time.perf_counter() - request_started)
+            queries.append(len(captured))
+            status = str(response.status_code)
+            statuses[status] = statuses.get(status, 0) + 1
+        summary = summarize(latencies, time.perf_counter() - started)
+        summary['queries_mean'] = (round(sum(queries) / len(queries), 2)
+                                   if queries else 0)
+        summary['queries_max'] = max(queries, default=0)
+        summary['status'] = statuses
+        return summary
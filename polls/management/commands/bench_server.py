@@ -0,0 +1,143 @@
+"""Management command comparing runserver with the production server."""
+import json
+import signal
+import socket
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from polls.bench import summarize
+
+MANAGE = str(settings.BASE_DIR / 'manage.py')
+
+
+def free_port():
+    """Return a TCP port nobody is listening on."""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def fetch(url):
+    """Request a URL and return its status code and latency in seconds."""
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(url, timeout=30) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except OSError:
+        status = 'error'
+    return status, time.perf_counter() - started
+
+
+@contextmanager
+def running_server(argv, port):
+    """Run a server command until the block ends, then stop it gracefully."""
+    process = subprocess.Popen(argv, stdout=subprocess.DEVNULL,
+                               stderr=subprocess.DEVNULL)
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            if process.poll() is not None:
+                raise CommandError(f"{' '.join(argv)} exited with "
+                                   f"{process.returncode}.")
+            try:
+                socket.create_connection(('127.0.0.1', port),
+                                         timeout=1).close()
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise CommandError(f"{' '.join(argv)} did not start.")
+                time.sleep(0.2)
+        yield process
+    finally:
+        process.send_signal(signal.SIGTERM)
+        try:
+            process.wait(30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+class Command(BaseCommand):
+    """
+    Start each server on a free port and load it over real HTTP.
+
+    Unlike bench_polls and bench_asgi, which call the views in-process,
+    this measures the whole server: sockets, HTTP parsing and workers.
+    The servers use the configured database, and only GET requests are
+    made.
+    """
+
+    servers = {
+        'runserver': lambda port, options: [
+            'runserver', '--noreload', '--skip-checks', f'127.0.0.1:{port}'],
+        'wsgi': lambda port, options: [
+            'serve', '--bind', f'127.0.0.1:{port}'] + options,
+        'asgi': lambda port, options: [
+            'serve', '--asgi', '--bind', f'127.0.0.1:{port}'] + options,
+    }
+
+    help = ("Compare the requests per second of runserver with the "
+            "gunicorn production server (python manage.py serve).")
+
+    def add_arguments(self, parser):
+        """Add the command line options."""
+        parser.add_argument('--servers', default='runserver,wsgi',
+                            help="Comma-separated servers to run: "
+                                 "runserver, wsgi, asgi (default "
+                                 "runserver,wsgi).")
+        parser.add_argument('--path', action='append', dest='paths',
+                            help="Path to request, may be repeated "
+                                 "(default /polls/).")
+        parser.add_argument('--requests', type=int, default=2000,
+                            help="Requests per server (default 2000).")
+        parser.add_argument('--concurrency', type=int, default=16,
+                            help="Concurrent clients (default 16).")
+        parser.add_argument('--workers', type=int,
+                            help="Workers of the production server "
+                                 "(default from the CPU count).")
+
+    def handle(self, *args, **options):
+        """Benchmark every server in turn and print a JSON report."""
+        names = options['servers'].split(',')
+        unknown = set(names) - set(self.servers)
+        if unknown:
+            raise CommandError(f"Unknown servers: {', '.join(unknown)}.")
+        paths = options['paths'] or ['/polls/']
+        server_options = (['--workers', str(options['workers'])]
+                          if options['workers'] else [])
+        report = {}
+        for name in names:
+            port = free_port()
+            command = self.servers[name](port, server_options)
+            with running_server([sys.executable, MANAGE, *command], port):
+                urls = [f'http://127.0.0.1:{port}{paths[n % len(paths)]}'
+                        for n in range(options['requests'])]
+                report[name] = self.load(urls, options['concurrency'])
+        self.stdout.write(json.dumps(report, indent=2))
+
+    @staticmethod
+    def load(urls, concurrency):
+        """Fetch the URLs from concurrent threads and summarize them."""
+        # Warm up every worker before measuring.
+        with ThreadPoolExecutor(concurrency) as pool:
+            list(pool.map(fetch, urls[:concurrency * 4]))
+        started = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as pool:
+            results = list(pool.map(fetch, urls))
+        summary = summarize([latency for _, latency in results],
+                            time.perf_counter() - started)
+        statuses = {}
+        for status, _ in results:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        summary['status'] = statuses
+        return summary
@@ -0,0 +1,57 @@
+"""Management command folding the vote counter shards into Choice.votes."""
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from polls.models import ChoiceCounterShard
+
+
+class Command(BaseCommand):
+    """
+    Fold counter shards into their choices' tallies, a batch at a time.
+
+    Run it periodically (from cron, or with --interval as a long-running
+    process) while POLLS_VOTE_COUNTER_SHARDS is set, so the results query
+    sums a handful of shard rows per choice rather than one per shard
+    ever written, and once after turning sharding off.
+    """
+
+    help = ("Fold the vote counter shards into Choice.votes and delete "
+            "them.")
+
+    def add_arguments(self, parser):
+        """Add the command line options."""
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help="Choices folded per transaction "
+                                 "(default 500).")
+        parser.add_argument('--interval', type=float, default=0,
+                            help="Keep running, compacting every this "
+                                 "many seconds.")
+
+    def handle(self, *args, **options):
+        """Compact once, or every --interval seconds until interrupted."""
+        while True:
+            choices = self.compact(options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(
+                f"Compacted the counter shards of {choices} choices."))
+            if options['interval'] <= 0:
+                return
+            close_old_connections()
+            time.sleep(options['interval'])
+
+    @staticmethod
+    def compact(batch_size):
+        """Fold every shard, batch_size choices per transaction."""
+        compacted = 0
+        last_choice_id = 0
+        while True:
+            choice_ids = list(
+                ChoiceCounterShard.objects.filter(choice_id__gt=last_choice_id)
+                .order_by('choice_id').values_list('choice_id', flat=True)
+                .distinct()[:batch_size])
+            if not choice_ids:
+                return compacted
+            compacted += ChoiceCounterShard.objects.filter(
+                choice_id__in=choice_ids).compact()
+            last_choice_id = choice_ids[-1]
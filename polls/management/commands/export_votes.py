@@ -0,0 +1,48 @@
+"""Management command to export votes as CSV or JSON Lines."""
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from polls.exports import FORMATS, export_lines, parse_bound, vote_rows
+
+
+class Command(BaseCommand):
+    """Stream the votes, joined to their question, choice and user."""
+
+    help = ("Export votes as CSV or JSON Lines, optionally for one question "
+            "or for questions published in a date range.")
+
+    def add_arguments(self, parser):
+        """Add the command line options."""
+        parser.add_argument('--format', choices=sorted(FORMATS),
+                            default='csv', help="Output format (default csv).")
+        parser.add_argument('--question', type=int,
+                            help="Only export the votes of this question.")
+        parser.add_argument('--since', type=parse_bound,
+                            help="Only questions published on or after this "
+                                 "date or datetime.")
+        parser.add_argument('--until', type=parse_bound,
+                            help="Only questions published before this "
+                                 "date or datetime.")
+        parser.add_argument('--output', '-o',
+                            help="File to write (default standard output).")
+        parser.add_argument('--chunk-size', type=int,
+                            default=settings.POLLS_EXPORT_CHUNK_SIZE,
+                            help="Rows fetched at a time (default "
+                                 "POLLS_EXPORT_CHUNK_SIZE).")
+
+    def handle(self, *args, **options):
+        """Write the exported votes to the output."""
+        rows = vote_rows(question_id=options['question'],
+                         since=options['since'], until=options['until'])
+        rows = rows.iterator(chunk_size=options['chunk_size'])
+        lines = export_lines(rows, options['format'])
+        if not options['output']:
+            for line in lines:
+                self.stdout.write(line, ending='')
+            return
+        try:
+            with open(options['output'], 'w', newline='',
+                      encoding='utf-8') as f:
+                f.writelines(lines)
+        except OSError as e:
+            raise CommandError(f"Cannot write {options['output']}: {e}")
@@ -0,0 +1,73 @@
+"""Management command to stream fixture files into the database."""
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.base import DeserializationError
+from django.db import (DEFAULT_DB_ALIAS, IntegrityError, connections,
+                       transaction)
+
+from polls.loader import FixtureLoader, checksum
+from polls.models import LoadedFixture
+
+
+class Command(BaseCommand):
+    """
+    Load JSON fixtures or JSON Lines files with bulk upserts.
+
+    This is a faster loaddata for the data/ files: objects are streamed
+    and written in batches inside one transaction, and files whose
+    content was loaded before are skipped, so a container restart does
+    not load the same data again.
+    """
+
+    help = ("Load fixture files (JSON or JSON Lines) in batches, skipping "
+            "them if the same content was loaded before.")
+
+    def add_arguments(self, parser):
+        """Add the command line options."""
+        parser.add_argument('fixtures', nargs='+',
+                            help="Fixture files to load, in order.")
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help="Objects per INSERT (default 500).")
+        parser.add_argument('--force', action='store_true',
+                            help="Load the files even if they are unchanged.")
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS,
+                            help="Database to load into (default 'default').")
+
+    def handle(self, *args, **options):
+        """Load the fixtures unless their checksum was recorded before."""
+        paths = options['fixtures']
+        using = options['database']
+        try:
+            digest = checksum(paths)
+        except OSError as e:
+            raise CommandError(f"Cannot read fixture: {e}")
+
+        previous = (LoadedFixture.objects.using(using)
+                    .filter(checksum=digest).first())
+        if previous and not options['force']:
+            self.stdout.write(f"Fixtures unchanged since "
+                              f"{previous.loaded_at:%Y-%m-%d %H:%M}; "
+                              f"nothing to load.")
+            return
+
+        loader = FixtureLoader(batch_size=options['batch_size'],
+                               using=using)
+        connection = connections[using]
+        try:
+            with transaction.atomic(using=using), \
+                    connection.constraint_checks_disabled():
+                for path in paths:
+                    with open(path, encoding='utf-8') as stream:
+                        loader.load(stream)
+                loader.finish()
+                total = sum(loader.counts.values())
+                LoadedFixture.objects.using(using).update_or_create(
+                    checksum=digest,
+                    defaults={'files': ' '.join(paths),
+                              'objects_loaded': total})
+        except (ValueError, DeserializationError, IntegrityError) as e:
+            raise CommandError(f"Cannot load fixtures: {e}")
+
+        for label, count in sorted(loader.counts.items()):
+            self.stdout.write(f"{label}: {count}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Loaded {total} objects from {len(paths)} files."))
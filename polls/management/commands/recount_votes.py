@@ -0,0 +1,36 @@
+"""Management command to recompute and verify the stored vote tallies."""
+from django.core.management.base import BaseCommand, CommandError
+
+from polls.models import Choice
+
+
+class Command(BaseCommand):
+    """Compare the stored tallies with the Vote table and repair any drift."""
+
+    help = ("Recount the votes of every choice from the Vote table and "
+            "fix tallies that disagree.")
+
+    def add_arguments(self, parser):
+        """Add the command line options."""
+        parser.add_argument(
+            '--check', action='store_true',
+            help="Only verify the tallies; exit with an error on mismatch.")
+
+    def handle(self, *args, **options):
+        """Find stale tallies and either report or repair them."""
+        stale = list(Choice.objects.stale_tallies().order_by('pk'))
+        for choice in stale:
+            self.stdout.write(f"Choice {choice.pk}: stored {choice.tally}, "
+                              f"counted {choice.vote_count}")
+
+        if stale and not options['check']:
+            Choice.objects.filter(pk__in=[c.pk for c in stale]).recount()
+
+        if stale and options['check']:
+            raise CommandError(f"{len(stale)} choice tallies are out of "
+                               f"step with the Vote table.")
+        if stale:
+            self.stdout.write(self.style.SUCCESS(
+                f"Fixed {len(stale)} choice tallies."))
+        else:
+            self.stdout.write(self.style.SUCCESS("All tallies are correct."))
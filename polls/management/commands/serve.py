@@ -0,0 +1,62 @@
+"""Management command running the site on a multi-worker production server."""
+import importlib.util
+import os
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+CONFIG_FILE = settings.BASE_DIR / 'mysite' / 'gunicorn.conf.py'
+
+
+class Command(BaseCommand):
+    """
+    Replace this process with gunicorn serving mysite.
+
+    Workers, timeouts and hooks come from mysite/gunicorn.conf.py; the
+    options here override the most common ones. With --asgi the site is
+    served by uvicorn workers with the async poll views.
+    """
+
+    help = ("Serve the site with gunicorn: one worker per CPU, the app "
+            "preloaded, graceful reload (SIGHUP) and shutdown (SIGTERM).")
+
+    def add_arguments(self, parser):
+        """Add the command line options."""
+        parser.add_argument('--bind', '-b',
+                            help="Address to listen on, e.g. 0.0.0.0:8000 "
+                                 "(default GUNICORN_BIND).")
+        parser.add_argument('--workers', '-w', type=int,
+                            help="Worker processes (default WEB_CONCURRENCY, "
+                                 "or derived from the CPU count).")
+        parser.add_argument('--asgi', action='store_true',
+                            help="Serve mysite.asgi on uvicorn workers "
+                                 "with the async views.")
+
+    def handle(self, *args, **options):
+        """Exec gunicorn with the production configuration."""
+        required = ['gunicorn'] + (['uvicorn_worker'] if options['asgi']
+                                   else [])
+        for module in required:
+            if importlib.util.find_spec(module) is None:
+                raise CommandError(f"{module} is not installed; run "
+                                   f"pip install -r requirements.txt.")
+
+        # The workers read their settings from the environment.
+        if options['asgi']:
+            os.environ['GUNICORN_ASGI'] = 'True'
+            os.environ.setdefault('POLLS_ASYNC_VIEWS', 'True')
+        if options['bind']:
+            os.environ['GUNICORN_BIND'] = options['bind']
+        if options['workers']:
+            os.environ['WEB_CONCURRENCY'] = str(options['workers'])
+        os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mysite.settings')
+
+        application = ('mysite.asgi:application' if options['asgi']
+                       else 'mysite.wsgi:application')
+        argv = [sys.executable, '-m', 'gunicorn',
+                '--config', str(CONFIG_FILE),
+                '--chdir', str(settings.BASE_DIR), application]
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os.execv(sys.executable, argv)
@@ -0,0 +1,237 @@
+"""
+Prometheus metrics for the Polls application.
+
+Counters and histograms are kept in process as plain floats keyed by
+sample name and labels, updated under a lock. When POLLS_METRICS_DIR is
+set, each process keeps its values in its own memory-mapped file in that
+directory instead, and /metrics adds up the files of every process, so
+the numbers cover all the workers of a server whichever one is scraped.
+Files of workers that have exited keep counting, as they would for a
+single process, until the server restarts: gunicorn.conf.py removes them
+with clear_directory() when the master starts.
+
+Gauges (results cache and vote buffer state) describe the process
+that answers the scrape and are read at scrape time.
+"""
+import glob
+import mmap
+import os
+import re
+import struct
+import threading
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+from .signals import vote_cast
+
+# Upper bounds, in seconds, of the request latency histogram buckets.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+BUCKET_BOUND = re.compile(r'le="([^"]*)",?')
+
+METRICS = {
+    'polls_request_duration_seconds': (
+        'histogram', "Time to respond to a request, by URL name."),
+    'polls_votes_total': (
+        'counter', "Votes by outcome: created, changed or rejected."),
+    'polls_logins_total': (
+        'counter', "Login attempts by result: success or failure."),
+    'polls_rate_limited_total': (
+        'counter', "Requests refused by the rate limiter, by URL name."),
+    'polls_db_queries_total': (
+        'counter', "SQL statements executed in requests, by database."),
+    'polls_db_query_seconds_total': (
+        'counter', "Time spent executing SQL in requests, by database."),
+    'polls_db_connections_opened_total': (
+        'counter', "Database connections opened, by database."),
+}
+
+
+def sample_order(item):
+    """Sort samples by key, with histogram buckets by their numeric bound."""
+    key = item[0]
+    bound = BUCKET_BOUND.search(key)
+    if bound is None:
+        return key, 0.0
+    return BUCKET_BOUND.sub('', key), float(bound.group(1))
+
+
+def clear_directory(directory):
+    """Remove the process files in a metrics directory."""
+    for path in glob.glob(os.path.join(directory, 'metrics_*.db')):
+        os.remove(path)
+
+
+def sample_key(name, labels):
+    """Return the Prometheus sample name for a metric and its labels."""
+    if not labels:
+        return name
+    pairs = ','.join(f'{label}="{value}"'
+                     for label, value in sorted(labels.items()))
+    return f'{name}{{{pairs}}}'
+
+
+class MmapValues:
+    """
+    Float values stored by key in a memory-mapped file.
+
+    The file starts with the number of bytes in use, followed by entries
+    of a key length, the UTF-8 key padded to 8 bytes, and a double. Only
+    the owning process writes to it.
+    """
+
+    initial_size = 1 << 16
+
+    def __init__(self, path):
+        """Open or create the file at path."""
+        self._file = open(path, 'a+b')
+        if os.fstat(self._file.fileno()).st_size == 0:
+            self._file.truncate(self.initial_size)
+        self._map = mmap.mmap(self._file.fileno(), 0)
+        self._used = struct.unpack_from('i', self._map, 0)[0] or 8
+        self._positions = {key: position for key, position, _
+                           in self.entries(self._map, self._used)}
+
+    @staticmethod
+    def entries(data, used=None):
+        """Yield (key, value position, value) of the entries in data."""
+        if used is None:
+            used = struct.unpack_from('i', data, 0)[0]
+        position = 8
+        while position < used:
+            length = struct.unpack_from('i', data, position)[0]
+            key = bytes(data[position + 4:position + 4 + length]).decode()
+            position += 4 + length + (-(4 + length) % 8)
+            yield key, position, struct.unpack_from('d', data, position)[0]
+            position += 8
+
+    def add(self, key, amount):
+        """Add amount to the value of key."""
+        position = self._positions.get(key)
+        if position is None:
+            position = self._append(key)
+        value = struct.unpack_from('d', self._map, position)[0]
+        struct.pack_into('d', self._map, position, value + amount)
+
+    def _append(self, key):
+        """Add an entry for key with the value 0 and return its position."""
+        encoded = key.encode()
+        padding = -(4 + len(encoded)) % 8
+        size = 4 + len(encoded) + padding + 8
+        while self._used + size > len(self._map):
+            self._map.close()
+            self._file.truncate(os.fstat(self._file.fileno()).st_size * 2)
+            self._map = mmap.mmap(self._file.fileno(), 0)
+        start = self._used
+        struct.pack_into(f'i{len(encoded)}s{padding}xd', self._map, start,
+                         len(encoded), encoded, 0.0)
+        self._used += size
+        struct.pack_into('i', self._map, 0, self._used)
+        position = start + size - 8
+        self._positions[key] = position
+        return position
+
+
+class Metrics:
+    """Thread-safe counters and histograms, optionally shared by processes."""
+
+    def __init__(self, directory=''):
+        """Keep values in memory, or in directory if one is given."""
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._values = {}
+        self._pid = None
+        self._file = None
+
+    def _store(self):
+        """Return this process's mmap file, opening a new one after fork."""
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._file = MmapValues(os.path.join(
+                self.directory, f'metrics_{self._pid}.db'))
+        return self._file
+
+    def _add(self, key, amount):
+        """Add amount to a sample; the caller holds the lock."""
+        if self.directory:
+            self._store().add(key, amount)
+        else:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def inc(self, name, amount=1, **labels):
+        """Increase a counter."""
+        with self._lock:
+            self._add(sample_key(name, labels), amount)
+
+    def observe(self, name, value, **labels):
+        """Record a value in a histogram with the latency buckets."""
+        with self._lock:
+            for bound in LATENCY_BUCKETS:
+                self._add(sample_key(f'{name}_bucket',
+                                     dict(labels, le=str(bound))),
+                          1 if value <= bound else 0)
+            self._add(sample_key(f'{name}_bucket',
+                                 dict(labels, le='+Inf')), 1)
+            self._add(sample_key(f'{name}_sum', labels), value)
+            self._add(sample_key(f'{name}_count', labels), 1)
+
+    def samples(self):
+        """Return every sample, summed over all processes."""
+        if not self.directory:
+            with self._lock:
+                return dict(self._values)
+        totals = {}
+        for path in glob.glob(os.path.join(self.directory, 'metrics_*.db')):
+            with open(path, 'rb') as f:
+                data = f.read()
+            for key, _, value in MmapValues.entries(data):
+                totals[key] = totals.get(key, 0.0) + value
+        return totals
+
+    def clear(self):
+        """Forget this process's values (used by the tests)."""
+        with self._lock:
+            self._values.clear()
+
+
+def render(metrics, gauges):
+    """
+    Return the samples and gauges in the Prometheus text format.
+
+    Args:
+        metrics (Metrics): The counters and histograms.
+        gauges (dict): Gauge name to (help text, {sample key: value}).
+    """
+    samples = metrics.samples()
+    lines = []
+    for name, (kind, help_text) in METRICS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        lines.extend(f'{key} {value}' for key, value in sorted(
+            samples.items(), key=sample_order) if key.split('{')[0] in
+            (name, f'{name}_bucket', f'{name}_sum', f'{name}_count'))
+    for name, (help_text, values) in gauges.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} gauge')
+        lines.extend(f'{key} {value}'
+                     for key, value in sorted(values.items()))
+    return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics(settings.POLLS_METRICS_DIR)
+
+
+@receiver(vote_cast)
+def count_vote(sender, previous_choice_id, **kwargs):
+    """Count a vote that was written as created or changed."""
+    metrics.inc('polls_votes_total',
+                outcome='created' if previous_choice_id is None
+                else 'changed')
+
+
+@receiver(connection_created)
+def count_connection(sender, connection, **kwargs):
+    """Count a new database connection."""
+    metrics.inc('polls_db_connections_opened_total', alias=connection.alias)
@@ -0,0 +1,346 @@
+"""
+Middleware for the Polls application.
+
+MetricsMiddleware records the latency of every request by URL name for
+the /metrics endpoint.
+
+QueryInstrumentationMiddleware measures the SQL of every request with
+connection.execute_wrapper(), so it works without DEBUG. The query count
+and database time are sent in a Server-Timing header and logged on the
+'polls' logger; requests over the POLLS_SQL_* thresholds are logged as
+warnings together with their slowest and most repeated statements.
+
+ReplicaRoutingMiddleware lets the read-only poll views read from the
+replicas (polls.routers), except for a browser that has just written
+something: it reads from the primary for POLLS_PRIMARY_STICKY_SECONDS,
+so it sees its own vote.
+
+RateLimitMiddleware refuses POSTs to the views in POLLS_RATE_LIMITS with
+429 Too Many Requests once a client has used up its tokens
+(polls.ratelimit), before the view runs. A client over its IP limit is
+refused from the request alone; the user limit needs the user id from
+the session, which the database session backend loads with a query.
+
+CachedUserMiddleware replaces AuthenticationMiddleware, taking the user
+from the cache of polls.usercache when POLLS_USER_CACHE is set.
+
+The polls middleware runs in both the sync (WSGI) and the async (ASGI)
+handler chain, so Django never has to adapt the chain around it and the
+async views are not run in a thread per request.
+"""
+import heapq
+import logging
+import math
+import time
+from collections import Counter
+from contextlib import ExitStack
+from functools import partial
+
+from asgiref.sync import (iscoroutinefunction, markcoroutinefunction,
+                          sync_to_async)
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.db import connections
+from django.http import HttpResponse
+from django.utils.functional import SimpleLazyObject
+
+from .metrics import metrics
+from .ratelimit import check_rate, client_address
+from .routers import use_replicas
+from .usercache import get_user
+
+logger = logging.getLogger('polls')
+
+
+class QueryStats:
+    """
+    An execute wrapper that counts and times the statements it runs.
+
+    Attributes:
+        count (int): Statements executed.
+        duration (float): Seconds spent executing them.
+        statements (Counter): Executions of each SQL text.
+        by_alias (dict): Alias to [statements, seconds] of each database.
+    """
+
+    def __init__(self, keep_slowest):
+        """Create empty statistics keeping the keep_slowest statements."""
+        self.keep_slowest = keep_slowest
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter()
+        self.by_alias = {}
+        self._slowest = []
+
+    def __call__(self, execute, sql, params, many, context):
+        """Run a statement and record how long it took."""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.count += 1
+            self.duration += elapsed
+            self.statements[sql] += 1
+            alias = self.by_alias.setdefault(context['connection'].alias,
+                                             [0, 0.0])
+            alias[0] += 1
+            alias[1] += elapsed
+            if len(self._slowest) < self.keep_slowest:
+                heapq.heappush(self._slowest, (elapsed, sql))
+            elif self._slowest and elapsed > self._slowest[0][0]:
+                heapq.heapreplace(self._slowest, (elapsed, sql))
+
+    def slowest(self):
+        """Return (seconds, sql) of the slowest statements, slowest first."""
+        return sorted(self._slowest, reverse=True)
+
+    def repeated(self):
+        """Return how often the most repeated statement was executed."""
+        return max(self.statements.values(), default=0)
+
+
+class SyncAndAsyncMiddleware:
+    """
+    Base of middleware usable in sync and async handler chains.
+
+    Subclasses handle a request in __call__, which must hand it to
+    __acall__ when the next handler is a coroutine function.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        """Store the next handler in the chain."""
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+
+class MetricsMiddleware(SyncAndAsyncMiddleware):
+    """Record the latency of each request by URL name."""
+
+    def __call__(self, request):
+        """Time the request and add it to the latency histogram."""
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        started = time.perf_counter()
+        response = self.get_response(request)
+        self.observe(request, started)
+        return response
+
+    async def __acall__(self, request):
+        """Time the request of an async chain."""
+        started = time.perf_counter()
+        response = await self.get_response(request)
+        self.observe(request, started)
+        return response
+
+    @staticmethod
+    def observe(request, started):
+        """Add the time since started to the histogram of the view."""
+        match = request.resolver_match
+        if match is not None and match.url_name:
+            metrics.observe('polls_request_duration_seconds',
+                            time.perf_counter() - started,
+                            view=match.view_name)
+
+
+class QueryInstrumentationMiddleware(SyncAndAsyncMiddleware):
+    """Report the SQL queries and database time of each request."""
+
+    def __call__(self, request):
+        """Run the request with every database connection instrumented."""
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not settings.POLLS_SQL_INSTRUMENTATION:
+            return self.get_response(request)
+        stats = QueryStats(settings.POLLS_SQL_LOG_SLOWEST)
+        started = time.perf_counter()
+        with self.instrument(stats):
+            response = self.get_response(request)
+        return self.report(request, response, stats,
+                           time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        """Instrument the connections an async request's queries use."""
+        if not settings.POLLS_SQL_INSTRUMENTATION:
+            return await self.get_response(request)
+        stats = QueryStats(settings.POLLS_SQL_LOG_SLOWEST)
+        started = time.perf_counter()
+        # Async views query through sync_to_async(), in the thread kept
+        # for the request, whose connections are not this thread's.
+        stack = await sync_to_async(self.instrument)(stats)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+        return self.report(request, response, stats,
+                           time.perf_counter() - started)
+
+    @staticmethod
+    def instrument(stats):
+        """Return an ExitStack wrapping this thread's connections."""
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(stats))
+        return stack
+
+    def report(self, request, response, stats, total):
+        """Add the Server-Timing header, log the SQL and count it."""
+        if settings.POLLS_SQL_SERVER_TIMING:
+            response['Server-Timing'] = (
+                f'db;dur={stats.duration * 1000:.1f};'
+                f'desc="{stats.count} queries", '
+                f'total;dur={total * 1000:.1f}')
+        self.log(request, response, stats, total)
+        for alias, (count, duration) in stats.by_alias.items():
+            metrics.inc('polls_db_queries_total', count, alias=alias)
+            metrics.inc('polls_db_query_seconds_total', duration, alias=alias)
+        return response
+
+    @staticmethod
+    def log(request, response, stats, total):
+        """Log the request's SQL, as a warning if it is over a threshold."""
+        over_threshold = (
+            stats.count > settings.POLLS_SQL_MAX_QUERIES
+            or stats.repeated() > settings.POLLS_SQL_MAX_REPEATED
+            or stats.duration * 1000 > settings.POLLS_SQL_MAX_DB_MS)
+        if not over_threshold and not logger.isEnabledFor(logging.DEBUG):
+            return
+        match = request.resolver_match
+        line = (f"sql path={request.path} "
+                f"view={match.view_name if match else '-'} "
+                f"status={response.status_code} queries={stats.count} "
+                f"repeated={stats.repeated()} "
+                f"db_ms={stats.duration * 1000:.1f} "
+                f"total_ms={total * 1000:.1f}")
+        if not over_threshold:
+            logger.debug(line)
+            return
+        slowest = ' | '.join(f"{seconds * 1000:.1f}ms {sql}"
+                             for seconds, sql in stats.slowest())
+        repeated_sql = stats.statements.most_common(1)[0][0]
+        logger.warning(f"{line} over_threshold=1 slowest=[{slowest}] "
+                       f"most_repeated=[{repeated_sql}]")
+
+
+class ReplicaRoutingMiddleware(SyncAndAsyncMiddleware):
+    """
+    Read from the replicas in safe requests to the views that allow it.
+
+    A successful unsafe request (a vote, a signup, a login) sets a cookie
+    that keeps the browser on the primary until the replicas have caught
+    up with its write. A cookie rather than a session value, so it costs
+    no session write and works before login.
+    """
+
+    cookie_name = 'polls_primary'
+    safe_methods = ('GET', 'HEAD', 'OPTIONS')
+
+    def __call__(self, request):
+        """Make a successful write stick the browser to the primary."""
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = use_replicas.set(False)
+        try:
+            response = self.get_response(request)
+        finally:
+            use_replicas.reset(token)
+        return self.stick(request, response)
+
+    async def __acall__(self, request):
+        """Handle a request of an async chain like __call__()."""
+        token = use_replicas.set(False)
+        try:
+            response = await self.get_response(request)
+        finally:
+            use_replicas.reset(token)
+        return self.stick(request, response)
+
+    def stick(self, request, response):
+        """Set the primary cookie after a successful unsafe request."""
+        if (request.method not in self.safe_methods
+                and response.status_code < 400
+                and settings.POLLS_PRIMARY_STICKY_SECONDS > 0):
+            response.set_cookie(self.cookie_name, '1',
+                                max_age=settings.POLLS_PRIMARY_STICKY_SECONDS,
+                                httponly=True, samesite='Lax')
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        """Send the reads of an allowed view to the replicas."""
+        if (settings.POLLS_READ_REPLICAS
+                and request.method in self.safe_methods
+                and self.cookie_name not in request.COOKIES
+                and request.resolver_match.view_name
+                in settings.POLLS_REPLICA_VIEWS):
+            use_replicas.set(True)
+        return None
+
+
+class RateLimitMiddleware(SyncAndAsyncMiddleware):
+    """
+    Refuse POSTs to a rate limited view from clients out of tokens.
+
+    The IP bucket is checked first, from the request alone, so a flood
+    from one address is refused without a query. The user bucket is keyed
+    on the user id kept in the session, so it costs the session lookup
+    (a query with the database backend) but never loads the User row.
+    """
+
+    def __call__(self, request):
+        """Pass the request on; the check happens once the view is known."""
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        """Pass the request of an async chain on."""
+        return await self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        """Return a 429 response if the client is over the view's limit."""
+        view_name = request.resolver_match.view_name
+        if (request.method != 'POST'
+                or view_name not in settings.POLLS_RATE_LIMITS):
+            return None
+        keys = [f'ip:{client_address(request)}']
+        wait = check_rate(view_name, keys)
+        if not wait and settings.SESSION_COOKIE_NAME in request.COOKIES:
+            user_id = request.session.get(SESSION_KEY)
+            if user_id is not None:
+                wait = check_rate(view_name, [f'user:{user_id}'])
+        if not wait:
+            return None
+        metrics.inc('polls_rate_limited_total', view=view_name)
+        response = HttpResponse("Too many requests. Please try again later.",
+                                status=429, content_type='text/plain')
+        response['Retry-After'] = str(math.ceil(wait))
+        return response
+
+
+class CachedUserMiddleware(AuthenticationMiddleware):
+    """Set request.user and request.auser() from polls.usercache."""
+
+    def process_request(self, request):
+        """Attach the lazily loaded user of the session to the request."""
+        super().process_request(request)
+        request.user = SimpleLazyObject(partial(self.user, request))
+        request.auser = partial(self.auser, request)
+
+    @staticmethod
+    def user(request):
+        """Return the request's user, loading it on first use."""
+        if not hasattr(request, '_cached_user'):
+            request._cached_user = get_user(request)
+        return request._cached_user
+
+    @staticmethod
+    async def auser(request):
+        """Return the request's user from a coroutine."""
+        if not hasattr(request, '_acached_user'):
+            request._acached_user = await sync_to_async(get_user)(request)
+        return request._acached_user
@@ -0,0 +1,30 @@
+# Generated by Django 5.1.15 on 2026-10-18 09:00
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_existing_votes(apps, schema_editor):
+    """Fill the new tally column from the votes already recorded."""
+    Choice = apps.get_model('polls', 'Choice')
+    db_alias = schema_editor.connection.alias
+    choices = Choice.objects.using(db_alias).annotate(vote_count=Count('vote'))
+    for choice in choices.filter(vote_count__gt=0):
+        choice.votes = choice.vote_count
+        choice.save(update_fields=['votes'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0003_remove_choice_votes_vote'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='choice',
+            name='votes',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(count_existing_votes, migrations.RunPython.noop),
+    ]
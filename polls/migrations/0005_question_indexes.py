@@ -0,0 +1,21 @@
+# Generated by Django 5.1.15 on 2026-10-18 04:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0004_choice_votes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['pub_date', 'id'], name='polls_quest_pub_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['end_date'], name='polls_quest_end_idx'),
+        ),
+    ]
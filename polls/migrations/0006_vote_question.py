@@ -0,0 +1,54 @@
+# Generated by Django 5.1.15 on 2026-10-18 10:00
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+
+
+def fill_vote_question(apps, schema_editor):
+    """
+    Copy each vote's question from its choice and drop duplicate votes.
+
+    Only the newest vote of a user on a question is kept, which is the
+    one the old ``Vote.objects.get()`` lookups would have wanted.
+    """
+    Vote = apps.get_model('polls', 'Vote')
+    Choice = apps.get_model('polls', 'Choice')
+    db_alias = schema_editor.connection.alias
+    votes = Vote.objects.using(db_alias)
+    for vote in votes.select_related('choice').order_by('-pk'):
+        if votes.filter(user_id=vote.user_id,
+                        question_id=vote.choice.question_id).exists():
+            vote.delete()
+            Choice.objects.using(db_alias).filter(pk=vote.choice_id).update(
+                votes=F('votes') - 1)
+        else:
+            vote.question_id = vote.choice.question_id
+            vote.save(update_fields=['question'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0005_question_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vote',
+            name='question',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='polls.question'),
+        ),
+        migrations.RunPython(fill_vote_question, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='vote',
+            name='question',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='polls.question'),
+        ),
+        migrations.AddConstraint(
+            model_name='vote',
+            constraint=models.UniqueConstraint(fields=('user', 'question'), name='polls_vote_one_per_question'),
+        ),
+    ]
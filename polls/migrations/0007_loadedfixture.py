@@ -0,0 +1,23 @@
+# Generated by Django 5.1.15 on 2026-10-18 04:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0006_vote_question'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LoadedFixture',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('checksum', models.CharField(max_length=64, unique=True)),
+                ('files', models.TextField()),
+                ('objects_loaded', models.PositiveIntegerField()),
+                ('loaded_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
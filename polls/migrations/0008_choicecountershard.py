@@ -0,0 +1,26 @@
+# Generated by Django 5.1.15 on 2026-10-18 05:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0007_loadedfixture'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChoiceCounterShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shard', models.PositiveSmallIntegerField()),
+                ('votes', models.IntegerField(default=0)),
+                ('choice', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='counter_shards', to='polls.choice')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('choice', 'shard'), name='polls_counter_one_per_shard')],
+            },
+        ),
+    ]
@@ -1,10 +1,105 @@
 """Models for the Polls application, including Question, Choice, and Vote."""
 import datetime
-from django.db import models
+import random
+from django.conf import settings
+from django.db import IntegrityError, connections, models, transaction
+from django.db.models import (Case, Count, F, OuterRef, Q, Subquery, Sum,
+                              When)
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
 from django.utils import timezone
 from django.contrib import admin
 from django.contrib.auth.models import User
 
+from .signals import tallies_recounted, vote_cast
+
+
+class QuestionQuerySet(models.QuerySet):
+    """
+    Custom queryset that filters questions by publication status in SQL.
+
+    These mirror Question.is_published() and Question.can_vote(), so the
+    database (and the indexes on pub_date and end_date) does the work
+    instead of loading every question into Python.
+    """
+
+    def published(self):
+        """Return questions whose pub_date has been reached."""
+        return self.filter(pub_date__lte=timezone.now())
+
+    def open_for_voting(self):
+        """Return published questions that have not ended yet."""
+        now = timezone.now()
+        return self.filter(Q(end_date__isnull=True) | Q(end_date__gte=now),
+                           pub_date__lte=now)
+
+    def closed(self):
+        """Return published questions whose end_date has passed."""
+        now = timezone.now()
+        return self.filter(pub_date__lte=now, end_date__lt=now)
+
+    def with_status(self):
+        """
+        Annotate the status flags and the number of votes of each question.
+
+        published_recently, published_now and voting_open mirror
+        was_published_recently(), is_published() and can_vote(), and
+        total_votes counts the rows in Vote, so all of them can be sorted
+        on in SQL.
+        """
+        now = timezone.now()
+        return self.annotate(
+            published_recently=Case(
+                When(pub_date__gte=now - datetime.timedelta(days=1),
+                     pub_date__lte=now, then=True),
+                default=False, output_field=models.BooleanField()),
+            published_now=Case(
+                When(pub_date__lte=now, then=True),
+                default=False, output_field=models.BooleanField()),
+            voting_open=Case(
+                When(Q(end_date__isnull=True) | Q(end_date__gte=now),
+                     pub_date__lte=now, then=True),
+                default=False, output_field=models.BooleanField()),
+            total_votes=Count('vote'),
+        )
+
+    def tallies_for(self, question_ids):
+        """
+        Return the tallies of the published questions among question_ids.
+
+        The choices are outer-joined to the questions, so a question
+        without choices still gives one row, with None for the choice.
+
+        Returns:
+            QuerySet: (question id, choice id, choice_text, votes) tuples
+                ordered by question and choice, read in a single query.
+        """
+        shard_sum = (ChoiceCounterShard.objects
+                     .filter(choice=OuterRef('choice'))
+                     .values('choice').annotate(total=Sum('votes'))
+                     .values('total'))
+        return (self.published().filter(pk__in=question_ids)
+                .annotate(tally=F('choice__votes')
+                          + Coalesce(Subquery(shard_sum), 0))
+                .order_by('pk', 'choice')
+                .values_list('pk', 'choice', 'choice__choice_text', 'tally'))
+
+    def with_choice_of(self, user):
+        """
+        Annotate the id of the choice a user voted for, as user_choice_id.
+
+        The vote is read with a subquery in the same query as the
+        question. Anonymous users cannot have voted, so for them the
+        annotation is a NULL constant and no vote is looked up.
+        """
+        if not user.is_authenticated:
+            return self.annotate(user_choice_id=models.Value(
+                None, output_field=models.IntegerField()))
+        return self.annotate(user_choice_id=Subquery(
+            Vote.objects.filter(question=OuterRef('pk'), user=user)
+            .values('choice_id')[:1]))
+
 
 class Question(models.Model):
     """
@@ -18,6 +113,18 @@ class Question(models.Model):
     pub_date = models.DateTimeField('date published', default=timezone.now)
     end_date = models.DateTimeField('date ended', null=True, blank=True)
 
+    objects = QuestionQuerySet.as_manager()
+
+    class Meta:
+        """Indexes backing the QuestionQuerySet filters."""
+
+        indexes = [
+            # Serves published() and the (-pub_date, -id) keyset pagination.
+            models.Index(fields=['pub_date', 'id'],
+                         name='polls_quest_pub_id_idx'),
+            models.Index(fields=['end_date'], name='polls_quest_end_idx'),
+        ]
+
     def __str__(self):
         """
         Return the text of the question.
@@ -75,22 +182,92 @@ class Question(models.Model):
         return now >= self.pub_date
 
 
+class ChoiceQuerySet(models.QuerySet):
+    """Custom queryset for choices and their stored vote tallies."""
+
+    def with_vote_count(self):
+        """Annotate each choice with the number of votes counted from Vote."""
+        return self.annotate(vote_count=Count('vote'))
+
+    def with_tally(self):
+        """
+        Annotate each choice with its stored tally, as tally.
+
+        The tally is Choice.votes plus the sum of the choice's counter
+        shards, which all choices of a query get from one grouped
+        subquery.
+        """
+        shard_sum = (ChoiceCounterShard.objects.filter(choice=OuterRef('pk'))
+                     .values('choice').annotate(total=Sum('votes'))
+                     .values('total'))
+        return self.annotate(
+            tally=F('votes') + Coalesce(Subquery(shard_sum), 0))
+
+    def stale_tallies(self):
+        """Return choices whose stored tally disagrees with their votes."""
+        return (self.with_vote_count().with_tally()
+                .exclude(tally=F('vote_count')))
+
+    def recount(self):
+        """
+        Set the tallies of these choices from the Vote table.
+
+        The votes are counted inside the UPDATE, so votes cast meanwhile
+        are included, and the choices' counter shards are dropped in the
+        same transaction. update() sends no post_save, so
+        tallies_recounted is sent once the new tallies are committed.
+        Returns the number of choices updated.
+        """
+        vote_count = (Vote.objects.filter(choice=OuterRef('pk'))
+                      .values('choice').annotate(n=Count('pk'))
+                      .values('n'))
+        with transaction.atomic(using=self.db):
+            question_ids = set(self.values_list('question_id', flat=True))
+            ChoiceCounterShard.objects.db_manager(self.db).filter(
+                choice__in=self.values('pk')).delete()
+            updated = self.update(votes=Coalesce(Subquery(vote_count), 0))
+            transaction.on_commit(
+                lambda: tallies_recounted.send(sender=self.model,
+                                               question_ids=question_ids),
+                using=self.db)
+        return updated
+
+    def transfer_vote(self, from_choice_id, to_choice_id):
+        """
+        Move one vote between two tallies with a single atomic UPDATE.
+
+        Either id may be None, for a new vote (nothing to take from) or a
+        deleted one (nothing to give to). With POLLS_VOTE_COUNTER_SHARDS
+        set, the vote moves between counter shards instead.
+        """
+        if from_choice_id == to_choice_id:
+            return 0
+        if settings.POLLS_VOTE_COUNTER_SHARDS > 0:
+            deltas = {from_choice_id: -1, to_choice_id: 1}
+            deltas.pop(None, None)
+            return (ChoiceCounterShard.objects.db_manager(self.db)
+                    .add(deltas, settings.POLLS_VOTE_COUNTER_SHARDS))
+        return self.filter(pk__in=[from_choice_id, to_choice_id]).update(
+            votes=Case(When(pk=to_choice_id, then=F('votes') + 1),
+                       default=F('votes') - 1))
+
+
 class Choice(models.Model):
     """
     Represents a choice for a question in the poll.
     Attributes:
         question (Question): The question to which the choice belongs.
         choice_text (str): The text of the choice.
-        votes (int): The number of votes for this choice.
+        votes (int): The number of votes for this choice, kept in step
+            with the Vote table (see Vote.save and recount_votes). With
+            sharded counters, the votes of its ChoiceCounterShard rows
+            are added to it (see ChoiceQuerySet.with_tally).
     """
     question = models.ForeignKey(Question, on_delete=models.CASCADE)
     choice_text = models.CharField(max_length=200)
-    # votes = models.IntegerField(default=0)
+    votes = models.IntegerField(default=0)
 
-    @property
-    def votes(self):
-        """Count the votes for this choice."""
-        return self.vote_set.count()
+    objects = ChoiceQuerySet.as_manager()
 
     def __str__(self):
         """
@@ -102,8 +279,262 @@ class Choice(models.Model):
         return self.choice_text
 
 
+class ChoiceCounterShardQuerySet(models.QuerySet):
+    """Custom queryset that adds to and folds the counter shards."""
+
+    # Backends that understand INSERT ... ON CONFLICT DO UPDATE.
+    upsert_vendors = ('sqlite', 'postgresql')
+
+    def add(self, deltas, shards):
+        """
+        Add to the tallies of choices, each on a random one of its shards.
+
+        Concurrent voters for one choice then mostly lock different rows.
+        All deltas are written with one INSERT ... ON CONFLICT DO UPDATE,
+        in choice order so two writers never wait on each other in a
+        cycle. Returns the number of shards written.
+
+        Args:
+            deltas (dict): Choice id to the number of votes to add, which
+                may be negative.
+            shards (int): The number of shards of each choice.
+        """
+        rows = sorted((choice_id, random.randrange(shards), delta)
+                      for choice_id, delta in deltas.items() if delta)
+        if not rows:
+            return 0
+        connection = connections[self.db]
+        if connection.vendor not in self.upsert_vendors:
+            for choice_id, shard, delta in rows:
+                if not self.filter(choice_id=choice_id, shard=shard).update(
+                        votes=F('votes') + delta):
+                    self.create(choice_id=choice_id, shard=shard,
+                                votes=delta)
+            return len(rows)
+
+        table = connection.ops.quote_name(self.model._meta.db_table)
+        values = ', '.join(['(%s, %s, %s)'] * len(rows))
+        sql = (f"INSERT INTO {table} (choice_id, shard, votes) "
+               f"VALUES {values} "
+               f"ON CONFLICT (choice_id, shard) "
+               f"DO UPDATE SET votes = {table}.votes + EXCLUDED.votes")
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [value for row in rows for value in row])
+        return len(rows)
+
+    def compact(self):
+        """
+        Fold these shards into Choice.votes and delete them.
+
+        The shards are locked while they are read, so votes added to them
+        meanwhile wait and land in a fresh shard instead of being lost.
+        Returns the number of choices whose tally was updated.
+        """
+        with transaction.atomic(using=self.db):
+            rows = list(self.select_for_update()
+                        .values_list('pk', 'choice_id', 'votes'))
+            totals = {}
+            for _, choice_id, votes in rows:
+                totals[choice_id] = totals.get(choice_id, 0) + votes
+            totals = {pk: total for pk, total in totals.items() if total}
+            if totals:
+                Choice.objects.db_manager(self.db).filter(
+                    pk__in=totals).update(votes=Case(
+                        *[When(pk=pk, then=F('votes') + total)
+                          for pk, total in totals.items()],
+                        default=F('votes')))
+            self.model.objects.db_manager(self.db).filter(
+                pk__in=[pk for pk, _, _ in rows]).delete()
+        return len(totals)
+
+
+class ChoiceCounterShard(models.Model):
+    """
+    One of several counters that together hold part of a choice's tally.
+
+    Only used with POLLS_VOTE_COUNTER_SHARDS set: a choice's tally is then
+    Choice.votes plus the votes of its shards, until the
+    compact_vote_counters command folds the shards back into Choice.votes.
+    """
+
+    choice = models.ForeignKey(Choice, on_delete=models.CASCADE,
+                               related_name='counter_shards')
+    shard = models.PositiveSmallIntegerField()
+    votes = models.IntegerField(default=0)
+
+    objects = ChoiceCounterShardQuerySet.as_manager()
+
+    class Meta:
+        """One row per shard of a choice."""
+
+        constraints = [
+            models.UniqueConstraint(fields=['choice', 'shard'],
+                                    name='polls_counter_one_per_shard'),
+        ]
+
+    def __str__(self):
+        """Return the choice and shard number."""
+        return f"{self.choice_id}/{self.shard}: {self.votes}"
+
+
+class VotingClosed(Exception):
+    """Raised when a vote is cast on a question that is not open."""
+
+
+class VoteQuerySet(models.QuerySet):
+    """Custom queryset that records votes with as few round trips as possible."""
+
+    # Backends that understand INSERT ... ON CONFLICT ... RETURNING.
+    upsert_vendors = ('sqlite', 'postgresql')
+
+    def cast(self, user, choice):
+        """
+        Record the vote of a user for a choice, replacing any earlier vote.
+
+        A first vote is a single INSERT ... SELECT ... ON CONFLICT DO
+        NOTHING that only inserts when the choice's question is open, so
+        checking and writing cannot race with the poll closing. When the
+        user has voted before, the existing row is locked and re-pointed
+        at the new choice. Tallies are moved in the same transaction, and
+        the vote_cast signal is sent once it commits.
+
+        Args:
+            user (User): The voter.
+            choice (Choice): The selected choice.
+
+        Returns:
+            int or None: The id of the choice the user voted for before,
+                or None if this is their first vote on the question.
+
+        Raises:
+            VotingClosed: If the question is not open for voting.
+        """
+        with transaction.atomic(using=self.db):
+            if self._insert_if_open(user, choice):
+                previous_choice_id = None
+            else:
+                user_vote = self.filter(user=user,
+                                        question_id=choice.question_id)
+                previous_choice_id = (user_vote.select_for_update()
+                                      .values_list('choice_id', flat=True)
+                                      .first())
+                open_question = (Question.objects.open_for_voting()
+                                 .filter(pk=choice.question_id))
+                if not user_vote.filter(question__in=open_question).update(
+                        choice=choice):
+                    raise VotingClosed(f"Question {choice.question_id} "
+                                       f"is not open for voting.")
+            Choice.objects.db_manager(self.db).transfer_vote(
+                previous_choice_id, choice.pk)
+            transaction.on_commit(lambda: vote_cast.send(
+                sender=self.model, question_id=choice.question_id,
+                choice_id=choice.pk, previous_choice_id=previous_choice_id,
+                user=user), using=self.db)
+        return previous_choice_id
+
+    def _insert_if_open(self, user, choice):
+        """Insert a first vote; return False if it was not inserted."""
+        connection = connections[self.db]
+        if connection.vendor not in self.upsert_vendors:
+            if not (Question.objects.open_for_voting()
+                    .filter(pk=choice.question_id).exists()):
+                return False
+            try:
+                with transaction.atomic(using=self.db):
+                    self.bulk_create([self.model(user=user, choice=choice,
+                                                 question_id=choice.question_id)])
+            except IntegrityError:
+                return False
+            return True
+
+        quote = connection.ops.quote_name
+        now = connection.ops.adapt_datetimefield_value(timezone.now())
+        sql = (
+            f"INSERT INTO {quote(self.model._meta.db_table)} "
+            f"(user_id, question_id, choice_id) "
+            f"SELECT %s, q.id, c.id "
+            f"FROM {quote(Choice._meta.db_table)} c "
+            f"INNER JOIN {quote(Question._meta.db_table)} q "
+            f"ON q.id = c.question_id "
+            f"WHERE c.id = %s AND q.pub_date <= %s "
+            f"AND (q.end_date IS NULL OR q.end_date >= %s) "
+            f"ON CONFLICT (user_id, question_id) DO NOTHING "
+            f"RETURNING id"
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [user.pk, choice.pk, now, now])
+            return cursor.fetchone() is not None
+
+
 class Vote(models.Model):
-    """A vote by a user for a choice in a poll."""
+    """
+    A vote by a user for a choice in a poll.
+
+    The question is stored alongside the choice so that a user's vote on
+    a question is a single probe of the (user, question) unique index,
+    which also stops concurrent requests from recording two votes.
+    """
 
     choice = models.ForeignKey(Choice, on_delete=models.CASCADE)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
+    question = models.ForeignKey(Question, on_delete=models.CASCADE)
+
+    objects = VoteQuerySet.as_manager()
+
+    class Meta:
+        """One vote per user per question."""
+
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'question'],
+                                    name='polls_vote_one_per_question'),
+        ]
+
+    # Choice the row currently points at in the database, or None if unsaved.
+    _saved_choice_id = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Remember which choice a loaded vote was counted for."""
+        instance = super().from_db(db, field_names, values)
+        instance._saved_choice_id = instance.choice_id
+        return instance
+
+    def save(self, *args, **kwargs):
+        """
+        Save the vote and move its tally to the selected choice.
+
+        The counter updates use F() expressions and run in the same
+        transaction as the vote itself, so concurrent voters never
+        overwrite each other's increments.
+        """
+        if self.question_id is None:
+            self.question_id = self.choice.question_id
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+            Choice.objects.db_manager(self._state.db).transfer_vote(
+                self._saved_choice_id, self.choice_id)
+            self._saved_choice_id = self.choice_id
+
+
+@receiver(post_delete, sender=Vote)
+def discount_deleted_vote(sender, instance, using, **kwargs):
+    """Remove a deleted vote from its choice's tally."""
+    Choice.objects.db_manager(using).transfer_vote(instance.choice_id, None)
+
+
+class LoadedFixture(models.Model):
+    """
+    A set of fixture files loaded by the load_polls command.
+
+    The checksum covers the content of the files, so loading the same
+    data again can be skipped.
+    """
+
+    checksum = models.CharField(max_length=64, unique=True)
+    files = models.TextField()
+    objects_loaded = models.PositiveIntegerField()
+    loaded_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        """Return the loaded file names."""
+        return self.files
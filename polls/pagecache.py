@@ -0,0 +1,194 @@
+"""
+Full-page caching of the poll pages for anonymous visitors.
+
+A request with neither a session cookie nor a messages cookie cannot be
+logged in and has no messages to show, so its page is the same for every
+such visitor and can be served from Django's cache without touching the
+session, the user or the database. Other requests are never served from
+or stored in the page cache, nor are requests with query parameters the
+view does not read, so made-up query strings cannot fill the cache.
+
+Pages are stored under a site-wide generation, bumped when a question or
+choice is saved or deleted, plus an optional per-view version (the
+results page uses the question's results version, so votes invalidate
+only that question's page). A page also expires at the next pub_date or
+end_date of any question, so polls open and close on time.
+"""
+import functools
+import hashlib
+import math
+import time
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIRequest
+from django.db import router, transaction
+from django.db.models import Min, Q
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.cache import patch_vary_headers
+from django.utils.http import urlencode
+
+from .cache import results_cache
+from .models import Choice, Question
+
+GENERATION_KEY = 'polls:page:generation'
+
+
+def generation():
+    """Return the current generation of the cached pages."""
+    value = cache.get(GENERATION_KEY)
+    if value is None:
+        # Time based, like the results versions, so an evicted key never
+        # brings back pages stored under an older generation.
+        cache.add(GENERATION_KEY, time.time_ns() // 1000, None)
+        value = cache.get(GENERATION_KEY)
+    return value
+
+
+def invalidate_pages():
+    """Make every cached page unreachable."""
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.add(GENERATION_KEY, time.time_ns() // 1000, None)
+
+
+def is_cacheable(request, params):
+    """Return whether the request may be answered from the page cache."""
+    return (settings.POLLS_PAGE_CACHE
+            and request.method in ('GET', 'HEAD')
+            and settings.SESSION_COOKIE_NAME not in request.COOKIES
+            and CookieStorage.cookie_name not in request.COOKIES
+            and all(name in params for name in request.GET))
+
+
+def next_boundary():
+    """
+    Return when the next question is published or closes, or None.
+
+    The answer is cached for the current generation, so it is read from
+    the database once per question change rather than once per page. It
+    is read from the primary, which already has the change.
+    """
+    key = f'polls:page:boundary:{generation()}'
+    now = timezone.now()
+    boundary = cache.get(key)
+    if boundary is None or (boundary != 'none' and boundary <= now):
+        questions = Question.objects.using(router.db_for_write(Question))
+        upcoming = [moment for moment in questions.aggregate(
+            next_pub=Min('pub_date', filter=Q(pub_date__gt=now)),
+            next_end=Min('end_date', filter=Q(end_date__gte=now)),
+        ).values() if moment]
+        boundary = min(upcoming) if upcoming else 'none'
+        cache.set(key, boundary, settings.POLLS_PAGE_CACHE_TIMEOUT)
+    return None if boundary == 'none' else boundary
+
+
+def page_key(request, version, params):
+    """Return the cache key of the page for a request."""
+    query = urlencode([(name, request.GET[name]) for name in sorted(params)
+                       if name in request.GET])
+    path = hashlib.md5(f'{request.path}?{query}'.encode()).hexdigest()
+    server = 'asgi' if isinstance(request, ASGIRequest) else 'wsgi'
+    return f'polls:page:{generation()}:{version}:{server}:{path}'
+
+
+def lookup(request, version_of, params, kwargs):
+    """Return the cache key of a request's page and the cached page."""
+    version = version_of(**kwargs) if version_of else ''
+    key = page_key(request, version, params)
+    return key, cache.get(key)
+
+
+def store(key, response):
+    """Cache a response if it is a plain page shared by all visitors."""
+    if (response.status_code != 200 or response.streaming
+            or response.cookies or response.has_header('Set-Cookie')):
+        return
+    timeout = settings.POLLS_PAGE_CACHE_TIMEOUT
+    boundary = next_boundary()
+    if boundary is not None:
+        # Voting closes once end_date has passed, so expire just after it.
+        seconds = (boundary - timezone.now()).total_seconds()
+        timeout = min(timeout, max(1, math.ceil(seconds)))
+    cache.set(key, response, timeout)
+
+
+def finish(request, key, response):
+    """Mark a freshly rendered response and arrange for it to be cached."""
+    patch_vary_headers(response, ['Cookie'])
+    response['X-Page-Cache'] = 'miss'
+    if request.method != 'GET':
+        return response
+    if hasattr(response, 'render') and not response.is_rendered:
+        response.add_post_render_callback(lambda r: store(key, r))
+    else:
+        store(key, response)
+    return response
+
+
+def hit(response):
+    """Mark a response served from the page cache."""
+    response['X-Page-Cache'] = 'hit'
+    return response
+
+
+def results_page_version(pk):
+    """Return the results version of a question, for its results page."""
+    return results_cache.version(pk)
+
+
+def cache_anonymous_page(view=None, version_of=None, params=()):
+    """
+    Serve a sync or async view from the page cache for anonymous visitors.
+
+    Args:
+        view: The view function.
+        version_of: Optional callable given the view's URL keyword
+            arguments, returning a version to include in the cache key.
+        params: The query parameters the view reads. They are part of the
+            cache key, and a request with any other parameter is not cached.
+    """
+    if view is None:
+        return functools.partial(cache_anonymous_page, version_of=version_of,
+                                 params=params)
+
+    if iscoroutinefunction(view):
+        alookup = sync_to_async(lookup)
+
+        @functools.wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            if not is_cacheable(request, params):
+                return await view(request, *args, **kwargs)
+            key, response = await alookup(request, version_of, params,
+                                          kwargs)
+            if response is not None:
+                return hit(response)
+            response = await view(request, *args, **kwargs)
+            return await sync_to_async(finish)(request, key, response)
+
+        return async_wrapper
+
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not is_cacheable(request, params):
+            return view(request, *args, **kwargs)
+        key, response = lookup(request, version_of, params, kwargs)
+        if response is not None:
+            return hit(response)
+        return finish(request, key, view(request, *args, **kwargs))
+
+    return wrapper
+
+
+@receiver(post_save, sender=Question)
+@receiver(post_delete, sender=Question)
+@receiver(post_save, sender=Choice)
+@receiver(post_delete, sender=Choice)
+def invalidate_pages_on_change(sender, using, **kwargs):
+    """Drop the cached pages once a question or choice change commits."""
+    transaction.on_commit(invalidate_pages, using=using)
@@ -0,0 +1,178 @@
+"""
+Token-bucket rate limiting of the vote and login endpoints.
+
+Every view named in POLLS_RATE_LIMITS has a bucket per client IP and,
+once logged in, per user. A bucket holds up to `burst` tokens and is
+refilled at `rate`; each POST to the view takes a token from both of
+the client's buckets, and RateLimitMiddleware answers 429 with a
+Retry-After header when one is empty, before the view runs.
+
+The IP is REMOTE_ADDR or, behind POLLS_TRUSTED_PROXY_COUNT proxies, the
+X-Forwarded-For entry added by the outermost of them, never an entry the
+client could have written itself.
+
+A bucket is kept as the one time at which it will be full again (the
+generic cell rate algorithm), so a check reads and writes a single
+number. The 'local' backend keeps them in the process, which suits a
+single worker; the 'cache' backend keeps them in Django's cache, shared
+by every worker using the same cache server. It reads and writes without
+a lock, so workers racing on a key may let a few extra requests through
+but never refuse one that should pass.
+"""
+import functools
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def client_address(request):
+    """
+    Return the address a request came from, as seen by our own proxies.
+
+    Unlike audit.get_client_ip(), which reports the leftmost
+    X-Forwarded-For entry, this only trusts the entries appended by the
+    POLLS_TRUSTED_PROXY_COUNT proxies in front of the app.
+    """
+    proxies = settings.POLLS_TRUSTED_PROXY_COUNT
+    if proxies > 0:
+        hops = [hop.strip() for hop
+                in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',')
+                if hop.strip()]
+        if len(hops) >= proxies:
+            return hops[-proxies]
+    return request.META.get('REMOTE_ADDR')
+
+
+@functools.lru_cache
+def parse_rate(rate):
+    """
+    Parse a rate such as '30/m' into the seconds between two tokens.
+
+    Raises:
+        ImproperlyConfigured: If the rate is not a count per s, m, h or d.
+    """
+    count, _, period = rate.partition('/')
+    try:
+        return PERIODS[period.strip()] / int(count)
+    except (KeyError, ValueError, ZeroDivisionError):
+        raise ImproperlyConfigured(
+            f"A rate limit must look like '30/m', not {rate!r}.") from None
+
+
+class LocalBuckets:
+    """
+    Buckets kept in this process.
+
+    Only the max_keys most recently used buckets are remembered; a
+    forgotten client starts again with a full bucket.
+    """
+
+    def __init__(self, max_keys=10000):
+        """Create an empty store of at most max_keys buckets."""
+        self.max_keys = max_keys
+        self._full_at = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, interval, burst, now):
+        """
+        Take a token from a bucket.
+
+        Args:
+            key (str): The bucket.
+            interval (float): Seconds to refill one token.
+            burst (int): Tokens the bucket holds when full.
+            now (float): The current time.
+
+        Returns:
+            float: 0 if a token was taken, else seconds until there is one.
+        """
+        with self._lock:
+            full_at = max(self._full_at.get(key, now), now) + interval
+            wait = full_at - now - burst * interval
+            if wait > 0:
+                return wait
+            self._full_at[key] = full_at
+            self._full_at.move_to_end(key)
+            if len(self._full_at) > self.max_keys:
+                self._full_at.popitem(last=False)
+        return 0.0
+
+    def clear(self):
+        """Refill every bucket."""
+        with self._lock:
+            self._full_at.clear()
+
+
+class CacheBuckets:
+    """Buckets kept in Django's cache, shared by the worker processes."""
+
+    prefix = 'polls:ratelimit:'
+
+    def take(self, key, interval, burst, now):
+        """Take a token from a bucket, as LocalBuckets does."""
+        key = self.prefix + key
+        full_at = max(cache.get(key, now), now) + interval
+        wait = full_at - now - burst * interval
+        if wait > 0:
+            return wait
+        cache.set(key, full_at, math.ceil(full_at - now))
+        return 0.0
+
+
+BACKENDS = {'local': LocalBuckets(), 'cache': CacheBuckets()}
+
+
+@receiver(setting_changed)
+def refill_buckets(setting, **kwargs):
+    """Refill the local buckets when the rate limits are changed."""
+    if setting.startswith('POLLS_RATE_LIMIT'):
+        BACKENDS['local'].clear()
+
+
+def get_buckets():
+    """
+    Return the bucket store selected by POLLS_RATE_LIMIT_BACKEND.
+
+    Raises:
+        ImproperlyConfigured: If the backend is not 'local' or 'cache'.
+    """
+    try:
+        return BACKENDS[settings.POLLS_RATE_LIMIT_BACKEND]
+    except KeyError:
+        raise ImproperlyConfigured(
+            f"POLLS_RATE_LIMIT_BACKEND must be 'local' or 'cache', not "
+            f"{settings.POLLS_RATE_LIMIT_BACKEND!r}.") from None
+
+
+def check_rate(view_name, keys, now=None):
+    """
+    Take a token from each of a client's buckets for a view.
+
+    Args:
+        view_name (str): A view named in POLLS_RATE_LIMITS.
+        keys (list): The client's identities, e.g. ['ip:10.0.0.1'].
+        now (float): The current time, by default time.time().
+
+    Returns:
+        float: 0 if the request may proceed, else seconds to wait. The
+            buckets after the first empty one are left untouched.
+    """
+    limit = settings.POLLS_RATE_LIMITS[view_name]
+    interval = parse_rate(limit['rate'])
+    buckets = get_buckets()
+    now = time.time() if now is None else now
+    for key in keys:
+        wait = buckets.take(f'{view_name}:{key}', interval, limit['burst'],
+                            now)
+        if wait:
+            return wait
+    return 0.0
@@ -0,0 +1,57 @@
+"""
+Database routing between the primary and read replicas.
+
+Writes always go to the primary ('default'). Reads go to a replica
+listed in POLLS_READ_REPLICAS only while use_replicas is set, which
+ReplicaRoutingMiddleware does for safe requests to the views in
+POLLS_REPLICA_VIEWS, and reading_from_replicas() does for a block.
+Everything else, including the admin and the requests of a browser that
+has just written something, reads from the primary. Only the primary is
+migrated; the replicas copy its schema.
+
+The flag is a context variable, so it follows a request into the
+threads of sync_to_async() and stays out of concurrent requests.
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+# Whether reads in the current request or task may go to a replica.
+use_replicas = ContextVar('polls_use_replicas', default=False)
+
+
+@contextmanager
+def reading_from_replicas():
+    """Send the reads made in the block to the read replicas."""
+    token = use_replicas.set(True)
+    try:
+        yield
+    finally:
+        use_replicas.reset(token)
+
+
+class PrimaryReplicaRouter:
+    """Send reads to a random replica when allowed, writes to the primary."""
+
+    def db_for_read(self, model, **hints):
+        """Return a random replica if use_replicas is set, else the primary."""
+        if use_replicas.get() and settings.POLLS_READ_REPLICAS:
+            return random.choice(settings.POLLS_READ_REPLICAS)
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        """Return the primary."""
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        """Allow relations between objects read from any copy."""
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        """Never migrate a replica."""
+        if db in settings.POLLS_READ_REPLICAS:
+            return False
+        return None
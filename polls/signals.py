@@ -0,0 +1,10 @@
+"""Signals sent by the Polls application."""
+from django.dispatch import Signal
+
+# Sent after a vote has been committed, with the arguments question_id,
+# choice_id, previous_choice_id (None for a first vote) and user.
+vote_cast = Signal()
+
+# Sent after ChoiceQuerySet.recount() has committed repaired tallies, with
+# the argument question_ids.
+tallies_recounted = Signal()
@@ -0,0 +1,96 @@
+import datetime
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from polls.models import Question, Choice, Vote
+
+
+class QuestionAdminTests(TestCase):
+    def setUp(self):
+        """Log in a superuser and create questions with votes."""
+        self.admin = User.objects.create_superuser(
+            username='admin', password='testpassword123')
+        self.client.force_login(self.admin)
+        self.questions = []
+        for number in range(3):
+            question = Question.objects.create(
+                question_text=f'Question {number}',
+                end_date=timezone.now() + datetime.timedelta(days=1))
+            choice = Choice.objects.create(question=question,
+                                           choice_text='Choice')
+            for voter in range(number):
+                user = User.objects.create_user(username=f'v{number}{voter}')
+                Vote.objects.create(user=user, choice=choice)
+            self.questions.append(question)
+        self.changelist = reverse('admin:polls_question_changelist')
+
+    def test_changelist_query_count_does_not_grow(self):
+        """The changelist runs the same queries however many rows it has."""
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(self.changelist)
+        for number in range(10):
+            Question.objects.create(question_text=f'More {number}')
+        with CaptureQueriesContext(connection) as many:
+            self.client.get(self.changelist)
+        self.assertEqual(len(few), len(many))
+
+    def test_sort_by_total_votes(self):
+        """The changelist can be ordered by the annotated vote total."""
+        response = self.client.get(self.changelist, {'o': '-6'})
+        totals = [q.total_votes
+                  for q in response.context['cl'].result_list]
+        self.assertEqual([2, 1, 0], totals)
+
+    def run_action(self, action):
+        """Run an admin action on every question; return its UPDATEs."""
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(self.changelist, {
+                'action': action,
+                '_selected_action': [q.pk for q in self.questions]})
+        return [q['sql'] for q in queries
+                if q['sql'].startswith('UPDATE "polls_question"')]
+
+    def test_close_now(self):
+        """Closing is one UPDATE and ends voting."""
+        self.assertEqual(1, len(self.run_action('close_now')))
+        self.assertFalse(Question.objects.open_for_voting().exists())
+
+    def test_reopen(self):
+        """Reopening removes the end dates."""
+        Question.objects.update(
+            end_date=timezone.now() - datetime.timedelta(days=1))
+        self.assertEqual(1, len(self.run_action('reopen')))
+        self.assertEqual(3, Question.objects.open_for_voting().count())
+
+    def test_extend_end_date(self):
+        """Extending moves end dates a week later, or a week from now."""
+        closed = self.questions[0]
+        closed.end_date = timezone.now() - datetime.timedelta(days=30)
+        closed.save()
+        end_date = self.questions[1].end_date
+        self.assertEqual(1, len(self.run_action('extend_end_date')))
+        self.assertEqual(end_date + datetime.timedelta(days=7),
+                         Question.objects.get(pk=self.questions[1].pk)
+                         .end_date)
+        closed.refresh_from_db()
+        self.assertGreater(closed.end_date,
+                           timezone.now() + datetime.timedelta(days=6))
+
+    def test_choice_admin_counts_votes(self):
+        """The Choice admin shows votes counted from the Vote table."""
+        response = self.client.get(
+            reverse('admin:polls_choice_changelist'), {'o': '-3'})
+        counts = [c.vote_count for c in response.context['cl'].result_list]
+        self.assertEqual([2, 1, 0], counts)
+
+    def test_inline_shows_vote_count(self):
+        """The question change page shows the votes of each choice."""
+        response = self.client.get(reverse('admin:polls_question_change',
+                                           args=[self.questions[2].pk]))
+        self.assertContains(response, 'field-vote_count')
+        self.assertNotContains(response, 'name="choice_set-0-votes"')
@@ -0,0 +1,91 @@
+import datetime
+
+from asgiref.sync import AsyncToSync, SyncToAsync, iscoroutinefunction
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIHandler
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import include, path, reverse
+from django.utils import timezone
+
+from polls.cache import results_cache
+from polls.models import Question, Choice, Vote
+
+urlpatterns = [
+    path('polls/', include('polls.async_urls')),
+    path('accounts/', include('django.contrib.auth.urls')),
+]
+
+
+@override_settings(ROOT_URLCONF='polls.tests.test_async_views')
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        """Create a question with a choice, a voter and empty caches."""
+        cache.clear()
+        results_cache.clear()
+        self.user = User.objects.create_user(username='tester',
+                                             password='testpassword123')
+        self.question = Question.objects.create(question_text='Question')
+        self.choice = Choice.objects.create(question=self.question,
+                                            choice_text='Choice')
+
+    async def test_index(self):
+        """The async index lists published questions only."""
+        future = timezone.now() + datetime.timedelta(days=30)
+        await Question.objects.acreate(question_text='Future',
+                                       pub_date=future)
+        response = await self.async_client.get(reverse('polls:index'))
+        self.assertEqual([self.question],
+                         response.context['latest_question_list'])
+
+    async def test_detail_shows_previous_vote(self):
+        """The async detail page checks the user's previous choice."""
+        await self.async_client.aforce_login(self.user)
+        await Vote.objects.acreate(user=self.user, question=self.question,
+                                   choice=self.choice)
+        response = await self.async_client.get(
+            reverse('polls:detail', args=[self.question.id]))
+        self.assertContains(response, 'checked')
+
+    async def test_detail_of_missing_question_redirects(self):
+        """A missing question redirects to the index page."""
+        response = await self.async_client.get(
+            reverse('polls:detail', args=[999]))
+        self.assertRedirects(response, reverse('polls:index'),
+                             fetch_redirect_response=False)
+
+    async def test_vote_and_results(self):
+        """Voting through the async view shows up in the async results."""
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.post(
+            reverse('polls:vote', args=[self.question.id]),
+            {'choice': self.choice.id})
+        results_url = reverse('polls:results', args=[self.question.id])
+        self.assertRedirects(response, results_url,
+                             fetch_redirect_response=False)
+        response = await self.async_client.get(results_url)
+        self.assertEqual(1, response.context['results'][0]['votes'])
+
+    async def test_vote_requires_login(self):
+        """Anonymous voters are sent to the login page."""
+        response = await self.async_client.post(
+            reverse('polls:vote', args=[self.question.id]),
+            {'choice': self.choice.id})
+        self.assertEqual(302, response.status_code)
+        self.assertFalse(await Vote.objects.aexists())
+
+
+class AsyncMiddlewareChainTests(SimpleTestCase):
+    def test_chain_is_not_adapted(self):
+        """Every middleware runs in the async chain without a thread."""
+        handler = ASGIHandler()._middleware_chain
+        self.assertTrue(iscoroutinefunction(handler))
+        middleware = []
+        while handler is not None:
+            handler = getattr(handler, '__wrapped__', handler)
+            self.assertNotIsInstance(handler, (AsyncToSync, SyncToAsync))
+            middleware.append(handler)
+            handler = getattr(handler, 'get_response', None)
+        # The middleware instances and the handler's own get_response.
+        self.assertEqual(len(settings.MIDDLEWARE) + 1, len(middleware))
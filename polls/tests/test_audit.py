@@ -0,0 +1,73 @@
+import json
+import logging
+import os
+import shutil
+import tempfile
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.urls import reverse
+
+from polls.audit import JsonFormatter, QueuedHandler, audit, audit_logger
+from polls.models import Question, Choice
+
+
+class Unformattable:
+    """A log argument that fails the test if it is ever formatted."""
+
+    def __str__(self):
+        """Fail: disabled levels must not format their arguments."""
+        raise AssertionError("formatted a disabled log message")
+
+
+class AuditLogTests(TestCase):
+    def setUp(self):
+        """Send audit records to a JSON file in a temporary directory."""
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, 'audit.log')
+        self.handler = QueuedHandler(
+            'logging.handlers.RotatingFileHandler', filename=self.path,
+            maxBytes=1024 * 1024, backupCount=1)
+        self.handler.setFormatter(JsonFormatter())
+        audit_logger.addHandler(self.handler)
+        self.addCleanup(audit_logger.removeHandler, self.handler)
+        self.user = User.objects.create_user(username='tester',
+                                             password='testpassword123')
+        self.question = Question.objects.create(question_text='Question')
+        self.choice = Choice.objects.create(question=self.question,
+                                            choice_text='Choice')
+
+    def records(self):
+        """Write the queued records and return them as dicts."""
+        self.handler.close()
+        with open(self.path) as f:
+            return [json.loads(line) for line in f]
+
+    def test_vote_is_a_json_record(self):
+        """A vote is written with its user, question, choice and IP."""
+        self.client.force_login(self.user)
+        self.client.post(reverse('polls:vote', args=[self.question.id]),
+                         {'choice': self.choice.id})
+        vote = [r for r in self.records() if r['event'] == 'vote'][0]
+        self.assertEqual(self.user.id, vote['user_id'])
+        self.assertEqual(self.question.id, vote['question_id'])
+        self.assertEqual(self.choice.id, vote['choice_id'])
+        self.assertEqual('127.0.0.1', vote['ip'])
+        self.assertIn('time', vote)
+
+    def test_failed_login_is_a_warning(self):
+        """A failed login records the username that was tried."""
+        self.client.post(reverse('login'), {'username': 'tester',
+                                            'password': 'wrong'})
+        record = self.records()[0]
+        self.assertEqual(('login_failed', 'WARNING', 'tester'),
+                         (record['event'], record['level'],
+                          record['username']))
+
+    def test_disabled_level_is_not_formatted(self):
+        """Nothing is formatted for a level the logger does not log."""
+        audit_logger.setLevel(logging.ERROR)
+        self.addCleanup(audit_logger.setLevel, logging.INFO)
+        audit('vote', "%s voted", Unformattable())
+        self.assertEqual([], self.records())
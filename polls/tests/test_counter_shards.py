@@ -0,0 +1,82 @@
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from polls.cache import results_cache
+from polls.models import Question, Choice, ChoiceCounterShard, Vote
+
+
+@override_settings(POLLS_VOTE_COUNTER_SHARDS=4)
+class CounterShardTests(TestCase):
+    def setUp(self):
+        """Create a question with two choices and three voters."""
+        cache.clear()
+        results_cache.clear()
+        self.question = Question.objects.create(question_text='Question')
+        self.first = Choice.objects.create(question=self.question,
+                                           choice_text='First')
+        self.second = Choice.objects.create(question=self.question,
+                                            choice_text='Second')
+        self.users = [User.objects.create_user(username=f'voter{n}')
+                      for n in range(3)]
+
+    def tallies(self):
+        """Return the tallies of both choices."""
+        tally = dict(Choice.objects.with_tally().values_list('pk', 'tally'))
+        return tally[self.first.pk], tally[self.second.pk]
+
+    def test_votes_go_to_shards(self):
+        """Votes are added to shards, not to Choice.votes."""
+        for user in self.users:
+            Vote.objects.cast(user, self.first)
+        self.first.refresh_from_db()
+        self.assertEqual(0, self.first.votes)
+        self.assertEqual((3, 0), self.tallies())
+        shards = ChoiceCounterShard.objects.filter(choice=self.first)
+        self.assertTrue(all(0 <= shard.shard < 4 for shard in shards))
+
+    def test_changed_vote_moves_between_shards(self):
+        """Changing a vote takes it off the old choice's shards."""
+        Vote.objects.cast(self.users[0], self.first)
+        Vote.objects.cast(self.users[0], self.second)
+        self.assertEqual((0, 1), self.tallies())
+        self.assertFalse(Choice.objects.stale_tallies().exists())
+
+    def test_results_sum_shards(self):
+        """The results page and API include the shards."""
+        Choice.objects.filter(pk=self.first.pk).update(votes=5)
+        Vote.objects.cast(self.users[0], self.first)
+        results, _ = results_cache.get(self.question.pk)
+        self.assertEqual([6, 0], [row['votes'] for row in results])
+        response = self.client.get(reverse('polls:results_api'),
+                                   {'ids': self.question.pk})
+        self.assertEqual(
+            6, response.json()['results'][str(self.question.pk)]['total'])
+
+    def test_results_read_in_one_query(self):
+        """Summing the shards costs no extra query."""
+        Vote.objects.cast(self.users[0], self.first)
+        with self.assertNumQueries(1):
+            self.tallies()
+
+    def test_compaction(self):
+        """Compaction folds the shards into Choice.votes."""
+        for user in self.users:
+            Vote.objects.cast(user, self.first)
+        Vote.objects.cast(self.users[0], self.second)
+        call_command('compact_vote_counters', stdout=StringIO())
+        self.assertFalse(ChoiceCounterShard.objects.exists())
+        self.first.refresh_from_db()
+        self.second.refresh_from_db()
+        self.assertEqual((2, 1), (self.first.votes, self.second.votes))
+
+    def test_recount_drops_shards(self):
+        """Recounting sets Choice.votes from the votes and drops shards."""
+        Vote.objects.cast(self.users[0], self.first)
+        Choice.objects.all().recount()
+        self.assertFalse(ChoiceCounterShard.objects.exists())
+        self.assertEqual((1, 0), self.tallies())
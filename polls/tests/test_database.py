@@ -0,0 +1,27 @@
+from unittest import skipUnless
+
+from django.conf import settings
+from django.db import connection
+from django.test import TestCase
+
+
+@skipUnless(connection.vendor == 'sqlite', "SQLite connection settings")
+class SQLiteConnectionTests(TestCase):
+    def pragma(self, name):
+        """Return the value of a pragma on the test connection."""
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_synchronous_is_normal(self):
+        """Commits only fsync at WAL checkpoints."""
+        self.assertEqual(1, self.pragma('synchronous'))
+
+    def test_busy_timeout(self):
+        """A locked database is waited for rather than failing at once."""
+        timeout = settings.DATABASES['default']['OPTIONS']['timeout']
+        self.assertEqual(timeout * 1000, self.pragma('busy_timeout'))
+
+    def test_transactions_take_the_write_lock(self):
+        """Transactions begin IMMEDIATE, so voters queue for the lock."""
+        self.assertEqual('IMMEDIATE', connection.transaction_mode)
@@ -0,0 +1,74 @@
+"""Tests of the queries and the cached choice list of the detail page."""
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+
+from polls.models import Choice, Question, Vote
+
+
+class DetailViewTests(TestCase):
+    """The detail page costs a constant number of queries."""
+
+    def setUp(self):
+        """Create a question with a few choices and a user."""
+        cache.clear()
+        self.question = Question.objects.create(question_text='Lunch?')
+        self.choices = [Choice.objects.create(question=self.question,
+                                              choice_text=text)
+                        for text in ('Rice', 'Noodles', 'Soup')]
+        self.user = User.objects.create_user('voter', password='pw12345!')
+        self.url = reverse('polls:detail', args=[self.question.id])
+
+    def test_anonymous_user_has_no_vote_lookup(self):
+        """Anonymous visitors need the question and, once, the choices."""
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url)
+        self.assertContains(response, 'Noodles')
+        self.assertNotContains(response, 'checked')
+        with self.assertNumQueries(1):
+            self.client.get(self.url)
+
+    def test_previous_vote_is_read_with_the_question(self):
+        """The user's vote costs no query of its own."""
+        Vote.objects.create(user=self.user, question=self.question,
+                            choice=self.choices[1])
+        self.client.force_login(self.user)
+        # Session, user, question with the vote, choices.
+        with self.assertNumQueries(4):
+            response = self.client.get(self.url)
+        self.assertEqual(self.choices[1].id,
+                         response.context['question'].user_choice_id)
+        self.assertContains(response, 'checked', count=1)
+        with self.assertNumQueries(3):
+            self.client.get(self.url)
+
+    def test_cached_fragment_follows_the_users_choice(self):
+        """Users with different votes do not share a cached choice list."""
+        self.client.get(self.url)
+        Vote.objects.create(user=self.user, question=self.question,
+                            choice=self.choices[2])
+        self.client.force_login(self.user)
+        response = self.client.get(self.url)
+        self.assertRegex(response.content.decode(),
+                         rf'value="{self.choices[2].id}"\s*checked')
+
+    def test_choice_change_invalidates_fragment(self):
+        """Editing a choice shows up on the next request."""
+        self.client.get(self.url)
+        choice = self.choices[0]
+        with self.captureOnCommitCallbacks(execute=True):
+            choice.choice_text = 'Bread'
+            choice.save()
+        response = self.client.get(self.url)
+        self.assertContains(response, 'Bread')
+        self.assertNotContains(response, 'Rice')
+
+    def test_other_questions_keep_the_fragment(self):
+        """A change to another question does not evict the choice list."""
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            other = Question.objects.create(question_text='Dinner?')
+            Choice.objects.create(question=other, choice_text='Pasta')
+        with self.assertNumQueries(1):
+            self.client.get(self.url)
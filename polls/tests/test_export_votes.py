@@ -0,0 +1,88 @@
+import csv
+import datetime
+import io
+import json
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from polls.models import Question, Choice, Vote
+
+
+class ExportVotesTests(TestCase):
+    def setUp(self):
+        """Create an old and a new question with one vote each."""
+        self.staff = User.objects.create_user(username='staff', is_staff=True,
+                                              password='testpassword123')
+        self.voter = User.objects.create_user(username='voter',
+                                              password='testpassword123')
+        self.old = Question.objects.create(
+            question_text='Old',
+            pub_date=timezone.now() - datetime.timedelta(days=30))
+        self.new = Question.objects.create(question_text='New')
+        for question in (self.old, self.new):
+            choice = Choice.objects.create(question=question,
+                                           choice_text=f'{question} yes')
+            Vote.objects.create(user=self.voter, choice=choice)
+
+    def export(self, *args):
+        """Run export_votes and return its output."""
+        out = io.StringIO()
+        call_command('export_votes', *args, stdout=out)
+        return out.getvalue()
+
+    def test_csv(self):
+        """The CSV export has a header and one row per vote."""
+        rows = list(csv.DictReader(io.StringIO(self.export())))
+        self.assertEqual(['Old', 'New'],
+                         [row['question_text'] for row in rows])
+        self.assertEqual({'voter'}, {row['username'] for row in rows})
+
+    def test_jsonl_for_one_question(self):
+        """The JSON Lines export can be limited to one question."""
+        lines = self.export('--format', 'jsonl',
+                            '--question', str(self.new.id)).splitlines()
+        self.assertEqual(1, len(lines))
+        self.assertEqual('New yes', json.loads(lines[0])['choice_text'])
+
+    def test_date_range(self):
+        """The date range filters on the question's publication date."""
+        since = (timezone.localdate() - datetime.timedelta(days=1))
+        rows = list(csv.DictReader(io.StringIO(
+            self.export('--since', since.isoformat()))))
+        self.assertEqual(['New'], [row['question_text'] for row in rows])
+
+    def test_download_is_staff_only(self):
+        """Users who are not staff are sent to the admin login."""
+        self.client.force_login(self.voter)
+        response = self.client.get(reverse('polls:export_votes'))
+        self.assertEqual(302, response.status_code)
+
+    def test_download(self):
+        """Staff download the export as a streamed attachment."""
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('polls:export_votes'),
+                                   {'format': 'jsonl'})
+        self.assertTrue(response.streaming)
+        self.assertIn('votes.jsonl', response['Content-Disposition'])
+        lines = b''.join(response.streaming_content).splitlines()
+        self.assertEqual(2, len(lines))
+
+    def test_download_with_bad_filter(self):
+        """An invalid filter is a bad request."""
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('polls:export_votes'),
+                                   {'since': 'yesterday'})
+        self.assertEqual(400, response.status_code)
+
+    @override_settings(ROOT_URLCONF='polls.tests.test_async_views')
+    async def test_async_download(self):
+        """The async view streams the same export."""
+        await self.async_client.aforce_login(self.staff)
+        response = await self.async_client.get(reverse('polls:export_votes'))
+        content = b''.join([chunk async for chunk
+                            in response.streaming_content])
+        self.assertEqual(3, len(content.splitlines()))
@@ -1,5 +1,6 @@
 import datetime
 
+from django.core.cache import cache
 from django.test import TestCase
 from django.utils import timezone
 from django.urls import reverse
@@ -18,6 +19,10 @@ def create_question(question_text, days):
 
 
 class QuestionIndexViewTests(TestCase):
+    def setUp(self):
+        """Start without cached pages from other tests."""
+        cache.clear()
+
     def test_no_questions(self):
         """
         If no questions exist, an appropriate message is displayed.
@@ -72,4 +77,37 @@ class QuestionIndexViewTests(TestCase):
         self.assertQuerySetEqual(
             response.context['latest_question_list'],
             [question2, question1],
-        )
\ No newline at end of file
+        )
+
+    def test_index_is_paginated_by_keyset(self):
+        """
+        Only one page of questions is listed at a time.
+
+        The page carries a cursor that leads to the older questions
+        without repeating any.
+        """
+        questions = [create_question(question_text=f"Question {day}.",
+                                     days=-day) for day in range(1, 26)]
+        response = self.client.get(reverse('polls:index'))
+        first_page = response.context['latest_question_list']
+        self.assertEqual(questions[:20], first_page)
+        cursor = response.context['next_cursor']
+        self.assertIsNotNone(cursor)
+        response = self.client.get(reverse('polls:index'),
+                                   {'before': cursor})
+        self.assertEqual(questions[20:],
+                         response.context['latest_question_list'])
+        self.assertIsNone(response.context['next_cursor'])
+
+    def test_invalid_cursor(self):
+        """A malformed cursor gives a 404 response."""
+        response = self.client.get(reverse('polls:index'),
+                                   {'before': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_cursor_with_oversized_id(self):
+        """An id too large for the database gives a 404 response."""
+        response = self.client.get(
+            reverse('polls:index'),
+            {'before': '2024-01-01T00:00:00_99999999999999999999'})
+        self.assertEqual(response.status_code, 404)
@@ -0,0 +1,79 @@
+import io
+import json
+import os
+import tempfile
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase
+
+from polls.loader import iter_objects
+from polls.models import Choice, LoadedFixture, Question, Vote
+
+FIXTURE = [
+    {'model': 'polls.question', 'pk': 1,
+     'fields': {'question_text': 'Tea or coffee?',
+                'pub_date': '2024-08-22T00:00:00Z', 'end_date': None}},
+    {'model': 'polls.choice', 'pk': 1,
+     'fields': {'question': 1, 'choice_text': 'Tea'}},
+    {'model': 'polls.choice', 'pk': 2,
+     'fields': {'question': 1, 'choice_text': 'Coffee'}},
+    {'model': 'polls.vote', 'pk': 1, 'fields': {'choice': 2, 'user': 1}},
+    {'model': 'auth.user', 'pk': 1,
+     'fields': {'username': 'demo', 'password': '!', 'groups': [],
+                'user_permissions': []}},
+]
+
+
+class IterObjectsTests(TestCase):
+    def test_json_array_and_json_lines(self):
+        """Both fixture layouts yield the same objects, across chunks."""
+        array = json.dumps(FIXTURE, indent=2)
+        lines = '\n'.join(json.dumps(obj) for obj in FIXTURE) + '\n'
+        for text in (array, lines):
+            self.assertEqual(FIXTURE, list(iter_objects(io.StringIO(text),
+                                                        chunk_size=16)))
+
+    def test_truncated_stream(self):
+        """A stream that ends inside an object is an error."""
+        with self.assertRaises(ValueError):
+            list(iter_objects(io.StringIO('[{"model": "polls.choice"')))
+
+
+class LoadPollsTests(TestCase):
+    def setUp(self):
+        """Write the fixture to a temporary JSON Lines file."""
+        fd, self.path = tempfile.mkstemp(suffix='.jsonl')
+        with os.fdopen(fd, 'w') as f:
+            f.writelines(json.dumps(obj) + '\n' for obj in FIXTURE)
+        self.addCleanup(os.remove, self.path)
+
+    def load(self, *args):
+        """Run load_polls on the fixture and return its output."""
+        out = io.StringIO()
+        call_command('load_polls', self.path, *args, stdout=out)
+        return out.getvalue()
+
+    def test_load(self):
+        """Objects are loaded, vote questions filled and tallies counted."""
+        self.load('--batch-size', '2')
+        self.assertEqual(1, Question.objects.count())
+        self.assertTrue(User.objects.filter(username='demo').exists())
+        self.assertEqual(1, Vote.objects.get(pk=1).question_id)
+        self.assertEqual([0, 1], list(Choice.objects.order_by('pk')
+                                      .values_list('votes', flat=True)))
+
+    def test_unchanged_fixture_is_skipped(self):
+        """Loading the same content again does not touch the data."""
+        self.load()
+        Choice.objects.filter(pk=1).update(choice_text='Green tea')
+        self.assertIn('nothing to load', self.load())
+        self.assertEqual('Green tea', Choice.objects.get(pk=1).choice_text)
+        self.assertEqual(1, LoadedFixture.objects.count())
+
+    def test_force_reload_keeps_tallies(self):
+        """A forced reload upserts the rows without resetting tallies."""
+        self.load()
+        self.load('--force')
+        self.assertEqual(2, Choice.objects.count())
+        self.assertEqual(1, Choice.objects.get(pk=2).votes)
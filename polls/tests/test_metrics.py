@@ -0,0 +1,99 @@
+import os
+import shutil
+import tempfile
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.urls import reverse
+
+from polls.metrics import (LATENCY_BUCKETS, Metrics, MmapValues,
+                           clear_directory, metrics, render)
+from polls.models import Question, Choice
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        """Create a temporary directory for the process files."""
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def test_histogram(self):
+        """Observations fill the cumulative buckets, the sum and count."""
+        in_memory = Metrics()
+        in_memory.observe('polls_request_duration_seconds', 0.02,
+                          view='polls:index')
+        text = render(in_memory, {})
+        self.assertIn('polls_request_duration_seconds_bucket'
+                      '{le="0.01",view="polls:index"} 0', text)
+        self.assertIn('polls_request_duration_seconds_bucket'
+                      '{le="0.025",view="polls:index"} 1', text)
+        self.assertIn('polls_request_duration_seconds_count'
+                      '{view="polls:index"} 1', text)
+
+    def test_buckets_are_in_bound_order(self):
+        """The buckets are listed by numeric bound, with +Inf last."""
+        in_memory = Metrics()
+        in_memory.observe('polls_request_duration_seconds', 0.02,
+                          view='polls:index')
+        bounds = [line.split('le="')[1].split('"')[0]
+                  for line in render(in_memory, {}).splitlines()
+                  if '_bucket{' in line]
+        self.assertEqual([str(bound) for bound in LATENCY_BUCKETS]
+                         + ['+Inf'], bounds)
+
+    def test_clear_directory(self):
+        """The files of an earlier run are removed."""
+        Metrics(self.directory).inc('polls_votes_total', outcome='created')
+        clear_directory(self.directory)
+        self.assertEqual({}, Metrics(self.directory).samples())
+
+    def test_processes_are_summed(self):
+        """Samples in the files of all processes are added up."""
+        shared = Metrics(self.directory)
+        shared.inc('polls_votes_total', outcome='created')
+        other = MmapValues(os.path.join(self.directory, 'metrics_1.db'))
+        other.add('polls_votes_total{outcome="created"}', 2)
+        self.assertEqual(3, shared.samples()[
+            'polls_votes_total{outcome="created"}'])
+
+    def test_file_grows(self):
+        """The mapped file is enlarged when it runs out of room."""
+        path = os.path.join(self.directory, 'metrics_2.db')
+        values = MmapValues(path)
+        for number in range(2000):
+            values.add(f'polls_votes_total{{outcome="{number}"}}', number)
+        with open(path, 'rb') as f:
+            entries = list(MmapValues.entries(f.read()))
+        self.assertEqual(2000, len(entries))
+        self.assertEqual(1999, entries[-1][2])
+
+
+class MetricsEndpointTests(TestCase):
+    def setUp(self):
+        """Reset the counters and create a voter and a question."""
+        metrics.clear()
+        self.user = User.objects.create_user(username='tester',
+                                             password='testpassword123')
+        self.question = Question.objects.create(question_text='Question')
+        self.choice = Choice.objects.create(question=self.question,
+                                            choice_text='Choice')
+
+    def test_votes_logins_and_latency(self):
+        """The endpoint reports votes, logins and request latencies."""
+        self.client.post(reverse('login'), {'username': 'tester',
+                                            'password': 'wrong'})
+        self.client.force_login(self.user)
+        vote_url = reverse('polls:vote', args=[self.question.id])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(vote_url, {'choice': self.choice.id})
+        self.client.post(vote_url, {})
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual('text/plain; version=0.0.4', response['Content-Type'])
+        text = response.content.decode()
+        self.assertIn('polls_votes_total{outcome="created"} 1', text)
+        self.assertIn('polls_votes_total{outcome="rejected"} 1', text)
+        self.assertIn('polls_logins_total{result="failure"} 1', text)
+        self.assertIn('polls_request_duration_seconds_count'
+                      '{view="polls:vote"} 2', text)
+        self.assertIn('polls_db_queries_total{alias="default"}', text)
+        self.assertIn('polls_vote_buffer_depth 0', text)
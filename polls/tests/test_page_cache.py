@@ -0,0 +1,97 @@
+import datetime
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from polls.cache import results_cache
+from polls.models import Question, Choice
+from polls.pagecache import next_boundary
+
+
+class PageCacheTests(TestCase):
+    def setUp(self):
+        """Create a question with a choice and start with empty caches."""
+        cache.clear()
+        results_cache.clear()
+        self.user = User.objects.create_user(username='tester',
+                                             password='testpassword123')
+        self.question = Question.objects.create(question_text='Question')
+        self.choice = Choice.objects.create(question=self.question,
+                                            choice_text='Choice')
+        self.results_url = reverse('polls:results', args=[self.question.id])
+
+    def test_anonymous_page_is_served_from_cache(self):
+        """The second anonymous request runs no query at all."""
+        response = self.client.get(reverse('polls:index'))
+        self.assertEqual('miss', response['X-Page-Cache'])
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('polls:index'))
+        self.assertEqual('hit', response['X-Page-Cache'])
+        self.assertContains(response, 'Question')
+
+    def test_unknown_query_parameters_are_not_cached(self):
+        """Only the parameters a view reads make a new cache entry."""
+        index = reverse('polls:index')
+        self.client.get(index)
+        response = self.client.get(index, {'x': 1})
+        self.assertNotIn('X-Page-Cache', response)
+        response = self.client.get(index, {'x': 1})
+        self.assertNotIn('X-Page-Cache', response)
+        before = f'{self.question.pub_date.isoformat()}_{self.question.id}'
+        response = self.client.get(index, {'before': before, 'x': 1})
+        self.assertNotIn('X-Page-Cache', response)
+        response = self.client.get(index, {'before': before})
+        self.assertEqual('miss', response['X-Page-Cache'])
+
+    def test_logged_in_user_is_not_cached(self):
+        """Requests with a session never use the page cache."""
+        self.client.get(self.results_url)
+        self.client.force_login(self.user)
+        response = self.client.get(self.results_url)
+        self.assertNotIn('X-Page-Cache', response)
+        self.assertContains(response, 'Welcome back, tester')
+
+    def test_question_change_invalidates_pages(self):
+        """Saving a question drops the cached pages."""
+        self.client.get(reverse('polls:index'))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.question.question_text = 'Renamed'
+            self.question.save()
+        response = self.client.get(reverse('polls:index'))
+        self.assertEqual('miss', response['X-Page-Cache'])
+        self.assertContains(response, 'Renamed')
+
+    def test_vote_invalidates_results_page(self):
+        """A vote drops the cached results page of its question."""
+        self.client.get(self.results_url)
+        voter = self.client_class()
+        voter.force_login(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            voter.post(reverse('polls:vote', args=[self.question.id]),
+                       {'choice': self.choice.id})
+        response = self.client.get(self.results_url)
+        self.assertEqual('miss', response['X-Page-Cache'])
+        self.assertContains(response,
+                            f'<td id="votes-{self.choice.id}">1</td>')
+
+    def test_pages_expire_at_next_boundary(self):
+        """The next pub_date or end_date bounds how long pages are kept."""
+        soon = timezone.now() + datetime.timedelta(seconds=30)
+        Question.objects.create(question_text='Soon', pub_date=soon)
+        self.assertEqual(soon, next_boundary())
+
+    @override_settings(POLLS_PAGE_CACHE=False)
+    def test_disabled(self):
+        """The page cache can be switched off."""
+        response = self.client.get(reverse('polls:index'))
+        self.assertNotIn('X-Page-Cache', response)
+
+    @override_settings(ROOT_URLCONF='polls.tests.test_async_views')
+    async def test_async_views_are_cached(self):
+        """The async views use the page cache as well."""
+        await self.async_client.get(self.results_url)
+        response = await self.async_client.get(self.results_url)
+        self.assertEqual('hit', response['X-Page-Cache'])
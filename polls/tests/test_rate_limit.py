@@ -0,0 +1,130 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from polls.models import Question, Choice
+from polls.ratelimit import BACKENDS, LocalBuckets, parse_rate
+
+LIMITS = {
+    'polls:vote': {'rate': '1/m', 'burst': 2},
+    'login': {'rate': '1/m', 'burst': 1},
+}
+
+
+class TokenBucketTests(SimpleTestCase):
+    def test_parse_rate(self):
+        """A rate is turned into the seconds between two tokens."""
+        self.assertEqual(2, parse_rate('30/m'))
+        self.assertEqual(0.5, parse_rate('2/s'))
+        with self.assertRaises(ImproperlyConfigured):
+            parse_rate('30 per minute')
+
+    def test_burst_then_refill(self):
+        """A full bucket allows a burst, then one request per interval."""
+        buckets = LocalBuckets()
+        self.assertEqual(0, buckets.take('key', 10, 2, now=100))
+        self.assertEqual(0, buckets.take('key', 10, 2, now=100))
+        self.assertEqual(10, buckets.take('key', 10, 2, now=100))
+        self.assertEqual(0, buckets.take('other', 10, 2, now=100))
+        self.assertEqual(0, buckets.take('key', 10, 2, now=110))
+        self.assertEqual(5, buckets.take('key', 10, 2, now=115))
+
+    def test_least_recently_used_bucket_is_forgotten(self):
+        """Past max_keys, the oldest bucket starts again full."""
+        buckets = LocalBuckets(max_keys=1)
+        buckets.take('key', 10, 1, now=100)
+        buckets.take('other', 10, 1, now=100)
+        self.assertEqual(0, buckets.take('key', 10, 1, now=100))
+
+
+@override_settings(POLLS_RATE_LIMITS=LIMITS, POLLS_RATE_LIMIT_BACKEND='local')
+class RateLimitMiddlewareTests(TestCase):
+    def setUp(self):
+        """Create a voter and a question, and refill every bucket."""
+        BACKENDS['local'].clear()
+        cache.clear()
+        self.user = User.objects.create_user(username='tester',
+                                             password='testpassword123')
+        self.question = Question.objects.create(question_text='Question')
+        self.choice = Choice.objects.create(question=self.question,
+                                            choice_text='Choice')
+        self.vote_url = reverse('polls:vote', args=[self.question.id])
+
+    def vote(self, ip='10.0.0.1'):
+        """Post a vote from an address."""
+        return self.client.post(self.vote_url, {'choice': self.choice.id},
+                                REMOTE_ADDR=ip)
+
+    def test_votes_over_the_limit_are_refused_without_queries(self):
+        """Once the burst is spent, a vote gets a 429 and no SQL runs."""
+        self.client.force_login(self.user)
+        self.assertEqual(302, self.vote().status_code)
+        self.assertEqual(302, self.vote().status_code)
+        with self.assertNumQueries(0):
+            response = self.vote()
+        self.assertEqual(429, response.status_code)
+        self.assertEqual('60', response['Retry-After'])
+
+    def test_user_is_limited_from_any_address(self):
+        """A user moving between addresses shares one bucket."""
+        self.client.force_login(self.user)
+        self.assertEqual(302, self.vote('10.0.0.1').status_code)
+        self.assertEqual(302, self.vote('10.0.0.2').status_code)
+        self.assertEqual(429, self.vote('10.0.0.3').status_code)
+
+    def test_get_is_not_limited(self):
+        """Only POSTs take tokens."""
+        for _ in range(3):
+            response = self.client.get(reverse('login'),
+                                       REMOTE_ADDR='10.0.0.1')
+            self.assertEqual(200, response.status_code)
+
+    def test_login_attempts_are_limited(self):
+        """Password guesses from one address are refused past the burst."""
+        data = {'username': 'tester', 'password': 'wrong'}
+        response = self.client.post(reverse('login'), data,
+                                    REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(200, response.status_code)
+        response = self.client.post(reverse('login'), data,
+                                    REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(429, response.status_code)
+
+    def test_forwarded_for_cannot_reset_the_bucket(self):
+        """A client writing its own X-Forwarded-For keeps its bucket."""
+        data = {'username': 'tester', 'password': 'wrong'}
+        statuses = [self.client.post(reverse('login'), data,
+                                     REMOTE_ADDR='10.0.0.1',
+                                     HTTP_X_FORWARDED_FOR=f'192.0.2.{n}'
+                                     ).status_code
+                    for n in range(3)]
+        self.assertEqual([200, 429, 429], statuses)
+
+    @override_settings(POLLS_TRUSTED_PROXY_COUNT=1)
+    def test_address_seen_by_trusted_proxy_is_limited(self):
+        """Behind a proxy, the hop it appended is the client's address."""
+        data = {'username': 'tester', 'password': 'wrong'}
+        statuses = [self.client.post(reverse('login'), data,
+                                     REMOTE_ADDR='10.0.0.254',
+                                     HTTP_X_FORWARDED_FOR=f'192.0.2.{n}, '
+                                                          f'198.51.100.7'
+                                     ).status_code
+                    for n in range(2)]
+        self.assertEqual([200, 429], statuses)
+        response = self.client.post(reverse('login'), data,
+                                    REMOTE_ADDR='10.0.0.254',
+                                    HTTP_X_FORWARDED_FOR='198.51.100.8')
+        self.assertEqual(200, response.status_code)
+
+    @override_settings(POLLS_RATE_LIMIT_BACKEND='cache')
+    def test_cache_backend(self):
+        """The cache backend keeps the same buckets in the cache."""
+        self.client.force_login(self.user)
+        self.assertEqual(302, self.vote().status_code)
+        self.assertEqual(302, self.vote().status_code)
+        self.assertEqual(429, self.vote().status_code)
+        BACKENDS['local'].clear()
+        self.assertEqual(429, self.vote().status_code)
+        cache.clear()
+        self.assertEqual(302, self.vote().status_code)
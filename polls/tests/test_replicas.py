@@ -0,0 +1,105 @@
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from polls.middleware import ReplicaRoutingMiddleware
+from polls.models import Question, Choice, Vote
+from polls.ratelimit import BACKENDS
+from polls.routers import (PrimaryReplicaRouter, reading_from_replicas,
+                           use_replicas)
+
+
+@override_settings(POLLS_READ_REPLICAS=['replica1', 'replica2'])
+class RouterTests(SimpleTestCase):
+    def test_reads_use_replicas_only_when_allowed(self):
+        """Reads stay on the primary outside reading_from_replicas()."""
+        router = PrimaryReplicaRouter()
+        self.assertEqual('default', router.db_for_read(Question))
+        with reading_from_replicas():
+            self.assertIn(router.db_for_read(Question),
+                          ['replica1', 'replica2'])
+        self.assertEqual('default', router.db_for_read(Question))
+
+    def test_replicas_are_not_migrated(self):
+        """Migrations run on the primary only."""
+        router = PrimaryReplicaRouter()
+        self.assertFalse(router.allow_migrate('replica1', 'polls'))
+        self.assertIsNone(router.allow_migrate('default', 'polls'))
+
+    def test_writes_use_primary(self):
+        """Writes go to the primary even while replicas are allowed."""
+        with reading_from_replicas():
+            self.assertEqual('default',
+                             PrimaryReplicaRouter().db_for_write(Question))
+
+
+# The test database stands in for the replica, so the queries still run.
+@override_settings(POLLS_READ_REPLICAS=['default'], POLLS_PAGE_CACHE=False)
+class ReplicaRoutingMiddlewareTests(TestCase):
+    def setUp(self):
+        """Create a question and a voter, and record every routed read."""
+        BACKENDS['local'].clear()
+        self.user = User.objects.create_user(username='tester',
+                                             password='testpassword123')
+        self.question = Question.objects.create(question_text='Question')
+        self.choice = Choice.objects.create(question=self.question,
+                                            choice_text='Choice')
+        self.replica_reads = []
+
+        def db_for_read(router, model, **hints):
+            self.replica_reads.append(use_replicas.get())
+            return 'default'
+
+        patcher = mock.patch.object(PrimaryReplicaRouter, 'db_for_read',
+                                    autospec=True, side_effect=db_for_read)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_read_only_view_uses_replicas(self):
+        """The index reads from the replicas."""
+        self.client.get(reverse('polls:index'))
+        self.assertTrue(self.replica_reads)
+        self.assertTrue(all(self.replica_reads))
+
+    def test_other_views_use_primary(self):
+        """The detail page, which leads to a vote, reads from the primary."""
+        self.client.get(reverse('polls:detail', args=[self.question.id]))
+        self.assertTrue(self.replica_reads)
+        self.assertFalse(any(self.replica_reads))
+
+    def test_vote_sticks_to_primary(self):
+        """After voting, the results page reads from the primary."""
+        self.client.force_login(self.user)
+        response = self.client.post(
+            reverse('polls:vote', args=[self.question.id]),
+            {'choice': self.choice.id})
+        self.assertIn(ReplicaRoutingMiddleware.cookie_name, response.cookies)
+        self.replica_reads.clear()
+        response = self.client.get(response.url)
+        self.assertContains(response, 'Choice')
+        self.assertTrue(self.replica_reads)
+        self.assertFalse(any(self.replica_reads))
+
+    def test_export_reads_from_replicas(self):
+        """The streamed export reads from the replica chosen in the view."""
+        self.user.is_staff = True
+        self.user.save()
+        Vote.objects.cast(self.user, self.choice)
+        self.client.force_login(self.user)
+        self.replica_reads.clear()
+        response = self.client.get(reverse('polls:export_votes'))
+        self.assertIn(b'Choice', b''.join(response.streaming_content))
+        self.assertTrue(self.replica_reads)
+        self.assertTrue(all(self.replica_reads))
+
+    @override_settings(POLLS_PRIMARY_STICKY_SECONDS=0)
+    def test_stickiness_can_be_turned_off(self):
+        """With no sticky window, a vote sets no cookie."""
+        self.client.force_login(self.user)
+        response = self.client.post(
+            reverse('polls:vote', args=[self.question.id]),
+            {'choice': self.choice.id})
+        self.assertNotIn(ReplicaRoutingMiddleware.cookie_name,
+                         response.cookies)
@@ -0,0 +1,61 @@
+import datetime
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from polls.models import Question, Choice
+
+
+class ResultsApiTests(TestCase):
+    def setUp(self):
+        """Create two published questions and an unpublished one."""
+        self.questions = []
+        for number in range(2):
+            question = Question.objects.create(
+                question_text=f'Question {number}')
+            for count in range(3):
+                Choice.objects.create(question=question, votes=count,
+                                      choice_text=f'Choice {count}')
+            self.questions.append(question)
+        self.future = Question.objects.create(
+            question_text='Future',
+            pub_date=timezone.now() + datetime.timedelta(days=1))
+        Choice.objects.create(question=self.future, choice_text='Hidden')
+
+    def test_batch_of_questions_in_one_query(self):
+        """All requested results are read with a single query."""
+        ids = ','.join(str(q.id) for q in self.questions + [self.future])
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('polls:results_api'),
+                                       {'ids': ids})
+        data = response.json()
+        self.assertEqual([self.future.id], data['missing'])
+        result = data['results'][str(self.questions[0].id)]
+        self.assertEqual(3, result['total'])
+        self.assertEqual(['Choice 0', 'Choice 1', 'Choice 2'],
+                         [text for _, text, _ in result['choices']])
+
+    def test_question_without_choices(self):
+        """A published question without choices has empty results."""
+        question = Question.objects.create(question_text='No choices')
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('polls:results_api'),
+                                       {'ids': str(question.id)})
+        data = response.json()
+        self.assertEqual([], data['missing'])
+        self.assertEqual({'total': 0, 'choices': []},
+                         data['results'][str(question.id)])
+
+    def test_invalid_ids(self):
+        """Ids that are not integers are a bad request."""
+        response = self.client.get(reverse('polls:results_api'),
+                                   {'ids': '1,two'})
+        self.assertEqual(400, response.status_code)
+
+    @override_settings(POLLS_API_MAX_BATCH=1)
+    def test_batch_size_is_limited(self):
+        """More ids than POLLS_API_MAX_BATCH are refused."""
+        response = self.client.get(reverse('polls:results_api'),
+                                   {'ids': '1,2'})
+        self.assertEqual(400, response.status_code)
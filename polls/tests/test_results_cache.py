@@ -0,0 +1,73 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from polls.cache import LRUCache, results_cache
+from polls.models import Question, Choice
+from polls.ratelimit import BACKENDS
+
+
+@override_settings(POLLS_PAGE_CACHE=False)
+class ResultsCacheTests(TestCase):
+    def setUp(self):
+        """Create a question with a choice and start with empty caches."""
+        BACKENDS['local'].clear()
+        cache.clear()
+        results_cache.clear()
+        self.user = User.objects.create_user(username='tester',
+                                             password='testpassword123')
+        self.question = Question.objects.create(question_text='Question')
+        self.choice = Choice.objects.create(question=self.question,
+                                            choice_text='Choice')
+        self.results_url = reverse('polls:results', args=[self.question.id])
+
+    def test_second_request_is_a_local_hit(self):
+        """Only the first results request reads the tallies from the DB."""
+        response = self.client.get(self.results_url)
+        self.assertEqual('miss', response['X-Results-Cache'])
+        with self.assertNumQueries(1):
+            response = self.client.get(self.results_url)
+        self.assertEqual('local', response['X-Results-Cache'])
+        self.assertEqual({'local_hits': 1, 'shared_hits': 0, 'misses': 1},
+                         results_cache.stats())
+
+    def test_shared_cache_is_used_after_local_eviction(self):
+        """A snapshot dropped from the LRU is still found in the cache."""
+        self.client.get(self.results_url)
+        results_cache.local.clear()
+        response = self.client.get(self.results_url)
+        self.assertEqual('shared', response['X-Results-Cache'])
+
+    def test_vote_invalidates_results(self):
+        """A vote bumps the version, so results show the new tally."""
+        self.client.get(self.results_url)
+        self.client.login(username='tester', password='testpassword123')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('polls:vote', args=[self.question.id]),
+                             {'choice': self.choice.id})
+        response = self.client.get(self.results_url)
+        self.assertEqual('miss', response['X-Results-Cache'])
+        self.assertEqual(1, response.context['results'][0]['votes'])
+
+
+class LRUCacheTests(TestCase):
+    def test_least_recently_used_entry_is_evicted(self):
+        """Adding past maxsize drops the entry used longest ago."""
+        lru = LRUCache(maxsize=2, ttl=60)
+        lru.set('a', 1)
+        lru.set('b', 2)
+        lru.get('a')
+        lru.set('c', 3)
+        self.assertIsNone(lru.get('b'))
+        self.assertEqual(1, lru.get('a'))
+        self.assertEqual(2, len(lru))
+
+    def test_entries_expire(self):
+        """An entry is not returned after its ttl has passed."""
+        lru = LRUCache(maxsize=2, ttl=0.01)
+        lru.set('a', 1)
+        time.sleep(0.02)
+        self.assertIsNone(lru.get('a'))
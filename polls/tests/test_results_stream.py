@@ -0,0 +1,69 @@
+import json
+
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+
+from polls.cache import results_cache
+from polls.feed import ResultsFeed
+from polls.models import Question, Choice
+
+
+def parse(event):
+    """Return the data of a results event."""
+    return json.loads(event.split('data: ', 1)[1])
+
+
+class ResultsStreamTests(TestCase):
+    def setUp(self):
+        """Create a question with two choices and a fast feed."""
+        cache.clear()
+        results_cache.clear()
+        self.question = Question.objects.create(question_text='Question')
+        self.first = Choice.objects.create(question=self.question,
+                                           choice_text='First')
+        self.second = Choice.objects.create(question=self.question,
+                                            choice_text='Second')
+        self.feed = ResultsFeed(interval=0.01, poll=5)
+
+    async def test_stream_sends_snapshot_then_changes(self):
+        """The first event has every tally, later ones only changes."""
+        stream = self.feed.stream(self.question.id)
+        try:
+            first = parse(await anext(stream))
+            self.assertEqual({str(self.first.id): 0, str(self.second.id): 0},
+                             first['choices'])
+            await Choice.objects.filter(pk=self.second.id).aupdate(votes=3)
+            results_cache.invalidate(self.question.id)
+            self.feed.notify(self.question.id)
+            second = parse(await anext(stream))
+            self.assertEqual({str(self.second.id): 3}, second['choices'])
+        finally:
+            await stream.aclose()
+
+    async def test_streams_of_a_question_share_a_channel(self):
+        """Two subscribers of a question use one channel, then none."""
+        streams = [self.feed.stream(self.question.id) for _ in range(2)]
+        for stream in streams:
+            await anext(stream)
+        self.assertEqual(1, len(self.feed._channels))
+        channel = self.feed._channels[self.question.id]
+        self.assertEqual(2, len(channel.subscribers))
+        for stream in streams:
+            await stream.aclose()
+        self.assertEqual({}, self.feed._channels)
+
+    async def test_stream_view(self):
+        """The stream view answers with an event stream."""
+        response = await self.async_client.get(
+            reverse('polls:results_stream', args=[self.question.id]))
+        self.assertEqual('text/event-stream', response['Content-Type'])
+        event = await anext(aiter(response.streaming_content))
+        self.assertIn(b'event: results', event)
+        await response.streaming_content.aclose()
+
+    def test_stream_view_needs_asgi(self):
+        """Under WSGI the stream view refuses instead of buffering."""
+        response = self.client.get(
+            reverse('polls:results_stream', args=[self.question.id]))
+        self.assertEqual(501, response.status_code)
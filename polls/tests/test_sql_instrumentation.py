@@ -0,0 +1,50 @@
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from polls.models import Question, Choice
+
+
+class QueryInstrumentationTests(TestCase):
+    def setUp(self):
+        """Create a question with two choices."""
+        self.question = Question.objects.create(question_text='Question')
+        for text in ('Yes', 'No'):
+            Choice.objects.create(question=self.question, choice_text=text)
+
+    def get_results(self):
+        """Request the results of the question from the JSON API."""
+        return self.client.get(reverse('polls:results_api'),
+                               {'ids': self.question.id})
+
+    def test_server_timing_header(self):
+        """The response reports the number of queries and their time."""
+        response = self.get_results()
+        self.assertRegex(response['Server-Timing'],
+                         r'^db;dur=[\d.]+;desc="1 queries", total;dur=')
+
+    def test_request_within_thresholds_is_logged_at_debug(self):
+        """A request within the thresholds is a debug line."""
+        with self.assertLogs('polls', level='DEBUG') as logs:
+            self.get_results()
+        self.assertIn('view=polls:results_api', logs.output[-1])
+        self.assertTrue(logs.output[-1].startswith('DEBUG'))
+
+    @override_settings(POLLS_SQL_MAX_QUERIES=0)
+    def test_request_over_threshold_is_a_warning(self):
+        """A request over a threshold is logged with its slowest SQL."""
+        with self.assertLogs('polls', level='WARNING') as logs:
+            self.get_results()
+        self.assertIn('over_threshold=1', logs.output[0])
+        self.assertIn('SELECT', logs.output[0])
+
+    @override_settings(POLLS_SQL_INSTRUMENTATION=False)
+    def test_disabled(self):
+        """Without instrumentation there is no Server-Timing header."""
+        self.assertNotIn('Server-Timing', self.get_results())
+
+    @override_settings(ROOT_URLCONF='polls.tests.test_async_views')
+    async def test_async_view_queries_are_counted(self):
+        """Queries made by async views are counted as well."""
+        response = await self.async_client.get(
+            reverse('polls:results', args=[self.question.id]))
+        self.assertNotIn('desc="0 queries"', response['Server-Timing'])
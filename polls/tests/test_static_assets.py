@@ -0,0 +1,108 @@
+import gzip
+import shutil
+import tempfile
+from unittest import mock, skipIf
+
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.management import call_command
+from django.templatetags.static import static
+from django.test import TestCase, override_settings
+
+from polls import assets
+
+
+class StaticAssetsTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        """Collect the polls assets into a temporary STATIC_ROOT."""
+        super().setUpClass()
+        static_root = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, static_root)
+        settings = override_settings(STATIC_ROOT=static_root)
+        settings.enable()
+        cls.addClassCleanup(settings.disable)
+        with mock.patch.object(assets.logger, 'warning') as warning:
+            call_command('collectstatic', interactive=False, verbosity=0,
+                         ignore_patterns=['admin'])
+        cls.warnings = [call.args[1] for call in warning.call_args_list]
+
+    def setUp(self):
+        """Look up the hashed URL of the index stylesheet."""
+        self.hashed_url = static('polls/style.css')
+
+    def test_urls_are_hashed(self):
+        """Collected assets are linked by their content-hashed name."""
+        self.assertRegex(self.hashed_url,
+                         r'^/static/polls/style\.[0-9a-f]{12}\.css$')
+
+    def test_missing_reference_is_kept(self):
+        """A stylesheet pointing at a missing image is still collected."""
+        self.assertIn('polls/style.css', self.warnings)
+        self.assertEqual(len(self.warnings), len(set(self.warnings)))
+        name = staticfiles_storage.stored_name('polls/style.css')
+        with staticfiles_storage.open(name) as f:
+            self.assertIn(b'url("images/color.jpg")', f.read())
+
+    def test_variants_are_precompressed(self):
+        """Collecting writes a gzip variant of the hashed file."""
+        name = staticfiles_storage.stored_name('polls/style.css')
+        with staticfiles_storage.open(name) as f:
+            original = f.read()
+        with staticfiles_storage.open(name + '.gz') as f:
+            self.assertEqual(original, gzip.decompress(f.read()))
+
+    def test_images_are_not_compressed(self):
+        """Already compressed formats get no variants."""
+        name = staticfiles_storage.stored_name('polls/images/test.jpg')
+        self.assertFalse(staticfiles_storage.exists(name + '.gz'))
+
+    def test_hashed_file_is_immutable(self):
+        """A hashed name is cached for a year and never revalidated."""
+        response = self.client.get(self.hashed_url)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual('text/css', response['Content-Type'])
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertNotIn('Content-Encoding', response)
+        self.assertIn('Accept-Encoding', response['Vary'])
+
+    def test_unhashed_file_is_revalidated(self):
+        """The original name may change content, so it is not immutable."""
+        response = self.client.get('/static/polls/style.css')
+        self.assertEqual(200, response.status_code)
+        self.assertIn('must-revalidate', response['Cache-Control'])
+
+    def test_gzip_is_served(self):
+        """A client accepting gzip gets the gzip variant."""
+        response = self.client.get(self.hashed_url,
+                                   HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual('gzip', response['Content-Encoding'])
+        self.assertEqual('text/css', response['Content-Type'])
+        self.assertIn(b'body', gzip.decompress(b''.join(response)))
+
+    @skipIf(assets.brotli is None, "brotli is not installed")
+    def test_brotli_is_preferred(self):
+        """Brotli is sent when the client accepts it."""
+        response = self.client.get(self.hashed_url,
+                                   HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual('br', response['Content-Encoding'])
+
+    def test_refused_encoding_is_not_used(self):
+        """An encoding with q=0 is not sent."""
+        response = self.client.get(self.hashed_url,
+                                   HTTP_ACCEPT_ENCODING='br;q=0, gzip;q=0')
+        self.assertNotIn('Content-Encoding', response)
+
+    def test_not_modified(self):
+        """A conditional request for an unchanged file gets a 304."""
+        response = self.client.get(self.hashed_url)
+        response = self.client.get(
+            self.hashed_url,
+            HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(304, response.status_code)
+
+    def test_missing_and_outside_files(self):
+        """Files outside STATIC_ROOT or not collected are not found."""
+        self.assertEqual(404, self.client.get(
+            '/static/polls/missing.css').status_code)
+        self.assertEqual(404, self.client.get(
+            '/static/../manage.py').status_code)
@@ -0,0 +1,110 @@
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import IntegrityError
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from polls.cache import results_cache
+from polls.models import Question, Choice, Vote
+from polls.ratelimit import BACKENDS
+
+
+class VoteTallyTests(TestCase):
+    def setUp(self):
+        """Create a question with two choices and a voter."""
+        BACKENDS['local'].clear()
+        cache.clear()
+        results_cache.clear()
+        self.user = User.objects.create_user(username='tester',
+                                             password='testpassword123')
+        self.question = Question.objects.create(question_text='Question')
+        self.first = Choice.objects.create(question=self.question,
+                                           choice_text='First')
+        self.second = Choice.objects.create(question=self.question,
+                                            choice_text='Second')
+
+    def refresh(self):
+        """Reload both choices from the database."""
+        self.first.refresh_from_db()
+        self.second.refresh_from_db()
+
+    def test_new_vote_increments_tally(self):
+        """Creating a vote adds one to the selected choice."""
+        Vote.objects.create(user=self.user, choice=self.first)
+        self.refresh()
+        self.assertEqual(1, self.first.votes)
+        self.assertEqual(0, self.second.votes)
+
+    def test_changed_vote_moves_tally(self):
+        """Changing a vote moves the count from the old choice to the new."""
+        Vote.objects.create(user=self.user, choice=self.first)
+        vote = Vote.objects.get(user=self.user)
+        vote.choice = self.second
+        vote.save()
+        self.refresh()
+        self.assertEqual(0, self.first.votes)
+        self.assertEqual(1, self.second.votes)
+
+    def test_deleted_vote_decrements_tally(self):
+        """Deleting a vote removes it from its choice's tally."""
+        Vote.objects.create(user=self.user, choice=self.first)
+        Vote.objects.filter(user=self.user).delete()
+        self.refresh()
+        self.assertEqual(0, self.first.votes)
+
+    def test_vote_view_keeps_tallies(self):
+        """Voting and re-voting through the view keeps the tallies right."""
+        self.client.login(username='tester', password='testpassword123')
+        vote_url = reverse('polls:vote', args=[self.question.id])
+        self.client.post(vote_url, {'choice': self.first.id})
+        self.client.post(vote_url, {'choice': self.second.id})
+        self.refresh()
+        self.assertEqual(0, self.first.votes)
+        self.assertEqual(1, self.second.votes)
+
+    @override_settings(POLLS_PAGE_CACHE=False)
+    def test_results_page_query_count_is_constant(self):
+        """Results rendering does not issue one query per choice."""
+        for count in range(10):
+            Choice.objects.create(question=self.question,
+                                  choice_text=f'Extra {count}')
+        with self.assertNumQueries(2):
+            self.client.get(reverse('polls:results',
+                                    args=[self.question.id]))
+
+    def test_recount_votes_repairs_drift(self):
+        """recount_votes --check fails on drift and a plain run fixes it."""
+        Vote.objects.create(user=self.user, choice=self.first)
+        Choice.objects.filter(pk=self.first.pk).update(votes=7)
+        with self.assertRaises(CommandError):
+            call_command('recount_votes', '--check', stdout=StringIO())
+        call_command('recount_votes', stdout=StringIO())
+        self.refresh()
+        self.assertEqual(1, self.first.votes)
+        call_command('recount_votes', '--check', stdout=StringIO())
+
+    def test_recount_invalidates_cached_results(self):
+        """Cached results show the recounted tallies once they commit."""
+        Vote.objects.create(user=self.user, choice=self.first)
+        Choice.objects.filter(pk=self.first.pk).update(votes=7)
+        results_cache.get(self.question.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('recount_votes', stdout=StringIO())
+        results, source = results_cache.get(self.question.id)
+        self.assertEqual('miss', source)
+        self.assertEqual(1, results[0]['votes'])
+
+    def test_vote_records_its_question(self):
+        """A vote saved with only a choice gets that choice's question."""
+        vote = Vote.objects.create(user=self.user, choice=self.first)
+        self.assertEqual(self.question, vote.question)
+
+    def test_one_vote_per_question(self):
+        """The database refuses a second vote by a user on a question."""
+        Vote.objects.create(user=self.user, choice=self.first)
+        with self.assertRaises(IntegrityError):
+            Vote.objects.create(user=self.user, choice=self.second)
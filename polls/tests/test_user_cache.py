@@ -0,0 +1,140 @@
+import os
+import subprocess
+import sys
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY
+from django.contrib.auth.models import Group, Permission, User
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from polls.models import Question
+from polls.usercache import user_key
+
+
+class SignupLoginTests(TestCase):
+    def test_signup_logs_in_without_checking_the_password(self):
+        """The new user is logged in without hashing the password again."""
+        password = 'testpassword123'
+        with mock.patch.object(User, 'check_password') as check_password:
+            response = self.client.post(reverse('signup'), {
+                'username': 'new_tester', 'password1': password,
+                'password2': password})
+        self.assertRedirects(response, reverse('polls:index'))
+        check_password.assert_not_called()
+        user = User.objects.get(username='new_tester')
+        self.assertEqual(str(user.pk), self.client.session[SESSION_KEY])
+
+
+@override_settings(POLLS_USER_CACHE=True)
+class UserCacheTests(TestCase):
+    def setUp(self):
+        """Log in a user and clear the cache."""
+        cache.clear()
+        self.user = User.objects.create_user(username='tester',
+                                             password='testpassword123')
+        self.question = Question.objects.create(question_text='Question')
+        self.client.force_login(self.user)
+
+    def get(self):
+        """Load the detail page and return the user and user queries."""
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(reverse('polls:detail',
+                                               args=[self.question.id]))
+        queries = [query['sql'] for query in captured
+                   if 'FROM "auth_user"' in query['sql']]
+        return response.wsgi_request.user, queries
+
+    def test_user_is_loaded_once(self):
+        """After the first request, the user comes from the cache."""
+        user, queries = self.get()
+        self.assertEqual(self.user, user)
+        self.assertEqual(1, len(queries))
+        user, queries = self.get()
+        self.assertEqual(self.user, user)
+        self.assertEqual([], queries)
+
+    @override_settings(POLLS_USER_CACHE=False)
+    def test_cache_can_be_turned_off(self):
+        """Without the cache every request loads the user."""
+        self.get()
+        user, queries = self.get()
+        self.assertEqual(self.user, user)
+        self.assertEqual(1, len(queries))
+
+    def test_password_change_logs_out(self):
+        """A session logged in with the old password is no longer valid."""
+        self.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.set_password('newpassword456')
+            self.user.save()
+        user, _ = self.get()
+        self.assertFalse(user.is_authenticated)
+
+    def test_copy_is_dropped_on_commit(self):
+        """Until the change commits, the copy of the old row is kept."""
+        self.get()
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.user.save()
+        self.assertIsNotNone(cache.get(user_key(self.user.pk)))
+        for callback in callbacks:
+            callback()
+        self.assertIsNone(cache.get(user_key(self.user.pk)))
+
+    def test_permission_change_is_seen(self):
+        """Permissions granted directly or through a group apply at once."""
+        self.get()
+        permission = Permission.objects.get(codename='add_question')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.user_permissions.add(permission)
+        user, _ = self.get()
+        self.assertTrue(user.has_perm('polls.add_question'))
+
+        group = Group.objects.create(name='editors')
+        with self.captureOnCommitCallbacks(execute=True):
+            group.user_set.add(self.user)
+        self.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            group.permissions.add(
+                Permission.objects.get(codename='change_question'))
+        user, _ = self.get()
+        self.assertTrue(user.has_perm('polls.change_question'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            group.user_set.clear()
+        user, _ = self.get()
+        self.assertFalse(user.has_perm('polls.change_question'))
+
+
+class UserCacheReceiverTests(TestCase):
+    def test_receivers_are_connected_at_setup(self):
+        """The copies are dropped even where no request was ever served."""
+        script = ("import sys, django; django.setup(); "
+                  "from django.contrib.auth.models import User; "
+                  "from django.db.models.signals import post_save; "
+                  "print('polls.middleware' in sys.modules, "
+                  "post_save.has_listeners(User))")
+        result = subprocess.run(
+            [sys.executable, '-c', script], capture_output=True, text=True,
+            check=True, cwd=settings.BASE_DIR,
+            env={**os.environ, 'DJANGO_SETTINGS_MODULE': 'mysite.settings'})
+        self.assertEqual('False True', result.stdout.strip())
+
+    def test_changes_outside_a_request_drop_the_copy(self):
+        """A password or group changed from a command drops the copy."""
+        user = User.objects.create_user(username='tester',
+                                        password='testpassword123')
+        cache.set(user_key(user.pk), user)
+        with self.captureOnCommitCallbacks(execute=True):
+            user.set_password('newpassword456')
+            user.save()
+        self.assertIsNone(cache.get(user_key(user.pk)))
+
+        cache.set(user_key(user.pk), user)
+        with self.captureOnCommitCallbacks(execute=True):
+            Group.objects.create(name='editors').user_set.add(user)
+        self.assertIsNone(cache.get(user_key(user.pk)))
@@ -0,0 +1,165 @@
+import datetime
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.db import IntegrityError
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from polls import buffer
+from polls.buffer import VoteBuffer, VoteBufferFull
+from polls.models import ChoiceCounterShard, Question, Choice, Vote
+from polls.ratelimit import BACKENDS
+
+
+class VoteBufferTests(TestCase):
+    def setUp(self):
+        """Create a question with two choices, two voters and a buffer."""
+        BACKENDS['local'].clear()
+        self.user = User.objects.create_user(username='tester',
+                                             password='testpassword123')
+        self.other = User.objects.create_user(username='other')
+        self.question = Question.objects.create(question_text='Question')
+        self.first = Choice.objects.create(question=self.question,
+                                           choice_text='First')
+        self.second = Choice.objects.create(question=self.question,
+                                            choice_text='Second')
+        self.buffer = VoteBuffer(max_size=2, flush_interval=60,
+                                 flush_batch=100, max_lag=60)
+
+    def refresh(self):
+        """Reload both choices from the database."""
+        self.first.refresh_from_db()
+        self.second.refresh_from_db()
+
+    def test_queued_votes_are_written_on_flush(self):
+        """Nothing is written until flush(), which writes the whole batch."""
+        self.assertTrue(self.buffer.submit(self.user, self.first))
+        self.assertTrue(self.buffer.submit(self.other, self.second))
+        self.assertFalse(Vote.objects.exists())
+        self.assertEqual(2, self.buffer.flush())
+        self.assertEqual(0, len(self.buffer))
+        self.refresh()
+        self.assertEqual((1, 1), (self.first.votes, self.second.votes))
+
+    def test_flush_keeps_latest_vote_and_moves_tallies(self):
+        """A changed vote replaces the stored one and moves its tally."""
+        Vote.objects.cast(self.user, self.first)
+        self.buffer.submit(self.user, self.second)
+        self.buffer.flush()
+        self.assertEqual(self.second.id,
+                         Vote.objects.get(user=self.user).choice_id)
+        self.refresh()
+        self.assertEqual((0, 1), (self.first.votes, self.second.votes))
+
+    def test_full_buffer_falls_back_to_sync(self):
+        """With the 'sync' policy a full buffer asks for a direct write."""
+        self.buffer.submit(self.user, self.first)
+        self.buffer.submit(self.other, self.first)
+        third = User.objects.create_user(username='third')
+        self.assertFalse(self.buffer.submit(third, self.first))
+
+    def test_sync_vote_is_not_overwritten_by_queued_one(self):
+        """A vote written past a full buffer withdraws the queued one."""
+        self.buffer.submit(self.user, self.first)
+        self.buffer.submit(self.other, self.first)
+        self.assertFalse(self.buffer.submit(self.user, self.second))
+        Vote.objects.cast(self.user, self.second)
+        self.assertEqual(1, self.buffer.flush())
+        self.assertEqual(self.second.id,
+                         Vote.objects.get(user=self.user).choice_id)
+        self.refresh()
+        self.assertEqual((1, 1), (self.first.votes, self.second.votes))
+
+    def test_votes_for_closed_questions_are_dropped(self):
+        """A question that closed before the flush gets no more votes."""
+        self.buffer.submit(self.user, self.first)
+        self.question.end_date = timezone.now() - datetime.timedelta(days=1)
+        self.question.save()
+        with self.assertLogs('polls', level='WARNING'):
+            self.assertEqual(0, self.buffer.flush())
+        self.assertFalse(Vote.objects.exists())
+        self.refresh()
+        self.assertEqual(0, self.first.votes)
+
+    @override_settings(POLLS_VOTE_COUNTER_SHARDS=4)
+    def test_flush_moves_tallies_on_counter_shards(self):
+        """With sharded counters the flush adds to the shards."""
+        self.buffer.submit(self.user, self.first)
+        self.buffer.flush()
+        self.refresh()
+        self.assertEqual(0, self.first.votes)
+        self.assertEqual(1, sum(ChoiceCounterShard.objects.filter(
+            choice=self.first).values_list('votes', flat=True)))
+
+    def test_full_buffer_rejects(self):
+        """With the 'reject' policy a full buffer raises VoteBufferFull."""
+        self.buffer.when_full = 'reject'
+        self.buffer.max_lag = 0
+        self.buffer.submit(self.user, self.first)
+        with self.assertRaises(VoteBufferFull):
+            self.buffer.submit(self.other, self.first)
+
+    def fail_votes_for(self, choice):
+        """Make every write of a batch with a vote for choice fail."""
+        write = self.buffer._write
+
+        def failing_write(batch):
+            if any(choice_id == choice.id for _, choice_id in batch.values()):
+                raise IntegrityError("FOREIGN KEY constraint failed")
+            return write(batch)
+
+        patcher = mock.patch.object(self.buffer, '_write',
+                                    side_effect=failing_write)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_failing_vote_does_not_block_the_batch(self):
+        """The other votes of a failed batch are written one at a time."""
+        self.fail_votes_for(self.second)
+        self.buffer.submit(self.user, self.first)
+        self.buffer.submit(self.other, self.second)
+        with self.assertLogs('polls', level='WARNING'):
+            self.assertEqual(1, self.buffer.flush())
+        self.assertTrue(Vote.objects.filter(user=self.user).exists())
+        self.assertEqual(1, len(self.buffer))
+
+    def test_failing_vote_is_dropped_after_max_attempts(self):
+        """A vote is retried on later flushes, then dropped with an error."""
+        self.buffer.max_attempts = 3
+        self.fail_votes_for(self.first)
+        self.buffer.submit(self.user, self.first)
+        with self.assertLogs('polls', level='WARNING') as logs:
+            for _ in range(3):
+                self.assertEqual(0, self.buffer.flush())
+        self.assertEqual(0, len(self.buffer))
+        self.assertTrue(logs.output[-1].startswith('ERROR'))
+        self.assertIn('after 3 attempts', logs.output[-1])
+
+    def test_failing_vote_keeps_its_queue_time(self):
+        """A vote waiting for a retry still counts towards the lag."""
+        self.fail_votes_for(self.first)
+        self.buffer.submit(self.user, self.first)
+        queued_at = self.buffer._oldest_enqueued()
+        with self.assertLogs('polls', level='WARNING'):
+            self.buffer.flush()
+        self.assertEqual(queued_at, self.buffer._oldest_enqueued())
+        self.buffer.max_lag = 0
+        self.assertFalse(self.buffer.submit(self.other, self.second))
+
+    @override_settings(POLLS_VOTE_WRITE_MODE='buffered')
+    def test_vote_view_in_buffered_mode(self):
+        """In buffered mode the view queues the vote for the buffer."""
+        self.client.login(username='tester', password='testpassword123')
+        original, buffer._vote_buffer = buffer._vote_buffer, self.buffer
+        try:
+            response = self.client.post(
+                reverse('polls:vote', args=[self.question.id]),
+                {'choice': self.first.id}, follow=True)
+        finally:
+            buffer._vote_buffer = original
+        self.assertContains(response, "has been received")
+        self.assertEqual(1, len(self.buffer))
+        self.buffer.flush()
+        self.assertTrue(Vote.objects.filter(user=self.user).exists())
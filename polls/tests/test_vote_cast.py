@@ -0,0 +1,92 @@
+import datetime
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from polls.models import Question, Choice, Vote, VotingClosed
+from polls.ratelimit import BACKENDS
+
+
+class VoteCastTests(TestCase):
+    def setUp(self):
+        """Create an open question with two choices and a voter."""
+        BACKENDS['local'].clear()
+        self.user = User.objects.create_user(username='tester',
+                                             password='testpassword123')
+        self.question = Question.objects.create(question_text='Question')
+        self.first = Choice.objects.create(question=self.question,
+                                           choice_text='First')
+        self.second = Choice.objects.create(question=self.question,
+                                            choice_text='Second')
+
+    def test_first_vote_is_inserted(self):
+        """cast() returns None for a first vote and counts it."""
+        self.assertIsNone(Vote.objects.cast(self.user, self.first))
+        self.first.refresh_from_db()
+        self.assertEqual(1, self.first.votes)
+        self.assertEqual(self.question,
+                         Vote.objects.get(user=self.user).question)
+
+    def test_changed_vote_returns_previous_choice(self):
+        """cast() on a voted question re-points the vote it replaces."""
+        Vote.objects.cast(self.user, self.first)
+        previous = Vote.objects.cast(self.user, self.second)
+        self.assertEqual(self.first.id, previous)
+        self.assertEqual(1, Vote.objects.filter(user=self.user).count())
+        self.first.refresh_from_db()
+        self.second.refresh_from_db()
+        self.assertEqual((0, 1), (self.first.votes, self.second.votes))
+
+    def test_repeated_vote_keeps_tally(self):
+        """Voting for the same choice twice counts it once."""
+        Vote.objects.cast(self.user, self.first)
+        Vote.objects.cast(self.user, self.first)
+        self.first.refresh_from_db()
+        self.assertEqual(1, self.first.votes)
+
+    def test_cannot_cast_on_closed_question(self):
+        """cast() refuses new and changed votes once the question ends."""
+        Vote.objects.cast(self.user, self.first)
+        self.question.end_date = timezone.now() - datetime.timedelta(days=1)
+        self.question.save()
+        with self.assertRaises(VotingClosed):
+            Vote.objects.cast(self.user, self.second)
+        other = User.objects.create_user(username='other')
+        with self.assertRaises(VotingClosed):
+            Vote.objects.cast(other, self.second)
+        self.assertEqual(self.first.id,
+                         Vote.objects.get(user=self.user).choice_id)
+
+    def test_vote_view_on_closed_question(self):
+        """Voting on a closed question redirects to the index page."""
+        self.question.end_date = timezone.now() - datetime.timedelta(days=1)
+        self.question.save()
+        self.client.login(username='tester', password='testpassword123')
+        response = self.client.post(
+            reverse('polls:vote', args=[self.question.id]),
+            {'choice': self.first.id})
+        self.assertRedirects(response, reverse('polls:index'))
+        self.assertFalse(Vote.objects.exists())
+
+    def test_vote_view_messages(self):
+        """The view tells a new vote apart from a changed one."""
+        self.client.login(username='tester', password='testpassword123')
+        vote_url = reverse('polls:vote', args=[self.question.id])
+        response = self.client.post(vote_url, {'choice': self.first.id},
+                                    follow=True)
+        self.assertContains(response, "You voted for")
+        response = self.client.post(vote_url, {'choice': self.second.id},
+                                    follow=True)
+        self.assertContains(response, "Your vote was updated to")
+
+    def test_vote_view_with_choice_of_other_question(self):
+        """A choice from another question is treated as no choice."""
+        other = Question.objects.create(question_text='Other')
+        choice = Choice.objects.create(question=other, choice_text='Other')
+        self.client.login(username='tester', password='testpassword123')
+        response = self.client.post(
+            reverse('polls:vote', args=[self.question.id]),
+            {'choice': choice.id})
+        self.assertContains(response, "You didn&#x27;t select a choice.")
@@ -51,3 +51,21 @@ class QuestionModelVoteTests(TestCase):
         past = timezone.now() - datetime.timedelta(days=30)
         question = Question(end_date=past)
         self.assertFalse(question.can_vote())
+
+    def test_open_for_voting_and_closed_querysets(self):
+        """
+        open_for_voting() and closed() agree with can_vote().
+
+        Unpublished questions are in neither queryset.
+        """
+        past = timezone.now() - datetime.timedelta(days=30)
+        future = timezone.now() + datetime.timedelta(days=30)
+        running = Question.objects.create(pub_date=past, end_date=future)
+        endless = Question.objects.create(pub_date=past)
+        ended = Question.objects.create(pub_date=past,
+                                        end_date=past + datetime.timedelta(1))
+        Question.objects.create(pub_date=future)
+        self.assertQuerySetEqual(
+            Question.objects.open_for_voting().order_by('pk'),
+            [running, endless])
+        self.assertQuerySetEqual(Question.objects.closed(), [ended])
@@ -5,12 +5,22 @@ Defines the URL patterns and their corresponding views for the Polls app.
 """
 from django.urls import path
 
-from . import views
+from . import async_views, views
+from .pagecache import cache_anonymous_page, results_page_version
 
 app_name = 'polls'
 urlpatterns = [
-    path('', views.IndexView.as_view(), name='index'),
+    path('', cache_anonymous_page(views.IndexView.as_view(),
+                                  params=['before']),
+         name='index'),
     path('<int:pk>/', views.DetailView.as_view(), name='detail'),
-    path('<int:pk>/results/', views.ResultsView.as_view(), name='results'),
+    path('<int:pk>/results/',
+         cache_anonymous_page(views.ResultsView.as_view(),
+                              version_of=results_page_version),
+         name='results'),
+    path('<int:pk>/results/stream/', async_views.results_stream,
+         name='results_stream'),
+    path('api/results/', views.results_api, name='results_api'),
+    path('export/votes/', views.export_votes, name='export_votes'),
     path('<int:question_id>/vote/', views.vote, name='vote'),
 ]
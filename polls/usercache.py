@@ -0,0 +1,108 @@
+"""
+Caching of the logged-in user between requests.
+
+AuthenticationMiddleware loads the User row on every request made with a
+session. With POLLS_USER_CACHE set, CachedUserMiddleware keeps a copy of
+it in Django's cache for POLLS_USER_CACHE_TIMEOUT seconds instead. The
+copy is bound to the session like the row would be: it is only used
+while the session's auth hash, derived from the password, matches it,
+and with the backend the session was logged in with.
+
+Saving or deleting a user, and changing the groups or permissions of a
+user or of one of their groups, drops the copy once the change commits,
+so a new password or permission takes effect on the next request and a
+request made before the commit cannot cache the old row again. Changes
+made with QuerySet.update() send no signal and are seen once the copy
+expires.
+"""
+from django.conf import settings
+from django.contrib import auth
+from django.contrib.auth import (BACKEND_SESSION_KEY, HASH_SESSION_KEY,
+                                 SESSION_KEY)
+from django.contrib.auth.models import Group, User
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from django.utils.crypto import constant_time_compare
+
+
+def user_key(user_id):
+    """Return the cache key of a user's copy."""
+    return f'polls:user:{user_id}'
+
+
+def get_user(request):
+    """
+    Return the user of the request's session, from the cache if possible.
+
+    Anything but a cached user matching the session falls back to
+    auth.get_user(), which also flushes a session whose password changed.
+    """
+    if not settings.POLLS_USER_CACHE:
+        return auth.get_user(request)
+    try:
+        user_id = request.session[SESSION_KEY]
+        backend_path = request.session[BACKEND_SESSION_KEY]
+    except KeyError:
+        return auth.get_user(request)
+    user = cache.get(user_key(user_id))
+    session_hash = request.session.get(HASH_SESSION_KEY)
+    if (user is not None and session_hash
+            and backend_path in settings.AUTHENTICATION_BACKENDS
+            and constant_time_compare(session_hash,
+                                      user.get_session_auth_hash())):
+        user.backend = backend_path
+        return user
+    user = auth.get_user(request)
+    if user.is_authenticated:
+        cache.set(user_key(user.pk), user, settings.POLLS_USER_CACHE_TIMEOUT)
+    return user
+
+
+def forget_users(user_ids, using):
+    """Drop the cached copies of these users once the transaction commits."""
+    keys = [user_key(user_id) for user_id in user_ids]
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys), using=using)
+
+
+@receiver([post_save, post_delete], sender=User)
+def forget_saved_user(sender, instance, using, **kwargs):
+    """Drop the copy of a user who was changed or deleted."""
+    forget_users([instance.pk], using)
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+@receiver(m2m_changed, sender=User.user_permissions.through)
+def forget_user_with_new_permissions(sender, instance, action, reverse,
+                                     pk_set, using, **kwargs):
+    """Drop the copies of users whose groups or permissions changed."""
+    if not reverse:
+        if action.startswith('post_'):
+            forget_users([instance.pk], using)
+    elif action in ('post_add', 'post_remove'):
+        forget_users(pk_set, using)
+    elif action == 'pre_clear':
+        # The users of a group or permission being cleared are only known
+        # before they are removed.
+        forget_users(instance.user_set.values_list('pk', flat=True), using)
+
+
+@receiver(m2m_changed, sender=Group.permissions.through)
+def forget_group_members(sender, instance, action, reverse, pk_set, using,
+                         **kwargs):
+    """Drop the copies of the members of groups whose permissions changed."""
+    if not reverse:
+        if action.startswith('post_'):
+            forget_users(instance.user_set.values_list('pk', flat=True),
+                         using)
+        return
+    if action in ('post_add', 'post_remove'):
+        groups = pk_set
+    elif action == 'pre_clear':
+        groups = instance.group_set.all()
+    else:
+        return
+    forget_users(User.objects.filter(groups__in=groups)
+                 .values_list('pk', flat=True).distinct(), using)
@@ -1,41 +1,105 @@
 """Views for handling poll-related functionality in the Polls application."""
+import datetime
 from logging import getLogger
 from django.contrib.auth.decorators import login_required
-from django.http import HttpResponseRedirect, Http404
+from django.core.handlers.asgi import ASGIRequest
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import (HttpResponse, HttpResponseBadRequest,
+                         HttpResponseRedirect, Http404, JsonResponse)
 from django.shortcuts import get_object_or_404, render, redirect
 from django.urls import reverse
 from django.views import generic
-from django.utils import timezone
+from django.conf import settings
 from django.contrib import messages
-from .models import Choice, Question, Vote
+from django.db import router
+from django.db.models import Q
+from .audit import audit, get_client_ip
+from .buffer import VoteBufferFull, get_vote_buffer, started_vote_buffer
+from .cache import results_cache
+from .exports import (export_lines, export_options, streaming_response,
+                      vote_rows)
+from .metrics import metrics, render as render_metrics
+from .models import Choice, Question, Vote, VotingClosed
 from django.contrib.auth.signals import user_logged_in, user_logged_out, user_login_failed
 from django.dispatch import receiver
 import logging
 
+
+# The largest value of the BigAutoField primary key of Question.
+MAX_QUESTION_ID = 2 ** 63 - 1
+
+
+def question_cursor(question):
+    """Encode the keyset position of a question for the index page."""
+    return f"{question.pub_date.isoformat()}_{question.pk}"
+
+
+def parse_question_cursor(cursor):
+    """
+    Decode a cursor made by question_cursor().
+
+    Raises:
+        Http404: If the cursor is malformed or its id is out of range for
+            the database.
+    """
+    try:
+        pub_date, pk = cursor.rsplit('_', 1)
+        pub_date, pk = datetime.datetime.fromisoformat(pub_date), int(pk)
+    except ValueError:
+        raise Http404("Invalid page cursor.")
+    if not 0 <= pk <= MAX_QUESTION_ID:
+        raise Http404("Invalid page cursor.")
+    return pub_date, pk
+
+
+def published_questions(cursor=None):
+    """Return published questions, newest first, older than a cursor."""
+    questions = Question.objects.published().order_by('-pub_date', '-id')
+    if cursor:
+        pub_date, pk = parse_question_cursor(cursor)
+        questions = questions.filter(Q(pub_date__lt=pub_date)
+                                     | Q(pub_date=pub_date, pk__lt=pk))
+    return questions
+
+
 class IndexView(generic.ListView):
     """
     Display the list of all published poll questions.
 
+    Questions are paginated by keyset on (-pub_date, -id) rather than by
+    OFFSET, so every page costs the same however many polls exist.
+
     Attributes:
         template_name (str): The template for rendering the view.
         context_object_name (str): The name of the context variable containing the list of questions.
+        page_size (int): The number of questions shown per page.
     """
     template_name = 'polls/index.html'
     context_object_name = 'latest_question_list'
+    page_size = 20
 
     def get_queryset(self):
-        """Return published questions."""
-        published_question_list = [q.pk for q in Question.objects.all()
-                                   if q.is_published()]
-        published_questions = (Question.objects.filter
-                               (pk__in=published_question_list))
-        return published_questions.order_by('-pub_date')
+        """Return published questions older than the requested cursor."""
+        return published_questions(self.request.GET.get('before'))
+
+    def get_context_data(self, **kwargs):
+        """Fetch one page plus one row to know whether a next page exists."""
+        page = list(self.object_list[:self.page_size + 1])
+        context = super().get_context_data(
+            object_list=page[:self.page_size], **kwargs)
+        context['next_cursor'] = (question_cursor(page[self.page_size - 1])
+                                  if len(page) > self.page_size else None)
+        context['is_first_page'] = 'before' not in self.request.GET
+        return context
 
 
 class DetailView(generic.DetailView):
     """
     Display the details of a poll question.
 
+    The question and the user's previous choice are read with one query,
+    and the choices only when their cached fragment has expired.
+
     Attributes:
         model (Question): The model representing the poll question.
         template_name (str): The template for rendering the view.
@@ -47,7 +111,7 @@ class DetailView(generic.DetailView):
         """
         Excludes any questions that aren't published yet.
         """
-        return Question.objects.filter(pub_date__lte=timezone.now())
+        return Question.objects.published()
 
     def get(self, request, *args, **kwargs):
         """
@@ -56,98 +120,251 @@ class DetailView(generic.DetailView):
         the poll question does not exist or voting is not allowed.
         """
         try:
-            question = get_object_or_404(Question, pk=kwargs['pk'])
-        except (Question.DoesNotExist, Http404):
+            question = (Question.objects.with_choice_of(request.user)
+                        .get(pk=kwargs['pk']))
+        except Question.DoesNotExist:
             messages.error(request, f"Poll question {kwargs['pk']}"
                                     f" does not exist.")
             return redirect("polls:index")
 
-        this_user = request.user
-        try:
-            prev_vote = Vote.objects.get(user=this_user,
-                                         choice__question=question)
-        except (Vote.DoesNotExist, TypeError):
-            prev_vote = None
-
         if not question.can_vote():
             messages.error(request, f"Poll question {kwargs['pk']}"
                                     f" does not allow voting.")
             return redirect("polls:index")
         else:
             return render(request, self.template_name,
-                          {"question": question,
-                           "prev_vote": prev_vote})
+                          detail_context(question))
 
 
-def get_client_ip(request):
-    """Get the visitor’s IP address using request headers."""
-    x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-    if x_forwarded_for:
-        ip = x_forwarded_for.split(',')[0]
-    else:
-        ip = request.META.get('REMOTE_ADDR')
-    return ip
+def detail_context(question, **context):
+    """
+    Return the template context of the detail page of a question.
+
+    The choice list is rendered inside a {% cache %} fragment keyed on
+    the question, its results version and the user's choice, so the lazy
+    choices queryset is only evaluated when the fragment is not cached,
+    and changes to other questions leave the fragment alone.
+    """
+    return {
+        'question': question,
+        'choices': question.choice_set.order_by('pk'),
+        'choices_version': results_cache.version(question.pk),
+        'choices_timeout': settings.POLLS_PAGE_CACHE_TIMEOUT,
+        **context,
+    }
 
 
 logger = logging.getLogger('polls')
 
 
 class ResultsView(generic.DetailView):
+    """
+    Display the results of a poll question.
+
+    The tallies come from the versioned results cache; the X-Results-Cache
+    response header tells whether they were a local hit, a shared hit or
+    a miss. Under ASGI the page also follows the live results stream.
+    """
+
     model = Question
     template_name = 'polls/results.html'
 
+    def get_context_data(self, **kwargs):
+        """Add the cached results of the question."""
+        context = super().get_context_data(**kwargs)
+        context['results'], self.cache_source = results_cache.get(
+            self.object.pk)
+        context['live_results'] = isinstance(self.request, ASGIRequest)
+        return context
+
+    def get(self, request, *args, **kwargs):
+        """Render the results and report where the tallies came from."""
+        response = super().get(request, *args, **kwargs)
+        response['X-Results-Cache'] = self.cache_source
+        return response
+
 
 @login_required
 def vote(request, question_id):
-    """Handle voting for a specific question."""
-    question = get_object_or_404(Question, pk=question_id)
+    """
+    Handle voting for a specific question.
+
+    The selected choice is loaded together with its question, then
+    Vote.objects.cast() writes the vote with a single upsert that also
+    checks the question is still open. In buffered write mode the vote
+    is queued for the vote buffer instead, unless the buffer is full.
+    """
     this_user = request.user
     ip_address = get_client_ip(request)
 
     try:
-        selected_choice = question.choice_set.get(pk=request.POST['choice'])
-    except (KeyError, Choice.DoesNotExist):
-        logger.warning(f"{this_user} failed to vote in {question} "
-                       f"from {ip_address}")
-        return render(request, 'polls/detail.html', {
-            'question': question,
-            'error_message': "You didn't select a choice.",
-        })
+        selected_choice = (Choice.objects.select_related('question')
+                           .get(pk=request.POST['choice'],
+                                question_id=question_id))
+    except (KeyError, ValueError, Choice.DoesNotExist):
+        question = get_object_or_404(Question, pk=question_id)
+        audit('vote_rejected', "%s failed to vote in %s from %s",
+              this_user, question, ip_address, level=logging.WARNING,
+              reason='no_choice', user_id=this_user.pk,
+              question_id=question.pk, ip=ip_address)
+        metrics.inc('polls_votes_total', outcome='rejected')
+        return render(request, 'polls/detail.html', detail_context(
+            question, error_message="You didn't select a choice."))
+
+    return record_vote(request, this_user, selected_choice)
+
 
+def record_vote(request, this_user, selected_choice):
+    """
+    Write or queue a vote and redirect to the matching page.
+
+    This is the part of vote() shared with the async view, which calls it
+    in a worker thread because transactions are synchronous only.
+    """
+    question = selected_choice.question
+    question_id = question.id
+    ip_address = get_client_ip(request)
+    queued = False
     try:
-        user_vote = Vote.objects.get(user=this_user, choice__question=question)
-        user_vote.choice = selected_choice
-        user_vote.save()
-        logger.info(f'{this_user} voted for Choice {selected_choice.id} '
-                    f'in Question {question.id} from {ip_address}')
-        messages.success(request, f"Your vote was updated to "
-                                  f"'{selected_choice.choice_text}'")
-    except Vote.DoesNotExist:
-        Vote.objects.create(user=this_user, choice=selected_choice)
-        logger.info(f'{this_user} voted for Choice {selected_choice.id} '
-                    f'in Question {question.id} from {ip_address}')
+        if settings.POLLS_VOTE_WRITE_MODE == 'buffered':
+            queued = get_vote_buffer().submit(this_user, selected_choice)
+        if not queued:
+            previous_choice_id = Vote.objects.cast(this_user,
+                                                   selected_choice)
+    except VotingClosed:
+        audit('vote_rejected', "%s failed to vote in closed %s from %s",
+              this_user, question, ip_address, level=logging.WARNING,
+              reason='closed', user_id=this_user.pk, question_id=question_id,
+              choice_id=selected_choice.pk, ip=ip_address)
+        metrics.inc('polls_votes_total', outcome='rejected')
+        messages.error(request, f"Poll question {question_id}"
+                                f" does not allow voting.")
+        return redirect("polls:index")
+    except VoteBufferFull:
+        audit('vote_rejected', "%s was turned away from %s by a full "
+              "vote buffer", this_user, question, level=logging.WARNING,
+              reason='buffer_full', user_id=this_user.pk,
+              question_id=question_id, choice_id=selected_choice.pk,
+              ip=ip_address)
+        metrics.inc('polls_votes_total', outcome='rejected')
+        messages.error(request, "Too many votes are being cast right now. "
+                                "Please try again.")
+        return redirect("polls:detail", question_id)
+
+    audit('vote', "%s voted for Choice %s in Question %s from %s",
+          this_user, selected_choice.id, question_id, ip_address,
+          user_id=this_user.pk, question_id=question_id,
+          choice_id=selected_choice.pk,
+          previous_choice_id=None if queued else previous_choice_id,
+          queued=queued, ip=ip_address)
+    if queued:
+        messages.success(request, f"Your vote for "
+                                  f"'{selected_choice.choice_text}' "
+                                  f"has been received")
+    elif previous_choice_id is None:
         messages.success(request, f"You voted for "
                                   f"'{selected_choice.choice_text}'")
+    else:
+        messages.success(request, f"Your vote was updated to "
+                                  f"'{selected_choice.choice_text}'")
 
     return HttpResponseRedirect(reverse('polls:results', args=(question_id,)))
 
 
+def results_api(request):
+    """
+    Return the results of several questions as JSON.
+
+    The question ids are given as ?ids=1,2,3, at most POLLS_API_MAX_BATCH
+    of them, and all their tallies are read with one query. Each
+    question maps to its total and a list of [choice id, choice text,
+    votes], empty for a question without choices; ids that are not
+    published questions are listed as missing.
+    """
+    try:
+        question_ids = {int(pk) for pk in
+                        request.GET.get('ids', '').split(',') if pk}
+    except ValueError:
+        return JsonResponse({'error': "ids must be comma-separated "
+                                      "integers."}, status=400)
+    if not question_ids:
+        return JsonResponse({'error': "No question ids given."}, status=400)
+    if len(question_ids) > settings.POLLS_API_MAX_BATCH:
+        return JsonResponse({'error': f"At most "
+                                      f"{settings.POLLS_API_MAX_BATCH} "
+                                      f"questions per request."},
+                            status=400)
+
+    results = {}
+    for question_id, choice_id, choice_text, votes in (
+            Question.objects.tallies_for(question_ids)):
+        result = results.setdefault(str(question_id),
+                                    {'total': 0, 'choices': []})
+        if choice_id is not None:
+            result['total'] += votes
+            result['choices'].append([choice_id, choice_text, votes])
+    missing = sorted(pk for pk in question_ids if str(pk) not in results)
+    return JsonResponse({'results': results, 'missing': missing})
+
+
+@staff_member_required
+def export_votes(request):
+    """
+    Stream the votes as a CSV or JSON Lines download.
+
+    Takes the options of the export_votes command as query parameters:
+    format, question, since and until.
+    """
+    try:
+        fmt, filters = export_options(request.GET)
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+    # The rows are read after the view returns, once the request may no
+    # longer use the replicas, so choose the database now.
+    rows = (vote_rows(**filters).using(router.db_for_read(Vote))
+            .iterator(chunk_size=settings.POLLS_EXPORT_CHUNK_SIZE))
+    return streaming_response(export_lines(rows, fmt), fmt)
+
+
+def prometheus_metrics(request):
+    """Return the metrics of the site in the Prometheus text format."""
+    vote_buffer = started_vote_buffer()
+    gauges = {
+        'polls_results_cache_requests': (
+            "Results cache lookups by source, in this process.",
+            {f'polls_results_cache_requests{{source="{source}"}}': count
+             for source, count in results_cache.stats().items()}),
+        'polls_vote_buffer_depth': (
+            "Votes waiting in this process's write-behind buffer.",
+            {'polls_vote_buffer_depth':
+             len(vote_buffer) if vote_buffer else 0}),
+    }
+    return HttpResponse(render_metrics(metrics, gauges),
+                        content_type='text/plain; version=0.0.4')
+
+
 @receiver(user_logged_in)
 def log_user_login(request, user, **kwargs):
     """Log a message when a user successfully logs in."""
     ip_address = get_client_ip(request)
-    logger.info(f'{user} logged in from {ip_address}')
+    audit('login', "%s logged in from %s", user, ip_address,
+          user_id=user.pk, ip=ip_address)
+    metrics.inc('polls_logins_total', result='success')
 
 
 @receiver(user_logged_out)
 def log_user_logout(request, user, **kwargs):
     """Log a message when a user successfully logs out."""
     ip_address = get_client_ip(request)
-    logger.info(f'{user} logged out from {ip_address}')
+    audit('logout', "%s logged out from %s", user, ip_address,
+          user_id=getattr(user, 'pk', None), ip=ip_address)
 
 
 @receiver(user_login_failed)
-def log_user_login_failed(request, **kwargs):
+def log_user_login_failed(request, credentials, **kwargs):
     """Log a message when a user login attempt fails."""
     ip_address = get_client_ip(request)
-    logger.warning(f'User failed to log in from {ip_address}')
+    audit('login_failed', "User failed to log in from %s", ip_address,
+          level=logging.WARNING, username=credentials.get('username'),
+          ip=ip_address)
+    metrics.inc('polls_logins_total', result='failure')